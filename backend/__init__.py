@@ -1,3 +1,8 @@
+from .memory import configure_cache
+
+# before the solver first imports SymPy
+configure_cache()
+
 from .app import app
 
 __all__ = ('app',)
\ No newline at end of file
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Literal, NamedTuple, Optional, TypeAlias
+from functools import wraps
+import threading
+import asyncio
+import sqlite3
+import time
+import math
+import os
+
+from quart import request
+
+from .models import SolveSchema, BatchSolveSchema, EvaluateSchema, GraphSchema, LibrarySchema, Error
+from .helpers import canonical_key, private_directory
+from .tables import grid_size
+from .libraries import solver_options
+from .solver.cost import estimate_cost
+from .solver.evaluation import MACHINE_DIGITS
+
+__all__ = (
+    'Admission',
+    'TokenBucket',
+    'request_cost',
+    'admission_control',
+)
+
+if TYPE_CHECKING:
+    Decision: TypeAlias = Literal['admit', 'queue', 'reject', 'too_large']
+
+class Admission(NamedTuple):
+    decision: Decision
+    wait: float
+
+class TokenBucket:
+    """A weighted token bucket per client, stored in SQLite
+    so that every hypercorn worker process on the node shares the same limits
+
+    * a request costing more tokens than available is queued if they refill within `max_wait` seconds,
+      and rejected otherwise
+    * a request costing more than `capacity` could never be admitted, and is too large rather than rejected;
+      the capacity is above the largest weight of a single expression (`50.0`)
+    """
+
+    def __init__(
+        self, /,
+        path: Optional[str] = None,
+        *,
+        capacity: float = 60.0,
+        rate: float = 3.0,
+        max_wait: float = 5.0,
+    ) -> None:
+        self.path = path or os.path.join(private_directory(), 'admission.sqlite3')
+        self.capacity = capacity
+        self.rate = rate
+        self.max_wait = max_wait
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @property
+    def connection(self, /) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(
+                self.path,
+                timeout=10.0,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)'
+            )
+        return self._connection
+
+    def acquire(self, key: str, cost: float, /) -> Admission:
+        """Takes `cost` tokens from the bucket of `key`
+
+        * a queued request has already been charged, and must wait for `Admission.wait` seconds
+        """
+        if cost > self.capacity:
+            return Admission('too_large', 0.0)
+        with self._lock:
+            return self._acquire(key, cost)
+
+    def _acquire(self, key: str, cost: float, /) -> Admission:
+        db = self.connection
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            row = db.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens = self.capacity if row is None else min(
+                self.capacity, row[0] + (now - row[1]) * self.rate
+            )
+            if tokens >= cost:
+                admission = Admission('admit', 0.0)
+            elif (wait := (cost - tokens) / self.rate) <= self.max_wait:
+                admission = Admission('queue', wait)
+            else:
+                db.execute('COMMIT')
+                return Admission('reject', wait - self.max_wait)
+
+            db.execute(
+                'INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)',
+                (key, tokens - cost, now),
+            )
+            db.execute('COMMIT')
+            return admission
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+
+def request_cost(data: SolveSchema | BatchSolveSchema | LibrarySchema, /, limit: float = math.inf) -> float:
+    """The estimated cost of a request, summed over the distinct items of a batch
+    and the overlays of a graph, and growing with the points of a table
+    and the definitions of a library
+
+    * the items of a batch stop being estimated once their sum exceeds `limit`
+    """
+    if isinstance(data, LibrarySchema):
+        # every definition is parsed (and stored) like a trivial expression
+        return float(max(len(data.functions), 1))
+    if isinstance(data, BatchSolveSchema):
+        unique = {canonical_key(item): item for item in data.items}
+        cost = 0.0
+        for item in unique.values():
+            if (cost := cost + request_cost(item)) > limit:
+                break
+        return cost
+    try:
+        options = solver_options(data)
+        cost = estimate_cost(data.equation, **options).weight
+        if data.precision is not None and data.precision > MACHINE_DIGITS:
+            # every 1000 digits cost as much as a trivial expression
+            cost += data.precision / 1000
+        if isinstance(data, EvaluateSchema):
+            # every 100k points of a table cost as much as a trivial expression
+            cost += grid_size(data) / 100_000
+        if isinstance(data, GraphSchema):
+            # the figure is shared, but every overlay is parsed and sampled
+            cost += sum(
+                cost if overlay == 'derivative' else estimate_cost(overlay, **options).weight
+                for overlay in data.overlays
+            )
+        return cost
+    except Exception:
+        # invalid input fails fast in the handler itself
+        return 1.0
+
+def admission_control(
+    bucket: TokenBucket, /,
+) -> Callable[[Callable[..., Awaitable[Any]]], Callable[..., Awaitable[Any]]]:
+    """Admits, queues or rejects (429) requests by the estimated cost of their validated `data`,
+    and refuses (413) those costing more than the whole bucket"""
+    def decorator(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        @wraps(func)
+        async def wrapper(*args: Any, data: SolveSchema | BatchSolveSchema | LibrarySchema, **kwargs: Any) -> Any:
+            cost = await asyncio.to_thread(request_cost, data, bucket.capacity)
+            admission = await asyncio.to_thread(bucket.acquire, request.remote_addr or '', cost)
+
+            if admission.decision == 'too_large':
+                return Error(error=f'The request is too expensive ({cost:.0f} of at most {bucket.capacity:.0f} units), split it up'), 413
+            if admission.decision == 'reject':
+                return Error(error='Too many expensive requests, try again later'), 429, {
+                    'Retry-After': str(max(int(admission.wait + 0.5), 1)),
+                }
+            if admission.decision == 'queue':
+                await asyncio.sleep(admission.wait)
+            return await func(*args, data=data, **kwargs)
+        return wrapper
+    return decorator
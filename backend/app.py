@@ -1,13 +1,16 @@
 from __future__ import annotations
 
-from typing import TypeAlias, TYPE_CHECKING
-from datetime import timedelta
+from typing import TypeAlias, TYPE_CHECKING, TypeVar, Callable, Iterator, AsyncIterator
+from dataclasses import asdict
 from io import BytesIO
+import asyncio
+import base64
+import json
+import time
 import os
 
-from quart import Quart, Response, send_file, send_from_directory
+from quart import Quart, Response, request, g, send_file, send_from_directory
 from quart_cors import cors
-from quart_rate_limiter import RateLimiter, rate_limit
 from quart_schema import (
     QuartSchema,
     validate_request,
@@ -17,70 +20,222 @@ from quart_schema import (
 from typing import Optional
 
 from .solver import Solver
-from .solver.exceptions import CantGetProperty
+from .solver.exceptions import SolverException, CantGetProperty, MathTimeout
+from .solver.metrics import metrics
 
 from .models import *
-from .helpers import run_threaded
+from .helpers import run_threaded, stream_threaded, sse_event, canonical_key
+from .jobs import Job, JobQueue, LocalJobQueue
+from .admission import TokenBucket, admission_control
+from .profiling import debuggable, add_debug_headers, current_profile, is_debug_allowed, profile_store
+from .conditional import conditional, compress_response
+from .tables import iter_evaluate
+from .libraries import Library, UnknownLibrary, registry, solver_options, inline_library, require_library
+from .memory import MemoryGuard
+from .coalescing import SingleFlight
 
 if TYPE_CHECKING:
+    from sympy import Expr
+
     T_SolveResponse: TypeAlias = tuple[SolveResponse, int] | tuple[Error, int]
+    R = TypeVar('R')
+
+MAX_BATCH_SIZE = 500
+BATCH_TIMEOUT = 120.0
+# items of a batch solved at once, so that a batch does not take every thread of the process
+BATCH_CONCURRENCY = 4
+EVALUATE_TIMEOUT = 120.0
+# waiting for a solve or graph on the job workers, queued then running for at most their own timeout
+REMOTE_TIMEOUT = 120.0
+
+admission = TokenBucket(os.getenv('SOLVER_ADMISSION_DB'))
+memory_guard = MemoryGuard.from_env()
+single_flight = SingleFlight(os.getenv('SOLVER_SINGLEFLIGHT_DB'))
 
 app = Quart(__name__)
+app.config['SOLVER_PROFILING'] = os.getenv('SOLVER_PROFILING') == '1'
+app.config['SOLVER_DEBUG_TOKEN'] = os.getenv('SOLVER_DEBUG_TOKEN')
 cors(app, allow_origin='*')
-RateLimiter(app)
 QuartSchema(app)
 
+def iter_solve(data: SolveSchema) -> Iterator[tuple[str, str | bool]]:
+    """Yields each field of the `SolveResponse` as soon as it has been computed,
+    cheapest first"""
+    solver = Solver(
+        data.equation,
+        domain=data.domain,
+        solve_for=data.solve_for,
+        **solver_options(data),
+        numeric_budget=data.numeric_budget,
+        precision=data.precision,
+    )
+    yield 'equation', solver.latex('parsed_equation')
+    yield 'evaluated', solver.latex('evaluated_equation')
+    yield 'expanded', solver.latex('expanded')
+    yield 'factored', solver.latex('factored')
+    yield 'derivative', solver.latex('derivative')
+    yield 'simplified_equation', solver.latex('simplify')
+    yield 'simplify_tier', solver.simplified.tier
+
+    yield 'latex_solution', solver.latex('solution')
+    yield 'raw_solution', solver.ascii_parsed_solution(evaluate_bool=True)
+    yield 'parsed_solution', solver.parsed_solution(evaluate_bool=True)
+    yield 'approximate', solver.approximate
+    yield 'note', solver.note
+
+    try:
+        yield 'domain', solver.latex('domain')
+    except CantGetProperty:
+        yield 'domain', r'\emptyset'
+    try:
+        yield 'range', solver.latex('range')
+    except CantGetProperty:
+        yield 'range', r'\emptyset'
+    try:
+        max_min = {k: Solver.to_latex(v) for k, v in solver.max_min.items()}
+    except CantGetProperty:
+        max_min = {}
+    yield 'max', max_min.get('max', r'\infty')
+    yield 'min', max_min.get('min', r'-\infty')
+
 def do_solve(data: SolveSchema) -> T_SolveResponse:
     try:
-        solver = Solver(
-            data.equation,
-            domain=data.domain,
-            solve_for=data.solve_for,
-            functions=data.functions,
-            constants=data.constants,
-        )
-        try:
-            domain = Solver.to_latex(solver.domain)
-        except CantGetProperty:
-            domain = r'\emptyset'
-        try:
-            range = Solver.to_latex(solver.range)
-        except CantGetProperty:
-            range = r'\emptyset'
-        try:
-            max_min = {k: Solver.to_latex(v) for k, v in solver.max_min.items()}
-        except CantGetProperty:
-            max_min = {'max': r'\infty', 'min': r'-\infty'}
-        return SolveResponse(
-            domain=domain,
-            range=range,
-            factored=Solver.to_latex(solver.factored),
-            expanded=Solver.to_latex(solver.expanded),
-            evaluated=Solver.to_latex(solver.evaluated_equation),
-            equation=Solver.to_latex(solver.parsed_equation),
-            derivative=Solver.to_latex(solver.derivative),
-            simplified_equation=Solver.to_latex(solver.simplify()),
-            latex_solution=Solver.to_latex(solver.solution),
-            raw_solution=solver.ascii_parsed_solution(evaluate_bool=True),
-            parsed_solution=solver.parsed_solution(evaluate_bool=True),
-            **max_min,
-        ), 200
+        return SolveResponse(**dict(iter_solve(data))), 200 # type: ignore
     except Exception as e:
         return Error(error=str(e)), 500
 
+MAX_OVERLAYS = 4
+
+def graph_overlays(solver: Solver, data: GraphSchema) -> list[tuple[str, Expr]]:
+    """Parses the overlays of a graph with the functions and constants of the equation"""
+    if len(data.overlays) > MAX_OVERLAYS:
+        raise ValueError(f'At most {MAX_OVERLAYS} overlays can be graphed at once')
+
+    overlays = []
+    for overlay in data.overlays:
+        if overlay == 'derivative':
+            overlays.append((overlay, solver.derivative))
+            continue
+        expr = Solver(
+            overlay,
+            **solver_options(data),
+        ).lhs_equation
+        if expr.free_symbols - solver.lhs_equation.free_symbols: # type: ignore
+            raise ValueError(f'The overlay {overlay!r} has variables that are not in the equation')
+        overlays.append((overlay, expr))
+    return overlays
+
+def render_graph(data: SolveSchema) -> BytesIO:
+    """The PNG graph of the equation, with the overlays of a `GraphSchema`"""
+    solver = Solver(
+        data.equation,
+        domain=data.domain,
+        solve_for=data.solve_for,
+        **solver_options(data),
+    )
+    if isinstance(data, GraphSchema) and data.overlays:
+        return solver.graph(overlays=graph_overlays(solver, data))
+    return solver.graph()
+
 def do_graph(data: SolveSchema) -> BytesIO | tuple[Error, int]:
     try:
-        solver = Solver(
-            data.equation,
-            domain=data.domain,
-            solve_for=data.solve_for,
-            functions=data.functions,
-            constants=data.constants,
-        )
-        return solver.graph()
+        return render_graph(data)
     except Exception as e:
         return Error(error=str(e)), 500
 
+def encode_solve(result: T_SolveResponse, /) -> bytes:
+    response, status = result
+    if isinstance(response, Error):
+        raise SolverException(response.error)
+    return json.dumps(asdict(response)).encode()
+
+def decode_solve(data: bytes, /) -> T_SolveResponse:
+    return SolveResponse(**json.loads(data)), 200
+
+def encode_graph(result: BytesIO | tuple[Error, int], /) -> bytes:
+    if isinstance(result, tuple):
+        raise SolverException(result[0].error)
+    return result.getvalue()
+
+async def execute(func: Callable[[SolveSchema], R], data: SolveSchema, /) -> R:
+    """Runs `do_solve` or `do_graph` on the job workers when a broker is configured,
+    and in a thread of this process otherwise (or when profiling)"""
+    if isinstance(jobs, LocalJobQueue) or current_profile.get() is not None:
+        return await run_threaded(func, data)
+
+    kind = 'graph' if func is do_graph else 'solve'
+    try:
+        job = await jobs.submit(kind, await asyncio.to_thread(inline_library, data))
+        job = await asyncio.wait_for(jobs.wait(job.id), timeout=REMOTE_TIMEOUT)
+    except asyncio.QueueFull as e:
+        raise SolverException('The job queue is full, try again later') from e
+    except asyncio.TimeoutError as e:
+        metrics.inc('solver_timeouts_total', task=func.__name__)
+        raise MathTimeout(REMOTE_TIMEOUT) from e
+
+    if job is None or job.status != 'done':
+        error = Error(error=job.error if job is not None and job.error else 'The job was lost')
+        return (error, 500) # type: ignore
+    if kind == 'graph':
+        return BytesIO(base64.b64decode(job.fields['image'])) # type: ignore
+    return (SolveResponse(**job.fields), 200) # type: ignore
+
+async def run_coalesced(
+    func: Callable[[SolveSchema], R],
+    data: SolveSchema, /,
+    encode: Callable[[R], bytes],
+    decode: Callable[[bytes], R],
+) -> R:
+    """Runs `func` (see `execute`) once for identical concurrent requests to the endpoint,
+    except for profiled requests, which time their own computation
+
+    * errors are raised, with the message of the `Error` response they would have returned
+    """
+    if current_profile.get() is not None:
+        return await execute(func, data)
+    return await single_flight.run(
+        request.path,
+        canonical_key(data),
+        lambda: execute(func, data),
+        encode=encode,
+        decode=decode,
+    )
+
+@app.before_request
+async def start_timer() -> None:
+    g.start = time.perf_counter()
+
+@app.after_request
+async def record_request(response: Response) -> Response:
+    if (start := g.get('start')) is not None and request.url_rule is not None:
+        metrics.observe(
+            'solver_request_seconds',
+            time.perf_counter() - start,
+            endpoint=request.url_rule.rule,
+            status=str(response.status_code),
+        )
+        memory_guard.check()
+        metrics.flush()
+    return await add_debug_headers(response)
+
+app.after_request(compress_response)
+
+@app.route('/metrics')
+async def get_metrics() -> Response:
+    """Stage latencies, errors, timeouts and cache hits of every worker process, for Prometheus"""
+    return Response(
+        await asyncio.to_thread(metrics.render),
+        mimetype='text/plain; version=0.0.4',
+    )
+
+@app.route('/debug/profiles/<profile_id>')
+@validate_response(Error, status_code=404)
+async def get_profile(profile_id: str) -> Response | tuple[Error, int]:
+    """The cProfile summary of a request made with `?debug=profile`, from its `X-Profile-Id` header"""
+    if not is_debug_allowed() or (stats := await asyncio.to_thread(profile_store.get, profile_id)) is None:
+        return Error(error='There is no such profile'), 404
+    return Response(stats, mimetype='text/plain')
+
 @app.route('/')
 async def root() -> dict[str, str]:
     return {
@@ -91,26 +246,267 @@ async def root() -> dict[str, str]:
 @validate_request(SolveSchema)
 @validate_response(SolveResponse, status_code=200)
 @validate_response(Error, status_code=500)
-@rate_limit(3, timedelta(seconds=5))
+@validate_response(Error, status_code=429)
+@validate_response(Error, status_code=413)
+@validate_response(Error, status_code=404)
+@conditional
+@require_library
+@admission_control(admission)
+@debuggable
 async def post_solve(data: SolveSchema) -> T_SolveResponse:
     try:
-        return await run_threaded(do_solve, data)
+        return await run_coalesced(do_solve, data, encode_solve, decode_solve)
     except Exception as e:
         return Error(error=str(e)), 500
 
 @app.route('/graph', methods=['POST'])
-@validate_request(SolveSchema)
+@validate_request(GraphSchema)
 @validate_response(Error, status_code=500)
-@rate_limit(3, timedelta(seconds=5))
-async def post_graph(data: SolveSchema) -> Response | tuple[Error, int]:
+@validate_response(Error, status_code=429)
+@validate_response(Error, status_code=413)
+@validate_response(Error, status_code=404)
+@conditional
+@require_library
+@admission_control(admission)
+@debuggable
+async def post_graph(data: GraphSchema) -> Response | tuple[Error, int]:
     try:
-        result = await run_threaded(do_graph, data)
+        result = await run_coalesced(do_graph, data, encode_graph, BytesIO)
     except Exception as e:
         return Error(error=str(e)), 500
     if isinstance(result, BytesIO):
         result = await send_file(result, mimetype='image/png')
     return result
 
+@app.route('/solve/stream', methods=['POST'])
+@validate_request(SolveSchema)
+@validate_response(Error, status_code=429)
+@validate_response(Error, status_code=413)
+@validate_response(Error, status_code=404)
+@require_library
+@admission_control(admission)
+async def post_solve_stream(data: SolveSchema) -> Response:
+    """Server-Sent Events variant of `/solve`:
+    one event per `SolveResponse` field, followed by a `done` (or `error`) event"""
+    async def events() -> AsyncIterator[bytes]:
+        try:
+            async for field, value in stream_threaded(iter_solve, data):
+                yield sse_event(field, value)
+        except Exception as e:
+            yield sse_event('error', str(e))
+        else:
+            yield sse_event('done', None)
+
+    response = Response(events(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.timeout = None
+    return response
+
+@app.route('/solve/batch', methods=['POST'])
+@validate_request(BatchSolveSchema)
+@validate_response(Error, status_code=400)
+@validate_response(Error, status_code=429)
+@validate_response(Error, status_code=413)
+@validate_response(Error, status_code=404)
+@require_library
+@admission_control(admission)
+async def post_solve_batch(data: BatchSolveSchema) -> Response | tuple[Error, int]:
+    """Solves every item of the batch, returning one JSON line per item in order:
+    `{"index": ..., "status": ..., "result": ...}`
+
+    * the batch is charged the summed cost of its distinct items, so a batch costing more than
+      the admission bucket holds is refused (413) whatever its size
+    * identical items are only solved once, `BATCH_CONCURRENCY` at a time
+    * the timeout applies to the batch as a whole: the items left once it passes fail right away
+    """
+    if len(data.items) > MAX_BATCH_SIZE:
+        return Error(error=f'Batch of {len(data.items)} items exceeds the maximum batch size of {MAX_BATCH_SIZE}'), 400
+
+    deadline = time.monotonic() + BATCH_TIMEOUT
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def solve(item: SolveSchema) -> T_SolveResponse:
+        async with semaphore:
+            if (remaining := deadline - time.monotonic()) <= 0:
+                raise MathTimeout(BATCH_TIMEOUT)
+            try:
+                return await run_threaded(do_solve, item, timeout=remaining)
+            except MathTimeout:
+                raise MathTimeout(BATCH_TIMEOUT) from None
+
+    tasks: dict[str, asyncio.Future[T_SolveResponse]] = {}
+    keys: list[str] = []
+    for item in data.items:
+        if (key := canonical_key(item)) not in tasks:
+            tasks[key] = asyncio.ensure_future(solve(item))
+        keys.append(key)
+
+    async def lines() -> AsyncIterator[bytes]:
+        try:
+            for index, key in enumerate(keys):
+                try:
+                    result, status = await tasks[key]
+                except Exception as e:
+                    result, status = Error(error=str(e)), 500
+                yield json.dumps({
+                    'index': index,
+                    'status': status,
+                    'result': asdict(result),
+                }, ensure_ascii=False).encode() + b'\n'
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+    response = Response(lines(), mimetype='application/x-ndjson')
+    response.timeout = None
+    return response
+
+@app.route('/evaluate', methods=['POST'])
+@validate_request(EvaluateSchema)
+@validate_response(Error, status_code=400)
+@validate_response(Error, status_code=500)
+@validate_response(Error, status_code=429)
+@validate_response(Error, status_code=413)
+@validate_response(Error, status_code=404)
+@require_library
+@admission_control(admission)
+async def post_evaluate(data: EvaluateSchema) -> Response | tuple[Error, int]:
+    """Evaluates the function over a grid of one or two variables, streamed in chunks
+
+    * `ndjson`: a `{"variables": ..., "shape": ...}` line,
+      then lines of `{<variable>: [...], "values": [...]}`, or an `{"error": ...}` line
+    * `float64`: the raw little-endian values, with the grid in the `X-Grid-Variables` and `X-Grid-Shape` headers
+    """
+    chunks = stream_threaded(iter_evaluate, data, timeout=EVALUATE_TIMEOUT)
+    try:
+        header = await anext(chunks)
+    except UnknownLibrary as e:
+        return Error(error=str(e)), 404
+    except (SolverException, ValueError, SyntaxError) as e:
+        return Error(error=str(e)), 400
+    except Exception as e:
+        # like `do_solve`, ex. a `TypeError` of the compiled function
+        return Error(error=str(e)), 500
+    assert isinstance(header, dict)
+
+    async def body() -> AsyncIterator[bytes]:
+        if data.format == 'ndjson':
+            yield json.dumps(header).encode() + b'\n'
+        try:
+            async for chunk in chunks:
+                yield chunk # type: ignore
+        except Exception as e:
+            # a truncated float64 body is shorter than its shape
+            if data.format == 'ndjson':
+                yield json.dumps({'error': str(e)}).encode() + b'\n'
+
+    if data.format == 'float64':
+        response = Response(body(), mimetype='application/octet-stream')
+        response.headers['X-Grid-Variables'] = ','.join(header['variables'])
+        response.headers['X-Grid-Shape'] = ','.join(map(str, header['shape']))
+    else:
+        response = Response(body(), mimetype='application/x-ndjson')
+    response.timeout = None
+    return response
+
+def iter_graph(data: SolveSchema) -> Iterator[tuple[str, str]]:
+    """Yields the base64 encoded PNG graph"""
+    yield 'image', base64.b64encode(render_graph(data).getvalue()).decode()
+
+JOB_HANDLERS = {
+    'solve': iter_solve,
+    'graph': iter_graph,
+}
+
+def create_job_queue() -> JobQueue:
+    """Jobs are executed by `python -m backend.worker` processes when a broker is configured,
+    and by local worker tasks otherwise"""
+    if broker := os.getenv('SOLVER_BROKER_URL'):
+        from .broker import BrokerJobQueue
+        return BrokerJobQueue.from_url(broker)
+    return LocalJobQueue(JOB_HANDLERS)
+
+jobs = create_job_queue()
+
+def job_response(job: Job) -> JobResponse:
+    return JobResponse(
+        id=job.id,
+        status=job.status,
+        fields=job.fields,
+        result=SolveResponse(**job.fields) if job.kind == 'solve' and job.status == 'done' else None,
+        error=job.error,
+    )
+
+def library_response(library: Library) -> LibraryResponse:
+    return LibraryResponse(id=library.id, functions=list(library.functions), constants=list(library.constants))
+
+@app.route('/libraries', methods=['POST'])
+@validate_request(LibrarySchema)
+@validate_response(LibraryResponse, status_code=201)
+@validate_response(Error, status_code=400)
+@validate_response(Error, status_code=429)
+@validate_response(Error, status_code=413)
+@admission_control(admission)
+async def post_library(data: LibrarySchema) -> tuple[LibraryResponse, int] | tuple[Error, int]:
+    """Registers function definitions and constants once, to be referenced by `library` in requests
+
+    * registering the same library again returns the same id
+    """
+    try:
+        library = await asyncio.wait_for(
+            asyncio.to_thread(registry.register, data.functions, data.constants),
+            timeout=30.0,
+        )
+    except asyncio.TimeoutError:
+        return Error(error='The library took too long to parse'), 400
+    except Exception as e:
+        return Error(error=str(e)), 400
+    return library_response(library), 201
+
+@app.route('/libraries/<library_id>')
+@validate_response(LibraryResponse, status_code=200)
+@validate_response(Error, status_code=404)
+async def get_library(library_id: str) -> tuple[LibraryResponse, int] | tuple[Error, int]:
+    try:
+        library = await asyncio.to_thread(registry.get, library_id)
+    except UnknownLibrary as e:
+        return Error(error=str(e)), 404
+    return library_response(library), 200
+
+@app.route('/jobs', methods=['POST'])
+@validate_request(SolveSchema)
+@validate_response(JobResponse, status_code=202)
+@validate_response(Error, status_code=400)
+@validate_response(Error, status_code=503)
+@validate_response(Error, status_code=429)
+@validate_response(Error, status_code=413)
+@validate_response(Error, status_code=404)
+@require_library
+@admission_control(admission)
+async def post_job(data: SolveSchema) -> tuple[JobResponse, int] | tuple[Error, int]:
+    """Enqueues a solve (or a graph with `?kind=graph`), to be polled for with `GET /jobs/<id>`"""
+    if (kind := request.args.get('kind', 'solve')) not in JOB_HANDLERS:
+        return Error(error=f'Unknown job kind: {kind!r}'), 400
+    if not isinstance(jobs, LocalJobQueue):
+        data = await asyncio.to_thread(inline_library, data)
+    try:
+        job = await jobs.submit(kind, data)
+    except asyncio.QueueFull:
+        return Error(error='The job queue is full, try again later'), 503
+    return job_response(job), 202
+
+@app.route('/jobs/<job_id>')
+@validate_response(JobResponse, status_code=200)
+@validate_response(Error, status_code=404)
+async def get_job(job_id: str) -> tuple[JobResponse, int] | tuple[Error, int]:
+    if (job := await jobs.get(job_id)) is None:
+        return Error(error=f'No job with the id {job_id!r} (finished jobs expire)'), 404
+    return job_response(job), 200
+
+@app.after_serving
+async def close_jobs() -> None:
+    await jobs.close()
+
 def run(debug: bool = False, port: Optional[int] = None) -> None:
     if not port:
         port = int(os.getenv('PORT', default=5000))
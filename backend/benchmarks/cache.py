@@ -0,0 +1,124 @@
+"""Measures the latency and memory of a long-lived worker replaying the benchmark corpus,
+for several SymPy cache sizes and release policies
+
+Run from the `backend` directory::
+
+    python -m benchmarks.cache                                  # cache sizes 100, 500 and 1000
+    python -m benchmarks.cache --sizes 500 None --rounds 5      # `None` is unbounded
+    python -m benchmarks.cache --rss-limit 150 --policy clear
+
+Each configuration runs in a fresh process, as SymPy reads its cache size on import.
+"""
+from __future__ import annotations
+
+from typing import Any, Optional
+import statistics
+import subprocess
+import argparse
+import warnings
+import json
+import time
+import sys
+import os
+
+__all__ = (
+    'run_worker',
+    'measure',
+)
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+CORPUS = os.path.join(DIRECTORY, 'corpus.json')
+# the repository root, from which the `backend` package is importable
+ROOT = os.path.dirname(os.path.dirname(DIRECTORY))
+
+def run_worker(rounds: int, rss_limit: Optional[float], policy: str, /) -> dict[str, Any]:
+    """Replays every case of the corpus `rounds` times through the `/solve` pipeline in this process,
+    checking the memory between requests as the server does"""
+    from backend.app import iter_solve
+    from backend.models import SolveSchema
+    from backend.memory import MemoryGuard, cache_stats, process_rss
+
+    with open(CORPUS) as f:
+        cases = [case for cases in json.load(f).values() for case in cases]
+    guard = MemoryGuard(
+        int(rss_limit * 2 ** 20) if rss_limit is not None else None,
+        policy=policy, # type: ignore
+        interval=0.0,
+    )
+    releases = 0
+    latencies: list[list[float]] = []
+    rss: list[int] = []
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for _ in range(rounds):
+            latencies.append([])
+            for case in cases:
+                start = time.perf_counter()
+                try:
+                    for _ in iter_solve(SolveSchema(**case)):
+                        pass
+                except Exception:
+                    pass
+                latencies[-1].append(time.perf_counter() - start)
+
+                entries = cache_stats().entries
+                guard.check()
+                releases += cache_stats().entries < entries
+            rss.append(process_rss())
+
+    # the first round warms up the imports and caches of a fresh worker
+    warm = [seconds for round_ in latencies[1:] or latencies for seconds in round_]
+    return {
+        'cache_size': os.getenv('SYMPY_CACHE_SIZE'),
+        'first_round': sum(latencies[0]),
+        'warm_mean': statistics.mean(warm),
+        'warm_p95': sorted(warm)[max(round(len(warm) * 0.95) - 1, 0)],
+        'rss': rss,
+        'cache_entries': cache_stats().entries,
+        'releases': releases,
+    }
+
+def measure(size: str, rounds: int, rss_limit: Optional[float], policy: str, /) -> dict[str, Any]:
+    """Runs `run_worker` in a fresh process with a cache size of `size`"""
+    command = [
+        sys.executable, '-m', 'backend.benchmarks.cache', '--worker',
+        '--rounds', str(rounds), '--policy', policy,
+    ]
+    if rss_limit is not None:
+        command += ['--rss-limit', str(rss_limit)]
+    output = subprocess.run(
+        command,
+        cwd=ROOT,
+        env={**os.environ, 'SYMPY_CACHE_SIZE': size},
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', nargs='+', default=['100', '500', '1000'], help='SymPy cache sizes per function')
+    parser.add_argument('--rounds', type=int, default=3, help='how many times to replay the corpus')
+    parser.add_argument('--rss-limit', type=float, help='release the cache above this RSS, in MiB')
+    parser.add_argument('--policy', choices=('trim', 'clear'), default='trim')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.rounds, args.rss_limit, args.policy)))
+        return 0
+
+    print(f"{'size':>6}{'first':>10}{'warm mean':>12}{'warm p95':>11}{'rss':>10}{'entries':>9}{'releases':>10}")
+    for size in args.sizes:
+        result = measure(size, args.rounds, args.rss_limit, args.policy)
+        print(
+            f"{size:>6}{result['first_round']:>9.2f}s{result['warm_mean'] * 1000:>10.1f}ms"
+            f"{result['warm_p95'] * 1000:>9.1f}ms{result['rss'][-1] / 2 ** 20:>7.0f}MiB"
+            f"{result['cache_entries']:>9}{result['releases']:>10}"
+        )
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
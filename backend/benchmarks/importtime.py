@@ -0,0 +1,105 @@
+"""Measures the cold import time of the solver and the server with `python -X importtime`
+
+Run from the `backend` directory::
+
+    python -m benchmarks.importtime           # report against the baseline
+    python -m benchmarks.importtime --check   # exit with 1 on a regression
+    python -m benchmarks.importtime --update  # record a new baseline
+"""
+from __future__ import annotations
+
+from typing import NamedTuple
+import subprocess
+import argparse
+import json
+import sys
+import os
+
+__all__ = (
+    'ImportTime',
+    'import_time',
+)
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'importtime.json')
+
+# module to import, and the directory to import it from
+TARGETS = {
+    'solver': BACKEND,
+    'backend': os.path.dirname(BACKEND),
+}
+# must only be imported on first use
+LAZY_MODULES = ('matplotlib', 'numpy')
+
+class ImportTime(NamedTuple):
+    total: float
+    modules: dict[str, float]
+
+def import_time(module: str, cwd: str, /) -> ImportTime:
+    """Imports `module` in a fresh interpreter, returning the cumulative seconds of every module it imported"""
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.removeprefix('import time:').split('|')
+        modules[name.strip()] = int(cumulative) / 1e6
+    return ImportTime(modules[module], modules)
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='the best of how many imports')
+    parser.add_argument('--check', action='store_true', help='fail on a regression')
+    parser.add_argument('--update', action='store_true', help='record the results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='the allowed relative slowdown')
+    args = parser.parse_args()
+
+    try:
+        with open(BASELINE) as f:
+            baseline: dict[str, float] = json.load(f)
+    except FileNotFoundError:
+        baseline = {}
+
+    failed = False
+    results = {}
+    for module, cwd in TARGETS.items():
+        runs = [import_time(module, cwd) for _ in range(args.runs)]
+        best = min(runs, key=lambda run: run.total)
+        results[module] = round(best.total, 3)
+
+        status = ''
+        if (expected := baseline.get(module)) is not None:
+            status = f'(baseline {expected:.3f}s)'
+            if best.total > expected * (1 + args.tolerance):
+                status += ' REGRESSED'
+                failed = True
+        if eager := [m for m in LAZY_MODULES if m in best.modules]:
+            status += f' EAGERLY IMPORTS {", ".join(eager)}'
+            failed = True
+        print(f'{module:<10} {best.total:.3f}s {status}')
+
+        slowest = sorted(
+            (
+                (name, seconds) for name, seconds in best.modules.items()
+                if '.' not in name and name != module
+            ),
+            key=lambda item: item[1],
+            reverse=True,
+        )
+        for name, seconds in slowest[:5]:
+            print(f'    {name:<20} {seconds:.3f}s')
+
+    if args.update:
+        with open(BASELINE, 'w') as f:
+            json.dump(results, f, indent=4)
+            f.write('\n')
+    return int(args.check and failed)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,203 @@
+"""Times every stage of the solver over a curated corpus, per category, against a tracked baseline
+
+Run from the `backend` directory::
+
+    python -m benchmarks.stages                     # report against the baseline
+    python -m benchmarks.stages --check             # exit with 1 on a regression
+    python -m benchmarks.stages --update            # record a new baseline
+    python -m benchmarks.stages --category trig --skip graph
+"""
+from __future__ import annotations
+
+from typing import Any, Callable, Iterable
+import statistics
+import argparse
+import inspect
+import warnings
+import json
+import time
+import sys
+import os
+
+from sympy.core.cache import clear_cache
+
+from solver import Solver, Parser
+
+__all__ = (
+    'STAGES',
+    'time_case',
+    'run_benchmarks',
+    'compare',
+)
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+CORPUS = os.path.join(DIRECTORY, 'corpus.json')
+BASELINE = os.path.join(DIRECTORY, 'baseline.json')
+
+# the solver properties in the order `/solve` computes them, each timed on its own
+PROPERTIES = (
+    'parsed_equation',
+    'evaluated_equation',
+    'expanded',
+    'factored',
+    'derivative',
+    'simplify',
+    'solution',
+    'rendered_solution',
+    'domain',
+    'range',
+    'max_min',
+)
+STAGES = ('parse', 'init', *PROPERTIES, 'latex', 'graph')
+
+def _timed(func: Callable[[], Any], /) -> float:
+    """The seconds `func` took, whether or not it raised
+
+    * a stage that cannot be computed for an input (ex. the range of an inequality) is as fast to reject
+      as it was before, or has regressed
+    """
+    start = time.perf_counter()
+    try:
+        func()
+    except Exception:
+        pass
+    return time.perf_counter() - start
+
+def _property(solver: Solver, name: str, /) -> Callable[[], Any]:
+    def get() -> Any:
+        value = getattr(solver, name)
+        return value() if inspect.ismethod(value) else value
+    return get
+
+def time_case(case: dict[str, Any], /, *, skip: Iterable[str] = ()) -> dict[str, float]:
+    """The seconds spent in each stage for a single `SolveSchema` payload, starting from cold SymPy caches"""
+    case = dict(case)
+    equation = case.pop('equation')
+    timings: dict[str, float] = {}
+    clear_cache()
+
+    def parse() -> None:
+        functions, _ = Parser.parse_functions(
+            case.get('functions') or (), constants=case.get('constants'),
+        )
+        Parser(functions=functions, constants=case.get('constants')).parse(equation)
+    timings['parse'] = _timed(parse)
+
+    solver: Solver | None = None
+    def init() -> None:
+        nonlocal solver
+        solver = Solver(equation, **case)
+    timings['init'] = _timed(init)
+    if solver is None:
+        return timings
+
+    for name in PROPERTIES:
+        timings[name] = _timed(_property(solver, name))
+
+    def latex() -> None:
+        for name in PROPERTIES[:-1]:
+            try:
+                solver.latex(name)
+            except Exception:
+                pass
+    timings['latex'] = _timed(latex)
+
+    if 'graph' not in skip:
+        # a fresh solver, as `/graph` does not share the work of `/solve`
+        clear_cache()
+        timings['graph'] = _timed(lambda: Solver(equation, **case).graph())
+    return {stage: seconds for stage, seconds in timings.items() if stage not in skip}
+
+def run_benchmarks(
+    corpus: dict[str, list[dict[str, Any]]], /,
+    *,
+    runs: int = 3,
+    skip: Iterable[str] = (),
+) -> dict[str, dict[str, float]]:
+    """The median seconds of every stage, summed over the cases of each category
+
+    * the first case of every category is run once untimed, so that one time costs (ex. building
+      the parser tables, or SymPy importing the modules of sums) are not counted against whichever
+      case comes first, which the median hides only with several runs
+    """
+    results: dict[str, dict[str, float]] = {}
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+
+        for cases in corpus.values():
+            if cases:
+                time_case(cases[0], skip=skip)
+        for category, cases in corpus.items():
+            totals: dict[str, float] = {}
+            for case in cases:
+                samples = [time_case(case, skip=skip) for _ in range(runs)]
+                for stage in samples[0]:
+                    totals[stage] = totals.get(stage, 0.0) + statistics.median(s[stage] for s in samples)
+            results[category] = {stage: round(seconds, 5) for stage, seconds in totals.items()}
+    return results
+
+def compare(
+    results: dict[str, dict[str, float]],
+    baseline: dict[str, dict[str, float]], /,
+    *,
+    threshold: float,
+    min_delta: float,
+) -> list[tuple[str, str, float, float]]:
+    """The `(category, stage, seconds, baseline seconds)` of the stages slower than the baseline
+    by more than `threshold` (relative) and `min_delta` (seconds)"""
+    regressions = []
+    for category, stages in results.items():
+        for stage, seconds in stages.items():
+            if (expected := baseline.get(category, {}).get(stage)) is None:
+                continue
+            if seconds > expected * (1 + threshold) and seconds - expected > min_delta:
+                regressions.append((category, stage, seconds, expected))
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=3, help='the median of how many runs per case')
+    parser.add_argument('--category', action='append', help='only run these categories')
+    parser.add_argument('--skip', action='append', default=[], choices=STAGES, help='do not time these stages')
+    parser.add_argument('--check', action='store_true', help='fail on a regression')
+    parser.add_argument('--update', action='store_true', help='record the results as the baseline')
+    parser.add_argument('--threshold', type=float, help='the allowed relative slowdown of a stage')
+    parser.add_argument('--min-delta', type=float, help='the slowdown in seconds below which a stage is noise')
+    args = parser.parse_args()
+
+    with open(CORPUS) as f:
+        corpus: dict[str, list[dict[str, Any]]] = json.load(f)
+    if args.category:
+        corpus = {k: v for k, v in corpus.items() if k in args.category}
+    try:
+        with open(BASELINE) as f:
+            baseline: dict[str, Any] = json.load(f)
+    except FileNotFoundError:
+        baseline = {'threshold': 0.5, 'min_delta': 0.025, 'stages': {}}
+    threshold = args.threshold if args.threshold is not None else baseline['threshold']
+    min_delta = args.min_delta if args.min_delta is not None else baseline['min_delta']
+
+    results = run_benchmarks(corpus, runs=args.runs, skip=args.skip)
+    regressions = compare(results, baseline['stages'], threshold=threshold, min_delta=min_delta)
+    regressed = {(category, stage) for category, stage, *_ in regressions}
+
+    for category, stages in results.items():
+        expected = baseline['stages'].get(category, {})
+        print(f'{category} ({sum(stages.values()):.3f}s)')
+        for stage, seconds in stages.items():
+            line = f'    {stage:<20} {seconds * 1000:>9.1f}ms'
+            if (before := expected.get(stage)) is not None:
+                line += f' {before * 1000:>9.1f}ms baseline'
+            if (category, stage) in regressed:
+                line += ' REGRESSED'
+            print(line)
+
+    if args.update:
+        baseline['stages'].update(results)
+        with open(BASELINE, 'w') as f:
+            json.dump(baseline, f, indent=4)
+            f.write('\n')
+    return int(args.check and bool(regressions))
+
+if __name__ == '__main__':
+    sys.exit(main())
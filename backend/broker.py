@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+from typing import Any, Optional
+from dataclasses import asdict
+import ipaddress
+import asyncio
+import hmac
+import json
+import os
+
+from .models import SolveSchema
+from .jobs import Job, JobQueue, LocalJobQueue, job_schema
+
+__all__ = (
+    'BrokerServer',
+    'BrokerJobQueue',
+)
+
+# graph results are sent inline as base64 PNGs
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+# how long a worker has to acknowledge a job sent to it, before it is queued again
+ACK_TIMEOUT = 10.0
+ACK = b'{"ack": true}\n'
+
+def _is_loopback(host: str, /) -> bool:
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return host == 'localhost'
+
+class BrokerServer:
+    """Serves a `LocalJobQueue` (without local workers) over TCP,
+    so that the HTTP processes and the worker processes can live on different nodes
+
+    * the protocol is one JSON request line, answered by one JSON response line, per connection;
+      a fetched job is then acknowledged by the worker, or queued again
+    * with a `token`, requests must carry it (see `SOLVER_BROKER_TOKEN`)
+    * a running job that its worker does not update for `lease` seconds is queued again,
+      and fails after `max_attempts` attempts
+    """
+
+    def __init__(
+        self, /,
+        host: str = '127.0.0.1',
+        port: int = 0,
+        *,
+        maxsize: int = 256,
+        ttl: float = 600.0,
+        token: Optional[str] = None,
+        lease: float = 120.0,
+        max_attempts: int = 2,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.token = token
+        self.queue = LocalJobQueue(maxsize=maxsize, ttl=ttl, lease=lease, max_attempts=max_attempts)
+        self._server: Optional[asyncio.Server] = None
+        self._expiry: Optional[asyncio.Task[None]] = None
+
+    async def start(self, /) -> None:
+        self._server = await asyncio.start_server(
+            self._handle, self.host, self.port, limit=MAX_MESSAGE_SIZE,
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._expiry = asyncio.create_task(self._expire())
+
+    async def _expire(self, /) -> None:
+        """Expires the leases even when nobody polls the jobs, for the requests waiting on them"""
+        while True:
+            await asyncio.sleep(self.queue.lease / 4) # type: ignore
+            self.queue.expire()
+
+    async def serve_forever(self, /) -> None:
+        if self._server is None:
+            await self.start()
+        assert self._server is not None
+        await self._server.serve_forever()
+
+    async def close(self, /) -> None:
+        if self._expiry is not None:
+            self._expiry.cancel()
+            self._expiry = None
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _dispatch(self, request: dict[str, Any], /) -> dict[str, Any]:
+        match request['op']:
+            case 'submit':
+                try:
+                    job = await self.queue.submit(request['kind'], job_schema(request['kind'], request['data']))
+                except asyncio.QueueFull:
+                    return {'full': True}
+                return {'job': job.to_dict()}
+            case 'get':
+                job = await self.queue.get(request['id'])
+                return {'job': job and job.to_dict()}
+            case 'wait':
+                job = await self.queue.wait(request['id'])
+                return {'job': job and job.to_dict()}
+            case 'update':
+                await self.queue.update(request['id'], request['fields'])
+            case 'finish':
+                await self.queue.finish(request['id'], error=request.get('error'))
+            case op:
+                return {'error': f'Unknown operation: {op!r}'}
+        return {}
+
+    async def _fetch(self, reader: asyncio.StreamReader, /) -> Optional[dict[str, Any]]:
+        """Waits for the next job, or returns `None` if the worker disconnects first,
+        ex. a worker stopping to be recycled"""
+        fetch = asyncio.ensure_future(self.queue.fetch())
+        # the worker sends nothing else, so this only completes on disconnection
+        closed = asyncio.ensure_future(reader.read(1))
+        done, _ = await asyncio.wait((fetch, closed), return_when=asyncio.FIRST_COMPLETED)
+        if fetch in done:
+            closed.cancel()
+            return {'job': fetch.result().to_dict()}
+        fetch.cancel()
+        if not closed.cancelled():
+            # a reset connection is a disconnection too
+            closed.exception()
+        return None
+
+    def _authorized(self, request: dict[str, Any], /) -> bool:
+        if self.token is None:
+            return True
+        token = request.get('token')
+        return isinstance(token, str) and hmac.compare_digest(token.encode(), self.token.encode())
+
+    async def _respond(self, request: Any, reader: asyncio.StreamReader, /) -> Optional[dict[str, Any]]:
+        """The response to `request`, or `None` if a worker disconnected while waiting for a job"""
+        if not isinstance(request, dict):
+            return {'error': 'Malformed request: not a JSON object'}
+        if not self._authorized(request):
+            return {'error': 'Unauthorized'}
+        if request.get('op') == 'fetch':
+            return await self._fetch(reader)
+        try:
+            return await self._dispatch(request)
+        except (KeyError, TypeError, ValueError) as e:
+            return {'error': f'Malformed request: {e!r}'}
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, /) -> None:
+        fetched = None
+        try:
+            try:
+                request = json.loads(await reader.readline())
+            except ValueError:
+                request = None
+            if (response := await self._respond(request, reader)) is None:
+                return
+            if 'job' in response and request.get('op') == 'fetch': # type: ignore
+                fetched = response['job']['id']
+            writer.write(json.dumps(response).encode() + b'\n')
+            await writer.drain()
+            # a worker stopped (or dead) before taking its job up never acknowledges it
+            if fetched is not None and await asyncio.wait_for(reader.readline(), ACK_TIMEOUT) == ACK:
+                fetched = None
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+        finally:
+            if fetched is not None:
+                self.queue.requeue(fetched)
+            writer.close()
+
+class BrokerJobQueue(JobQueue):
+    """A `JobQueue` backed by a remote `BrokerServer`"""
+
+    def __init__(self, /, host: str, port: int, *, token: Optional[str] = None) -> None:
+        self.host = host
+        self.port = port
+        self.token = token
+
+    @classmethod
+    def from_url(cls, url: str, /) -> BrokerJobQueue:
+        """Parses a `host:port` broker address, authenticating with `SOLVER_BROKER_TOKEN`"""
+        host, _, port = url.removeprefix('tcp://').rpartition(':')
+        return cls(host or '127.0.0.1', int(port), token=os.getenv('SOLVER_BROKER_TOKEN'))
+
+    async def _request(self, op: str, /, **payload: Any) -> dict[str, Any]:
+        reader, writer = await asyncio.open_connection(
+            self.host, self.port, limit=MAX_MESSAGE_SIZE,
+        )
+        if self.token is not None:
+            payload['token'] = self.token
+        try:
+            writer.write(json.dumps({'op': op, **payload}).encode() + b'\n')
+            await writer.drain()
+            response = json.loads(await reader.readline())
+            if op == 'fetch' and 'job' in response:
+                # without awaiting, so that a worker cancelled from here on still returns the job
+                writer.write(ACK)
+        finally:
+            writer.close()
+        if error := response.get('error'):
+            raise ValueError(error)
+        return response
+
+    async def submit(self, kind: str, data: SolveSchema, /) -> Job:
+        response = await self._request('submit', kind=kind, data=asdict(data))
+        if response.get('full'):
+            raise asyncio.QueueFull
+        return Job.from_dict(response['job'])
+
+    async def get(self, job_id: str, /) -> Optional[Job]:
+        response = await self._request('get', id=job_id)
+        return Job.from_dict(job) if (job := response['job']) else None
+
+    async def wait(self, job_id: str, /, *, interval: float = 0.05) -> Optional[Job]:
+        response = await self._request('wait', id=job_id)
+        return Job.from_dict(job) if (job := response['job']) else None
+
+    async def fetch(self, /) -> Job:
+        return Job.from_dict((await self._request('fetch'))['job'])
+
+    async def update(self, job_id: str, fields: dict[str, Any], /) -> None:
+        await self._request('update', id=job_id, fields=fields)
+
+    async def finish(self, job_id: str, /, *, error: Optional[str] = None) -> None:
+        await self._request('finish', id=job_id, error=error)
+
+async def main(host: str, port: int, token: Optional[str]) -> None:
+    server = BrokerServer(host, port, token=token)
+    await server.start()
+    print(f'Job broker listening on {server.host}:{server.port}')
+    await server.serve_forever()
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Runs the solver job broker')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5100)
+    args = parser.parse_args()
+    token = os.getenv('SOLVER_BROKER_TOKEN') or None
+    if token is None and not _is_loopback(args.host):
+        parser.error(f'set SOLVER_BROKER_TOKEN to listen on {args.host}, which is not a loopback address')
+    asyncio.run(main(args.host, args.port, token))
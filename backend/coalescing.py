@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, NamedTuple, Optional, TypeVar
+import threading
+import asyncio
+import sqlite3
+import time
+import os
+
+from .helpers import private_directory
+from .solver.exceptions import SolverException
+from .solver.metrics import metrics, is_alive
+
+if TYPE_CHECKING:
+    R = TypeVar('R')
+
+__all__ = (
+    'Outcome',
+    'SingleFlight',
+)
+
+metrics.ratio('coalescing_ratio', 'coalesced_requests_total', 'coalescible_requests_total')
+
+class Outcome(NamedTuple):
+    """The encoded result or the error message of a computation, so every caller decodes its own copy"""
+    result: Optional[bytes] = None
+    error: Optional[str] = None
+
+    def value(self, decode: Callable[[bytes], R], /) -> R:
+        if self.error is not None:
+            raise SolverException(self.error)
+        return decode(self.result) # type: ignore
+
+class _Flight(NamedTuple):
+    owner: int
+    expires: float
+    finished: Optional[float]
+    outcome: Outcome
+
+class SingleFlight:
+    """Computes identical concurrent requests once, stored in SQLite
+    so that every hypercorn worker process on the node shares the computations
+
+    * the first request computes and the duplicates wait for its result (or error),
+      the ones in the same process on a shared task and the others by polling
+    * a finished result is kept for `linger` seconds, for the duplicates still polling
+    * a computation whose process died, or that is still running after `timeout` seconds, is taken over
+    * results are stored encoded by the caller (ex. as JSON), never pickled
+    """
+
+    def __init__(
+        self, /,
+        path: Optional[str] = None,
+        *,
+        poll_interval: float = 0.05,
+        linger: float = 1.0,
+        timeout: float = 120.0,
+    ) -> None:
+        self.path = path or os.path.join(private_directory(), 'flights.sqlite3')
+        self.poll_interval = poll_interval
+        self.linger = linger
+        self.timeout = timeout
+        self._flights: dict[str, asyncio.Future[Outcome]] = {}
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._purged_at = 0.0
+
+    @property
+    def connection(self, /) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(
+                self.path,
+                timeout=10.0,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            # the duplicates poll while the flights are written, and flights need not survive a crash
+            self._connection.execute('PRAGMA journal_mode = WAL')
+            self._connection.execute('PRAGMA synchronous = OFF')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS flights ('
+                'key TEXT PRIMARY KEY, owner INTEGER, expires REAL, finished REAL, result BLOB, error TEXT)'
+            )
+        return self._connection
+
+    def _lookup(self, key: str, /) -> Optional[_Flight]:
+        """The flight of `key` that is running or lingering, if any"""
+        with self._lock:
+            row = self.connection.execute(
+                'SELECT owner, expires, finished, result, error FROM flights WHERE key = ?', (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        flight = _Flight(row[0], row[1], row[2], Outcome(row[3], row[4]))
+        now = time.time()
+        if flight.finished is not None:
+            return flight if flight.finished >= now - self.linger else None
+        return flight if flight.expires >= now and is_alive(flight.owner) else None
+
+    def _claim(self, key: str, /) -> bool:
+        """Takes the computation of `key` over, unless another process claimed it meanwhile"""
+        with self._lock:
+            db = self.connection
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                now = time.time()
+                if now - self._purged_at >= self.linger:
+                    self._purged_at = now
+                    db.execute(
+                        'DELETE FROM flights WHERE finished < ? OR (finished IS NULL AND expires < ?)',
+                        (now - self.linger, now),
+                    )
+                row = db.execute('SELECT owner, expires, finished FROM flights WHERE key = ?', (key,)).fetchone()
+                if row is not None and (
+                    row[2] is not None and row[2] >= now - self.linger
+                    or row[2] is None and row[1] >= now and is_alive(row[0])
+                ):
+                    db.execute('COMMIT')
+                    return False
+                db.execute(
+                    'INSERT OR REPLACE INTO flights (key, owner, expires) VALUES (?, ?, ?)',
+                    (key, os.getpid(), now + self.timeout),
+                )
+                db.execute('COMMIT')
+                return True
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+
+    def _finish(self, key: str, outcome: Outcome, /) -> None:
+        with self._lock:
+            self.connection.execute(
+                'UPDATE flights SET finished = ?, result = ?, error = ? WHERE key = ? AND owner = ?',
+                (time.time(), outcome.result, outcome.error, key, os.getpid()),
+            )
+
+    def _abandon(self, key: str, /) -> None:
+        with self._lock:
+            self.connection.execute('DELETE FROM flights WHERE key = ? AND owner = ?', (key, os.getpid()))
+
+    async def _fly(
+        self,
+        name: str,
+        key: str,
+        func: Callable[[], Awaitable[Any]],
+        encode: Callable[[Any], bytes], /,
+    ) -> Outcome:
+        # the duplicates only read, until the flight they wait for is gone
+        while True:
+            if (flight := await asyncio.to_thread(self._lookup, key)) is None:
+                if await asyncio.to_thread(self._claim, key):
+                    break
+            elif flight.finished is not None:
+                metrics.inc('coalesced_requests_total', endpoint=name)
+                return flight.outcome
+            else:
+                await asyncio.sleep(self.poll_interval)
+
+        try:
+            outcome = Outcome(result=encode(await func()))
+        except Exception as e:
+            outcome = Outcome(error=str(e))
+        except BaseException:
+            # the duplicates take the computation over
+            self._abandon(key)
+            raise
+        await asyncio.to_thread(self._finish, key, outcome)
+        return outcome
+
+    async def run(
+        self,
+        name: str,
+        key: str,
+        func: Callable[[], Awaitable[R]], /,
+        *,
+        encode: Callable[[R], bytes],
+        decode: Callable[[bytes], R],
+    ) -> R:
+        """The result of `func`, or of the identical computation of `key` already running
+
+        * errors, including those raised by `encode`, are raised as `SolverException` with the original message
+        * the computation runs on its own task, so a duplicate is not cancelled with the request that started it
+        """
+        metrics.inc('coalescible_requests_total', endpoint=name)
+        key = f'{name}:{key}'
+        if (flight := self._flights.get(key)) is None:
+            flight = self._flights[key] = asyncio.ensure_future(self._fly(name, key, func, encode))
+            flight.add_done_callback(lambda _: self._flights.pop(key, None))
+        else:
+            metrics.inc('coalesced_requests_total', endpoint=name)
+        outcome = await asyncio.shield(flight)
+        return outcome.value(decode)
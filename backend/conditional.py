@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from typing import Any, Awaitable, Callable
+from functools import wraps
+import hashlib
+import gzip
+
+from quart import Response, request, after_this_request
+from quart.wrappers.response import DataBody
+import brotli
+
+from .models import SolveSchema
+from .helpers import canonical_key
+
+__all__ = (
+    'request_etag',
+    'conditional',
+    'compress_response',
+)
+
+# bump when the output for the same request changes, ex. a new response field or a different renderer
+ETAG_VERSION = 3
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'image/svg+xml')
+MIN_COMPRESS_SIZE = 256
+
+def request_etag(data: SolveSchema, /) -> str:
+    """A weak ETag for the result of `data` on the current endpoint
+
+    * the result is a pure function of the canonical request, so it is known before computing it
+    * weak, as the body differs by content encoding and numeric approximations may differ by timing
+    """
+    key = f'{ETAG_VERSION}:{request.path}:{canonical_key(data)}'
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+def conditional(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """Answers `If-None-Match` with 304 without computing the result, and tags successful responses"""
+    @wraps(func)
+    async def wrapper(*args: Any, data: SolveSchema, **kwargs: Any) -> Any:
+        # profiled requests always run
+        if request.args.get('debug'):
+            return await func(*args, data=data, **kwargs)
+
+        etag = request_etag(data)
+        if request.if_none_match.contains_weak(etag):
+            response = Response('', status=304)
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+
+        @after_this_request
+        def set_etag(response: Response) -> Response:
+            if response.status_code == 200:
+                response.set_etag(etag, weak=True)
+                response.headers['Cache-Control'] = 'no-cache'
+            return response
+
+        return await func(*args, data=data, **kwargs)
+    return wrapper
+
+async def compress_response(response: Response, /) -> Response:
+    """Compresses JSON and SVG bodies with brotli or gzip, as accepted by the client"""
+    response.vary.add('Accept-Encoding')
+    if (
+        response.mimetype not in COMPRESSIBLE_MIMETYPES
+        or 'Content-Encoding' in response.headers
+        # streamed bodies are sent as they are produced
+        or not isinstance(response.response, DataBody)
+    ):
+        return response
+
+    if (encoding := request.accept_encodings.best_match(['br', 'gzip'])) is None:
+        return response
+    if len(data := await response.get_data()) < MIN_COMPRESS_SIZE:
+        return response
+
+    if encoding == 'br':
+        response.set_data(brotli.compress(data))
+    else:
+        response.set_data(gzip.compress(data, compresslevel=6))
+    response.headers['Content-Encoding'] = encoding
+    return response
@@ -1,15 +1,27 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, TypeVar, Callable
+from typing import TYPE_CHECKING, TypeVar, Callable, Iterator, AsyncIterator, Any
+from dataclasses import asdict
 import asyncio
+import json
+import time
+import os
 
 from .models import SolveSchema
 from .solver.exceptions import MathTimeout
+from .solver.metrics import metrics, private_directory
+from .profiling import profiled
 
 if TYPE_CHECKING:
     R = TypeVar('R')
 
-__all__ = ('run_threaded',)
+__all__ = (
+    'run_threaded',
+    'stream_threaded',
+    'sse_event',
+    'canonical_key',
+    'private_directory',
+)
 
 async def run_threaded(
     func: Callable[[SolveSchema], R], /,
@@ -19,8 +31,42 @@ async def run_threaded(
 ) -> R:
     try:
         return await asyncio.wait_for(
-            asyncio.to_thread(func, argument),
+            asyncio.to_thread(profiled(func), argument),
             timeout=timeout,
         )
     except asyncio.TimeoutError as e:
-        raise MathTimeout(timeout) from e
\ No newline at end of file
+        metrics.inc('solver_timeouts_total', task=func.__name__)
+        raise MathTimeout(timeout) from e
+
+async def stream_threaded(
+    func: Callable[[SolveSchema], Iterator[R]], /,
+    argument: SolveSchema,
+    *,
+    timeout: float = 60.0,
+) -> AsyncIterator[R]:
+    """Advances the iterator returned by `func` in a worker thread,
+    yielding each item as soon as it is produced"""
+    deadline = time.monotonic() + timeout
+    sentinel = object()
+
+    iterator = await asyncio.to_thread(func, argument)
+    while True:
+        try:
+            item = await asyncio.wait_for(
+                asyncio.to_thread(next, iterator, sentinel),
+                timeout=max(deadline - time.monotonic(), 0),
+            )
+        except asyncio.TimeoutError as e:
+            metrics.inc('solver_timeouts_total', task=func.__name__)
+            raise MathTimeout(timeout) from e
+        if item is sentinel:
+            return
+        yield item # type: ignore
+
+def sse_event(event: str, data: Any) -> bytes:
+    """Formats a single Server-Sent Event with a JSON payload"""
+    return f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'.encode()
+
+def canonical_key(data: SolveSchema) -> str:
+    """A deterministic key for a request, equal for requests that produce identical results"""
+    return json.dumps(asdict(data), sort_keys=True, separators=(',', ':'))
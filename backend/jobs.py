@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Callable, Iterator, Literal, Optional, TypeAlias
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field, asdict
+import asyncio
+import time
+import uuid
+import os
+
+from .models import SolveSchema, GraphSchema
+from .helpers import stream_threaded
+
+__all__ = (
+    'Job',
+    'JobQueue',
+    'LocalJobQueue',
+    'job_schema',
+    'run_worker',
+)
+
+if TYPE_CHECKING:
+    JobStatus: TypeAlias = Literal['queued', 'running', 'done', 'failed']
+    Handlers: TypeAlias = dict[str, Callable[[SolveSchema], Iterator[tuple[str, Any]]]]
+
+def job_schema(kind: str, data: dict[str, Any], /) -> SolveSchema:
+    """The request of a job from its JSON, a `GraphSchema` for graphs (with their overlays)"""
+    return (GraphSchema if kind == 'graph' else SolveSchema)(**data)
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    data: SolveSchema
+    status: JobStatus = 'queued'
+    fields: dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+    finished_at: Optional[float] = None
+
+    def to_dict(self, /) -> dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any], /) -> Job:
+        return cls(**{**data, 'data': job_schema(data['kind'], data['data'])})
+
+class JobQueue(ABC):
+    """Interface between the HTTP layer, which submits and polls jobs,
+    and the workers, which fetch jobs and report their fields back"""
+
+    @abstractmethod
+    async def submit(self, kind: str, data: SolveSchema, /) -> Job:
+        """Enqueues a new job, raises `asyncio.QueueFull` if the queue is at capacity"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get(self, job_id: str, /) -> Optional[Job]:
+        raise NotImplementedError
+
+    async def wait(self, job_id: str, /, *, interval: float = 0.05) -> Optional[Job]:
+        """Waits for the job to finish, returning it (or `None` if there is no such job)"""
+        while (job := await self.get(job_id)) is not None and job.status in ('queued', 'running'):
+            await asyncio.sleep(interval)
+        return job
+
+    @abstractmethod
+    async def fetch(self, /) -> Job:
+        """Waits for the next queued job and marks it as running"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update(self, job_id: str, fields: dict[str, Any], /) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def finish(self, job_id: str, /, *, error: Optional[str] = None) -> None:
+        raise NotImplementedError
+
+    async def close(self, /) -> None:
+        ...
+
+async def _next_job(queue: JobQueue, stop: Optional[asyncio.Event], /) -> Optional[Job]:
+    """The next job, or `None` once `stop` is set while waiting for it
+
+    * a job that the cancelled fetch had already taken is queued again, as it is never acknowledged
+      to the broker (and local queues do not give out jobs to cancelled fetches)
+    """
+    if stop is None:
+        return await queue.fetch()
+    fetch = asyncio.ensure_future(queue.fetch())
+    stopped = asyncio.ensure_future(stop.wait())
+    done, _ = await asyncio.wait((fetch, stopped), return_when=asyncio.FIRST_COMPLETED)
+    if fetch in done:
+        stopped.cancel()
+        return fetch.result()
+    fetch.cancel()
+    return None
+
+async def run_worker(
+    queue: JobQueue,
+    handlers: Handlers, /,
+    *,
+    timeout: float = 60.0,
+    after_job: Optional[Callable[[], None]] = None,
+    stop: Optional[asyncio.Event] = None,
+) -> None:
+    """Fetches jobs from `queue`, recording the fields yielded by the job's handler,
+    until `stop` is set (or forever)
+
+    * `after_job` is called between jobs, ex. to release memory
+    * a job in progress when `stop` is set is finished first
+    """
+    while stop is None or not stop.is_set():
+        if (job := await _next_job(queue, stop)) is None:
+            return
+        try:
+            async for name, value in stream_threaded(handlers[job.kind], job.data, timeout=timeout):
+                await queue.update(job.id, {name: value})
+        except Exception as e:
+            await queue.finish(job.id, error=str(e))
+        else:
+            await queue.finish(job.id)
+        if after_job is not None:
+            after_job()
+
+class LocalJobQueue(JobQueue):
+    """A bounded in-process queue of jobs, drained by a pool of `workers` local worker tasks
+
+    * finished jobs are kept for `ttl` seconds
+    * without `handlers`, jobs of any kind are accepted and only drained by external workers
+      (see `broker.BrokerServer`)
+    * with a `lease`, a running job that is not updated for `lease` seconds (ex. its worker died)
+      is queued again, and fails once it was fetched `max_attempts` times, see `expire`
+    """
+
+    def __init__(
+        self,
+        handlers: Optional[Handlers] = None, /,
+        *,
+        maxsize: int = 256,
+        workers: Optional[int] = None,
+        ttl: float = 600.0,
+        timeout: float = 60.0,
+        lease: Optional[float] = None,
+        max_attempts: int = 2,
+    ) -> None:
+        self.handlers = handlers
+        self.maxsize = maxsize
+        if handlers is None:
+            self.workers = 0
+        else:
+            self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.ttl = ttl
+        self.timeout = timeout
+        self.lease = lease
+        self.max_attempts = max_attempts
+
+        self._jobs: dict[str, Job] = {}
+        self._finished: dict[str, asyncio.Event] = {}
+        self._leases: dict[str, float] = {}
+        self._attempts: dict[str, int] = {}
+        self._queue: Optional[asyncio.Queue[Job]] = None
+        self._tasks: list[asyncio.Task[None]] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _ensure_queue(self, /) -> asyncio.Queue[Job]:
+        loop = asyncio.get_running_loop()
+        if self._queue is None or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue(self.maxsize)
+            self._tasks = [
+                loop.create_task(run_worker(self, self.handlers, timeout=self.timeout)) # type: ignore
+                for _ in range(self.workers)
+            ]
+        return self._queue
+
+    def _purge(self, /) -> None:
+        self.expire()
+        now = time.monotonic()
+        for job_id, job in tuple(self._jobs.items()):
+            if job.finished_at is not None and now - job.finished_at > self.ttl:
+                del self._jobs[job_id]
+                self._finished.pop(job_id, None)
+                self._attempts.pop(job_id, None)
+
+    def expire(self, /) -> None:
+        """Queues the running jobs whose lease expired again, or fails them after `max_attempts`"""
+        now = time.monotonic()
+        for job_id, until in tuple(self._leases.items()):
+            if until >= now:
+                continue
+            if self._attempts.get(job_id, 0) < self.max_attempts:
+                try:
+                    self.requeue(job_id)
+                    continue
+                except asyncio.QueueFull:
+                    pass
+            self._finish(job_id, 'The worker running the job was lost')
+
+    async def submit(self, kind: str, data: SolveSchema, /) -> Job:
+        if self.handlers is not None and kind not in self.handlers:
+            raise ValueError(f'Unknown job kind: {kind!r}')
+        self._purge()
+        job = Job(uuid.uuid4().hex, kind, data)
+        self._ensure_queue().put_nowait(job)
+        self._jobs[job.id] = job
+        self._finished[job.id] = asyncio.Event()
+        return job
+
+    async def wait(self, job_id: str, /, *, interval: float = 0.05) -> Optional[Job]:
+        if (finished := self._finished.get(job_id)) is not None:
+            await finished.wait()
+        return self._jobs.get(job_id)
+
+    async def get(self, job_id: str, /) -> Optional[Job]:
+        self._purge()
+        return self._jobs.get(job_id)
+
+    async def fetch(self, /) -> Job:
+        while True:
+            job = await self._ensure_queue().get()
+            # a job whose lease expired is queued again, yet its worker may still finish it
+            if job.status == 'queued' and job.id in self._jobs:
+                break
+        job.status = 'running'
+        if self.lease is not None:
+            self._leases[job.id] = time.monotonic() + self.lease
+            self._attempts[job.id] = self._attempts.get(job.id, 0) + 1
+        return job
+
+    def requeue(self, job_id: str, /) -> None:
+        """Puts a fetched job that never reached its worker back at the end of the queue"""
+        self._leases.pop(job_id, None)
+        if (job := self._jobs.get(job_id)) is not None and job.status == 'running':
+            job.status = 'queued'
+            self._ensure_queue().put_nowait(job)
+
+    async def update(self, job_id: str, fields: dict[str, Any], /) -> None:
+        if (job := self._jobs.get(job_id)) is not None:
+            job.fields.update(fields)
+            if job_id in self._leases:
+                self._leases[job_id] = time.monotonic() + self.lease # type: ignore
+
+    def _finish(self, job_id: str, error: Optional[str], /) -> None:
+        self._leases.pop(job_id, None)
+        if (job := self._jobs.get(job_id)) is not None and job.finished_at is None:
+            job.status = 'failed' if error is not None else 'done'
+            job.error = error
+            job.finished_at = time.monotonic()
+            if (finished := self._finished.get(job_id)) is not None:
+                finished.set()
+
+    async def finish(self, job_id: str, /, *, error: Optional[str] = None) -> None:
+        self._finish(job_id, error)
+
+    async def close(self, /) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        self._queue = None
@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Optional, TypeVar
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from functools import wraps
+import tempfile
+import threading
+import asyncio
+import warnings
+import hashlib
+import sqlite3
+import json
+import time
+import os
+
+from .models import SolveSchema, BatchSolveSchema, Error
+from .solver.parser import Parser, Functions
+from .solver.evaluation import MACHINE_DIGITS
+
+__all__ = (
+    'Library',
+    'UnknownLibrary',
+    'LibraryRegistry',
+    'library_id',
+    'compile_library',
+    'registry',
+    'solver_options',
+    'inline_library',
+    'require_library',
+)
+
+if TYPE_CHECKING:
+    S = TypeVar('S', bound=SolveSchema)
+
+MAX_DEFINITIONS = 256
+# the input limits of `Solver`, applied to every definition of a library
+LIBRARY_LIMITS: dict[str, Optional[float]] = dict(
+    max_number=9e25,
+    max_exponent=256,
+    max_factorial=1024,
+    max_terms=100_000,
+    max_length=2048,
+    max_tokens=1024,
+    max_depth=64,
+    max_nodes=4096,
+)
+
+class UnknownLibrary(LookupError):
+    def __init__(self, id: str, /) -> None:
+        super().__init__(f'There is no registered library {id!r}')
+
+@dataclass(frozen=True)
+class Library:
+    """Function definitions and constants, parsed once and shared by every request referencing `id`"""
+    id: str
+    definitions: tuple[str, ...]
+    constants: dict[str, float]
+    functions: Functions
+
+def library_id(definitions: list[str], constants: Optional[dict[str, float]], /) -> str:
+    """A content hash, so registering the same library again (from any process) yields the same id"""
+    key = json.dumps([definitions, constants or {}], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+def compile_library(definitions: list[str], constants: Optional[dict[str, float]] = None, /) -> Library:
+    """Parses the definitions into `DefinedFunction` callables, raising on invalid ones"""
+    if len(definitions) > MAX_DEFINITIONS:
+        raise ValueError(f'A library has at most {MAX_DEFINITIONS} definitions')
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        functions, _ = Parser.parse_functions(definitions, constants=constants, **LIBRARY_LIMITS)
+    return Library(library_id(definitions, constants), tuple(definitions), dict(constants or {}), functions)
+
+class LibraryRegistry:
+    """The source of registered libraries, stored in SQLite so that every hypercorn worker
+    (and job worker) process on the node can resolve them
+
+    * each process compiles a library on first use, and keeps the `max_compiled` most recently used
+    * at most `max_libraries` are stored, the least recently used are dropped past that;
+      a library's use is recorded at most once per `touch_interval` seconds per process
+    """
+
+    def __init__(
+        self, /,
+        path: Optional[str] = None,
+        *,
+        max_compiled: int = 64,
+        max_libraries: int = 1000,
+        touch_interval: float = 60.0,
+    ) -> None:
+        self.path = path or os.path.join(tempfile.gettempdir(), 'math-solver-libraries.sqlite3')
+        self.max_compiled = max_compiled
+        self.max_libraries = max_libraries
+        self.touch_interval = touch_interval
+        self._compiled: OrderedDict[str, Library] = OrderedDict()
+        self._touched: dict[str, float] = {}
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @property
+    def connection(self, /) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(
+                self.path,
+                timeout=10.0,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS libraries (id TEXT PRIMARY KEY, source TEXT, created REAL, used REAL)'
+            )
+        return self._connection
+
+    def _remember(self, library: Library, /) -> Library:
+        with self._lock:
+            self._compiled[library.id] = library
+            self._compiled.move_to_end(library.id)
+            while len(self._compiled) > self.max_compiled:
+                evicted, _ = self._compiled.popitem(last=False)
+                self._touched.pop(evicted, None)
+        return library
+
+    def _touch(self, id: str, /) -> None:
+        """Records that `id` is in use, so that it is not dropped"""
+        now = time.time()
+        with self._lock:
+            if now - self._touched.get(id, float('-inf')) < self.touch_interval:
+                return
+            self._touched[id] = now
+            self.connection.execute('UPDATE libraries SET used = ? WHERE id = ?', (now, id))
+
+    def register(self, definitions: list[str], constants: Optional[dict[str, float]] = None, /) -> Library:
+        """Compiles and stores a library, returning the existing one if it was already registered"""
+        if (library := self._cached(library_id(definitions, constants))) is not None:
+            return library
+        library = compile_library(definitions, constants)
+        source = json.dumps({'definitions': definitions, 'constants': constants or {}})
+        now = time.time()
+        with self._lock:
+            db = self.connection
+            db.execute(
+                'INSERT INTO libraries (id, source, created, used) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (id) DO UPDATE SET used = excluded.used',
+                (library.id, source, now, now),
+            )
+            self._touched[library.id] = now
+            db.execute(
+                'DELETE FROM libraries WHERE id IN (SELECT id FROM libraries ORDER BY used DESC LIMIT -1 OFFSET ?)',
+                (self.max_libraries,),
+            )
+        return self._remember(library)
+
+    def _cached(self, id: str, /) -> Optional[Library]:
+        with self._lock:
+            if (library := self._compiled.get(id)) is not None:
+                self._compiled.move_to_end(id)
+            return library
+
+    def get(self, id: str, /) -> Library:
+        """The compiled library `id`, compiling it in this process if needed"""
+        if (library := self._cached(id)) is not None:
+            self._touch(id)
+            return library
+        with self._lock:
+            row = self.connection.execute('SELECT source FROM libraries WHERE id = ?', (id,)).fetchone()
+        if row is None:
+            raise UnknownLibrary(id)
+        self._touch(id)
+        source = json.loads(row[0])
+        return self._remember(compile_library(source['definitions'], source['constants']))
+
+registry = LibraryRegistry(
+    os.getenv('SOLVER_LIBRARY_DB'),
+    max_libraries=int(os.getenv('SOLVER_MAX_LIBRARIES', 1000)),
+)
+
+def solver_options(data: SolveSchema, /) -> dict[str, Any]:
+    """The functions and constants of a request, merged over those of its library
+
+    * the definitions of the request itself take precedence
+    * past `MACHINE_DIGITS`, the library is parsed again with the request, with its decimals kept exact
+    """
+    if data.library is None:
+        return dict(functions=data.functions, constants=data.constants)
+    library = registry.get(data.library)
+    if data.precision is not None and data.precision > MACHINE_DIGITS:
+        return dict(
+            functions=[*library.definitions, *(data.functions or ())],
+            constants={**library.constants, **(data.constants or {})} or None,
+        )
+    return dict(
+        functions=data.functions,
+        constants={**library.constants, **(data.constants or {})} or None,
+        defined_functions=library.functions,
+    )
+
+def inline_library(data: S, /) -> S:
+    """`data` with the definitions and constants of its library instead of its id,
+    for a job worker that may run on another node, with a registry of its own"""
+    if data.library is None:
+        return data
+    library = registry.get(data.library)
+    return replace(
+        data,
+        library=None,
+        functions=[*library.definitions, *(data.functions or ())],
+        constants={**library.constants, **(data.constants or {})} or None,
+    )
+
+def require_library(func: Callable[..., Awaitable[Any]], /) -> Callable[..., Awaitable[Any]]:
+    """Responds 404 to requests (or batches with items) referencing a library that is not registered"""
+    @wraps(func)
+    async def wrapper(*args: Any, data: SolveSchema | BatchSolveSchema, **kwargs: Any) -> Any:
+        items = data.items if isinstance(data, BatchSolveSchema) else [data]
+        for id in {item.library for item in items if item.library is not None}:
+            try:
+                await asyncio.to_thread(registry.get, id)
+            except UnknownLibrary as e:
+                return Error(error=str(e)), 404
+        return await func(*args, data=data, **kwargs)
+    return wrapper
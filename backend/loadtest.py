@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+from typing import Any, Awaitable, Callable, Iterable, Literal, NamedTuple, Optional, TypeAlias
+from urllib.error import HTTPError, URLError
+import urllib.request
+import itertools
+import asyncio
+import random
+import json
+import time
+import math
+
+__all__ = (
+    'Sample',
+    'load_corpus',
+    'run_load',
+    'summarize',
+)
+
+Outcome: TypeAlias = Literal['ok', 'rejected', 'error', 'timeout']
+# sends a payload to an endpoint, returning the status code
+Transport: TypeAlias = Callable[[str, dict[str, Any], float], Awaitable[int]]
+
+class Sample(NamedTuple):
+    endpoint: str
+    status: int
+    latency: float
+    outcome: Outcome
+
+def load_corpus(path: str, /) -> list[tuple[str, dict[str, Any]]]:
+    """Reads a JSONL file of `SolveSchema` payloads
+
+    * a line may name its endpoint with an `endpoint` key, `/solve` by default
+    """
+    corpus = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            payload = json.loads(line)
+            corpus.append((payload.pop('endpoint', '/solve'), payload))
+    return corpus
+
+def http_transport(url: str, /) -> Transport:
+    """Sends requests to a running server at `url`"""
+    def send(endpoint: str, payload: dict[str, Any], timeout: float) -> int:
+        request = urllib.request.Request(
+            url.rstrip('/') + endpoint,
+            data=json.dumps(payload).encode(),
+            headers={'Content-Type': 'application/json'},
+            method='POST',
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                response.read()
+                return response.status
+        except HTTPError as e:
+            return e.code
+        except URLError as e:
+            if isinstance(e.reason, TimeoutError):
+                raise e.reason
+            return 0
+
+    async def transport(endpoint: str, payload: dict[str, Any], timeout: float) -> int:
+        return await asyncio.to_thread(send, endpoint, payload, timeout)
+    return transport
+
+def app_transport(client: Any, /, *, single_client: bool = False) -> Transport:
+    """Sends requests to the app in this process, through a Quart test client
+
+    * every request comes from its own address by default, so that admission control
+      (a token bucket per client address) measures the capacity of the app rather than rejecting
+      the load as a single client; with `single_client`, they share one address like through `http_transport`
+    """
+    addresses = itertools.count()
+
+    async def transport(endpoint: str, payload: dict[str, Any], timeout: float) -> int:
+        if single_client:
+            scope_base = None
+        else:
+            n = next(addresses)
+            scope_base = {'client': (f'10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}', 0)}
+        response = await asyncio.wait_for(client.post(endpoint, json=payload, scope_base=scope_base), timeout)
+        await response.get_data()
+        return response.status_code
+    return transport
+
+async def _send(
+    transport: Transport,
+    endpoint: str,
+    payload: dict[str, Any],
+    timeout: float,
+    start: float, /,
+) -> Sample:
+    try:
+        status = await transport(endpoint, payload, timeout)
+    except (asyncio.TimeoutError, TimeoutError):
+        return Sample(endpoint, 0, time.perf_counter() - start, 'timeout')
+    except Exception:
+        return Sample(endpoint, 0, time.perf_counter() - start, 'error')
+
+    outcome: Outcome = (
+        'ok' if 200 <= status < 300 else
+        'rejected' if status == 429 else
+        'error'
+    )
+    return Sample(endpoint, status, time.perf_counter() - start, outcome)
+
+async def run_load(
+    transport: Transport,
+    corpus: Iterable[tuple[str, dict[str, Any]]], /,
+    *,
+    requests: Optional[int] = None,
+    concurrency: int = 8,
+    rate: Optional[float] = None,
+    timeout: float = 30.0,
+    seed: int = 0,
+) -> tuple[list[Sample], float]:
+    """Replays the corpus (cycling through it for `requests` requests),
+    returning the samples and the total duration
+
+    * without a `rate`, `concurrency` clients send their next request as soon as the previous one completes
+    * with a `rate`, requests arrive as a Poisson process of `rate` per second regardless of the responses,
+      and at most `concurrency` are in flight;
+      latencies are then measured from the arrival, so they include the time spent waiting for a slot
+    """
+    corpus = list(corpus)
+    if not corpus:
+        return [], 0.0
+    items = list(itertools.islice(itertools.cycle(corpus), requests or len(corpus)))
+    samples: list[Sample] = []
+    start = time.perf_counter()
+
+    if rate is None:
+        pending = iter(items)
+
+        async def client() -> None:
+            for endpoint, payload in pending:
+                samples.append(await _send(transport, endpoint, payload, timeout, time.perf_counter()))
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+    else:
+        rng = random.Random(seed)
+        slots = asyncio.Semaphore(concurrency)
+
+        async def arrive(endpoint: str, payload: dict[str, Any], arrival: float) -> None:
+            async with slots:
+                samples.append(await _send(transport, endpoint, payload, timeout, arrival))
+
+        tasks = []
+        arrival = start
+        for endpoint, payload in items:
+            await asyncio.sleep(max(arrival - time.perf_counter(), 0))
+            tasks.append(asyncio.create_task(arrive(endpoint, payload, arrival)))
+            arrival += rng.expovariate(rate)
+        await asyncio.gather(*tasks)
+
+    return samples, time.perf_counter() - start
+
+def _percentile(values: list[float], q: float, /) -> float:
+    """The nearest-rank percentile of sorted `values`"""
+    if not values:
+        return 0.0
+    return values[max(math.ceil(q / 100 * len(values)) - 1, 0)]
+
+def _stats(samples: list[Sample], duration: float, /) -> dict[str, Any]:
+    latencies = sorted(s.latency for s in samples)
+    count = len(samples)
+    outcomes = {o: sum(s.outcome == o for s in samples) for o in ('ok', 'rejected', 'error', 'timeout')}
+    statuses: dict[str, int] = {}
+    for s in samples:
+        statuses[str(s.status)] = statuses.get(str(s.status), 0) + 1
+
+    return {
+        'requests': count,
+        'throughput': count / duration if duration else 0.0,
+        'latency': {
+            'mean': sum(latencies) / count if count else 0.0,
+            'p50': _percentile(latencies, 50),
+            'p95': _percentile(latencies, 95),
+            'p99': _percentile(latencies, 99),
+            'max': latencies[-1] if latencies else 0.0,
+        },
+        **{f'{o}_rate': n / count if count else 0.0 for o, n in outcomes.items() if o != 'ok'},
+        'statuses': statuses,
+    }
+
+def summarize(samples: list[Sample], duration: float, /, *, mode: Optional[str] = None) -> dict[str, Any]:
+    """Throughput, latency percentiles (in seconds) and error rates, overall and per endpoint
+
+    * `mode` describes how the load was sent, ex. whether admission control saw a single client
+    """
+    endpoints = sorted({s.endpoint for s in samples})
+    return {
+        'mode': mode,
+        'duration': duration,
+        **_stats(samples, duration),
+        'endpoints': {
+            endpoint: _stats([s for s in samples if s.endpoint == endpoint], duration)
+            for endpoint in endpoints
+        },
+    }
+
+def _print_summary(summary: dict[str, Any], /) -> None:
+    rows = [('all', summary), *summary['endpoints'].items()]
+    print(f"{summary['requests']} requests in {summary['duration']:.2f}s")
+    if summary['mode']:
+        print(f"mode: {summary['mode']}")
+    print(
+        f"{'endpoint':<16}{'req':>6}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}"
+        f"{'429':>8}{'error':>8}{'timeout':>9}"
+    )
+    for name, stats in rows:
+        latency = stats['latency']
+        print(
+            f"{name:<16}{stats['requests']:>6}{stats['throughput']:>9.2f}"
+            f"{latency['p50'] * 1000:>7.0f}ms{latency['p95'] * 1000:>7.0f}ms{latency['p99'] * 1000:>7.0f}ms"
+            f"{stats['rejected_rate']:>8.1%}{stats['error_rate']:>8.1%}{stats['timeout_rate']:>9.1%}"
+        )
+
+async def main(args: Any) -> None:
+    corpus = load_corpus(args.corpus)
+    options = dict(
+        requests=args.requests,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        timeout=args.timeout,
+        seed=args.seed,
+    )
+    if args.url:
+        mode = f'http {args.url}, single client (subject to admission control)'
+        samples, duration = await run_load(http_transport(args.url), corpus, **options)
+    else:
+        from .app import app
+
+        mode = (
+            'in process, single client (subject to admission control)' if args.single_client else
+            'in process, one client address per request (admission control does not limit the load)'
+        )
+        async with app.test_app() as test_app:
+            transport = app_transport(test_app.test_client(), single_client=args.single_client)
+            samples, duration = await run_load(transport, corpus, **options)
+
+    summary = summarize(samples, duration, mode=mode)
+    _print_summary(summary)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=4)
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Replays a JSONL corpus of solve requests against the app')
+    parser.add_argument('corpus', help='one SolveSchema payload per line, with an optional "endpoint"')
+    parser.add_argument('--url', help='the server to load, instead of the app in this process')
+    parser.add_argument(
+        '--single-client', action='store_true',
+        help='in process, send every request from one address, so that admission control applies to the load',
+    )
+    parser.add_argument('--requests', type=int, help='how many requests to send, cycling through the corpus')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--rate', type=float, help='the mean arrivals per second, instead of closed loop clients')
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='also write the summary as JSON to this file')
+    asyncio.run(main(parser.parse_args()))
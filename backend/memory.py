@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+from typing import Any, Literal, NamedTuple, Optional
+import resource
+import sys
+import time
+import gc
+import os
+
+__all__ = (
+    'CacheStats',
+    'configure_cache',
+    'cache_stats',
+    'process_rss',
+    'release_cache',
+    'MemoryGuard',
+)
+
+# entries per cached SymPy function (SymPy's own default is 1000)
+DEFAULT_CACHE_SIZE = 500
+
+class CacheStats(NamedTuple):
+    functions: int
+    entries: int
+    maxsize: Optional[int]
+    hits: int
+    misses: int
+
+def configure_cache(size: Optional[int] = None, /) -> None:
+    """Sets the size of the SymPy cache, unless `SYMPY_CACHE_SIZE` is already set
+
+    * SymPy reads it once on import, so this must run before the solver is first imported
+    """
+    if 'sympy' in sys.modules:
+        return
+    os.environ.setdefault('SYMPY_CACHE_SIZE', str(size if size is not None else DEFAULT_CACHE_SIZE))
+
+def _cached_functions() -> list[Any]:
+    from sympy.core.cache import CACHE
+
+    return [f for f in CACHE if hasattr(f, 'cache_info')]
+
+def cache_stats() -> CacheStats:
+    """The size and hit rate of the SymPy cache of this process, summed over every cached function"""
+    infos = [f.cache_info() for f in _cached_functions()]
+    return CacheStats(
+        functions=len(infos),
+        entries=sum(i.currsize for i in infos),
+        maxsize=infos[0].maxsize if infos else None,
+        hits=sum(i.hits for i in infos),
+        misses=sum(i.misses for i in infos),
+    )
+
+def process_rss() -> int:
+    """The resident memory of this process in bytes, or its peak where the current one is unavailable"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+def release_cache(policy: Literal['clear', 'trim'] = 'clear', /) -> int:
+    """Empties the SymPy cache, or with `trim` only its largest caches holding half of the entries,
+    returning how many entries were dropped
+
+    * `trim` keeps the many small caches (ex. of assumptions and dispatching) warm
+    """
+    functions = sorted(_cached_functions(), key=lambda f: f.cache_info().currsize, reverse=True)
+    total = sum(f.cache_info().currsize for f in functions)
+    dropped = 0
+    for f in functions:
+        if policy == 'trim' and dropped >= total / 2:
+            break
+        dropped += f.cache_info().currsize
+        f.cache_clear()
+    gc.collect()
+    return dropped
+
+class MemoryGuard:
+    """Releases the SymPy cache between requests once the process passes `threshold` bytes of RSS,
+    and reports the cache and memory of the process as metrics
+
+    * without a threshold, the cache is only bounded by its configured size
+    * the allocator rarely returns freed memory to the OS, so the RSS may stay above the threshold;
+      releases are at least `interval` seconds apart to not turn every request cold
+    """
+
+    def __init__(
+        self, /,
+        threshold: Optional[int] = None,
+        *,
+        policy: Literal['clear', 'trim'] = 'trim',
+        interval: float = 60.0,
+    ) -> None:
+        self.threshold = threshold
+        self.policy = policy
+        self.interval = interval
+        self._released_at = float('-inf')
+
+    @classmethod
+    def from_env(cls) -> MemoryGuard:
+        """`SOLVER_CACHE_RSS_LIMIT` (in MiB) and `SOLVER_CACHE_POLICY` (`trim` or `clear`)"""
+        limit = os.getenv('SOLVER_CACHE_RSS_LIMIT')
+        policy = os.getenv('SOLVER_CACHE_POLICY', 'trim')
+        if policy not in ('clear', 'trim'):
+            raise ValueError(f'Unknown cache policy: {policy!r}')
+        return cls(int(float(limit) * 2 ** 20) if limit else None, policy=policy) # type: ignore
+
+    def check(self, /) -> None:
+        """Called between requests (or jobs)"""
+        # imported here, so that importing this module does not import SymPy before `configure_cache`
+        from .solver.metrics import metrics
+
+        rss = process_rss()
+        if (
+            self.threshold is not None and rss > self.threshold
+            and time.monotonic() - self._released_at >= self.interval
+        ):
+            self._released_at = time.monotonic()
+            dropped = release_cache(self.policy)
+            metrics.inc('sympy_cache_releases_total', policy=self.policy)
+            metrics.inc('sympy_cache_released_entries_total', dropped)
+            rss = process_rss()
+
+        stats = cache_stats()
+        metrics.set('process_resident_memory_bytes', rss)
+        metrics.set('sympy_cache_entries', stats.entries)
+        metrics.set('sympy_cache_hits', stats.hits)
+        metrics.set('sympy_cache_misses', stats.misses)
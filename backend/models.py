@@ -1,9 +1,16 @@
-from typing import Optional
-from dataclasses import dataclass
+from typing import Any, Literal, Optional
+from dataclasses import dataclass, field
 
 __all__ = (
     'SolveSchema',
+    'BatchSolveSchema',
+    'GraphSchema',
+    'LibrarySchema',
+    'GridAxis',
+    'EvaluateSchema',
     'SolveResponse',
+    'JobResponse',
+    'LibraryResponse',
     'Error',
 )
 
@@ -14,6 +21,40 @@ class SolveSchema:
     solve_for: Optional[str] = None
     functions: Optional[list[str]] = None
     constants: Optional[dict[str, float]] = None
+    numeric_budget: Optional[float] = None
+    # the id of a library registered with `POST /libraries`
+    library: Optional[str] = None
+    # significant digits of `evaluated`, past 15 (double precision) evaluated with arbitrary precision
+    precision: Optional[int] = None
+
+@dataclass
+class BatchSolveSchema:
+    items: list[SolveSchema]
+
+@dataclass
+class GraphSchema(SolveSchema):
+    """`overlays` are further expressions drawn on the same axes,
+    where `derivative` stands for the derivative of the equation"""
+    overlays: list[str] = field(default_factory=list)
+
+@dataclass
+class LibrarySchema:
+    functions: list[str] = field(default_factory=list)
+    constants: Optional[dict[str, float]] = None
+
+@dataclass
+class GridAxis:
+    """Either `start`/`stop`/`step` (`stop` included) or explicit `points`"""
+    variable: Optional[str] = None
+    start: Optional[float] = None
+    stop: Optional[float] = None
+    step: Optional[float] = None
+    points: Optional[list[float]] = None
+
+@dataclass
+class EvaluateSchema(SolveSchema):
+    grid: list[GridAxis] = field(default_factory=list)
+    format: Literal['ndjson', 'float64'] = 'ndjson'
 
 @dataclass
 class SolveResponse:
@@ -30,6 +71,25 @@ class SolveResponse:
     derivative: str
     max: str = r'\infty'
     min: str = r'-\infty'
+    approximate: bool = False
+    # what an `approximate` solution leaves out, ex. the roots outside of the window searched numerically
+    note: Optional[str] = None
+    # `full`, `targeted` or `normalized`, see `solver.simplification`
+    simplify_tier: str = 'full'
+
+@dataclass
+class JobResponse:
+    id: str
+    status: str
+    fields: dict[str, Any]
+    result: Optional[SolveResponse] = None
+    error: Optional[str] = None
+
+@dataclass
+class LibraryResponse:
+    id: str
+    functions: list[str]
+    constants: list[str]
 
 @dataclass
 class Error:
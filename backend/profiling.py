@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+from typing import Any, Awaitable, Callable, Optional, TypeVar, TYPE_CHECKING
+from dataclasses import dataclass, field
+from contextvars import ContextVar
+from functools import wraps
+from io import StringIO
+import threading
+import cProfile
+import sqlite3
+import secrets
+import asyncio
+import pstats
+import hmac
+import time
+import os
+
+from quart import Response, current_app, request, g
+
+from .solver.metrics import stage_timings
+
+if TYPE_CHECKING:
+    R = TypeVar('R')
+
+__all__ = (
+    'RequestProfile',
+    'ProfileStore',
+    'profile_store',
+    'is_debug_allowed',
+    'debuggable',
+    'profiled',
+    'add_debug_headers',
+)
+
+@dataclass
+class RequestProfile:
+    """The stage breakdown (and optionally the cProfile summary) of a single request"""
+    cprofile: bool = False
+    stages: dict[str, float] = field(default_factory=dict)
+    stats: Optional[str] = None
+    total: float = 0.0
+
+    def server_timing(self, /) -> str:
+        """Formats the stages as a `Server-Timing` header, in milliseconds"""
+        return ', '.join(
+            f'{stage};dur={seconds * 1000:.2f}'
+            for stage, seconds in (*self.stages.items(), ('total', self.total))
+        )
+
+current_profile: ContextVar[Optional[RequestProfile]] = ContextVar('current_profile', default=None)
+
+class ProfileStore:
+    """The cProfile summaries of recent requests, too large for a header, stored in SQLite
+    so that any worker process can serve them (see `GET /debug/profiles/<id>`)
+
+    * a summary is kept for `ttl` seconds, and only the `max_profiles` most recent ones
+    """
+
+    def __init__(self, /, path: Optional[str] = None, *, ttl: float = 600.0, max_profiles: int = 100) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.max_profiles = max_profiles
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @property
+    def connection(self, /) -> sqlite3.Connection:
+        if self._connection is None:
+            # imported here, as `helpers` imports this module
+            from .helpers import private_directory
+
+            # created on first use, as most deployments never profile
+            self.path = self.path or os.path.join(private_directory(), 'profiles.sqlite3')
+            self._connection = sqlite3.connect(
+                self.path,
+                timeout=10.0,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS profiles (id TEXT PRIMARY KEY, stats TEXT, created REAL)'
+            )
+        return self._connection
+
+    def put(self, stats: str, /) -> str:
+        """Stores a summary, returning its id"""
+        id = secrets.token_hex(16)
+        now = time.time()
+        with self._lock:
+            db = self.connection
+            db.execute('INSERT INTO profiles (id, stats, created) VALUES (?, ?, ?)', (id, stats, now))
+            db.execute(
+                'DELETE FROM profiles WHERE created < ? OR id IN '
+                '(SELECT id FROM profiles ORDER BY created DESC LIMIT -1 OFFSET ?)',
+                (now - self.ttl, self.max_profiles),
+            )
+        return id
+
+    def get(self, id: str, /) -> Optional[str]:
+        with self._lock:
+            row = self.connection.execute(
+                'SELECT stats FROM profiles WHERE id = ? AND created >= ?', (id, time.time() - self.ttl),
+            ).fetchone()
+        return row and row[0]
+
+profile_store = ProfileStore()
+
+def is_debug_allowed() -> bool:
+    """Profiling is enabled for everyone with `SOLVER_PROFILING`,
+    or per request with an `X-Debug-Token` header matching `SOLVER_DEBUG_TOKEN`"""
+    if current_app.config.get('SOLVER_PROFILING'):
+        return True
+    token = current_app.config.get('SOLVER_DEBUG_TOKEN')
+    provided = request.headers.get('X-Debug-Token')
+    return bool(token and provided and hmac.compare_digest(token, provided))
+
+def debuggable(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """Records a `RequestProfile` for requests with `?debug=timing` or `?debug=profile`,
+    when allowed to (see `is_debug_allowed`)"""
+    @wraps(func)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        if (mode := request.args.get('debug')) not in ('timing', 'profile') or not is_debug_allowed():
+            return await func(*args, **kwargs)
+
+        g.request_profile = profile = RequestProfile(cprofile=mode == 'profile')
+        profile_token = current_profile.set(profile)
+        timings_token = stage_timings.set(profile.stages)
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            profile.total = time.perf_counter() - start
+            stage_timings.reset(timings_token)
+            current_profile.reset(profile_token)
+    return wrapper
+
+def profiled(func: Callable[..., R], /) -> Callable[..., R]:
+    """Runs `func` under cProfile if the current request asked for it, keeping the top functions"""
+    if (profile := current_profile.get()) is None or not profile.cprofile:
+        return func
+
+    @wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> R:
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(func, *args, **kwargs)
+        finally:
+            stream = StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(25)
+            profile.stats = stream.getvalue().strip()
+    return wrapper
+
+async def add_debug_headers(response: Response, /) -> Response:
+    """Attaches the recorded profile of the request, if any, as response headers
+
+    * the cProfile summary is stored, and its id sent in `X-Profile-Id`
+    """
+    if (profile := g.get('request_profile')) is not None:
+        response.headers['Server-Timing'] = profile.server_timing()
+        if profile.stats is not None:
+            response.headers['X-Profile-Id'] = await asyncio.to_thread(profile_store.put, profile.stats)
+    return response
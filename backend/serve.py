@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Callable, Optional
+import threading
+import asyncio
+import random
+import signal
+import os
+
+from hypercorn.config import Config
+
+from .supervisor import WorkerPool
+from .worker import Recycler, warm_up, listen_for_drain
+
+if TYPE_CHECKING:
+    from multiprocessing.connection import Connection
+    from hypercorn.config import Sockets
+
+__all__ = (
+    'ServerPool',
+    'run_server_process',
+    'limits_from_env',
+    'main',
+)
+
+class ServerPool(WorkerPool):
+    """A `WorkerPool` of hypercorn processes serving the app on shared sockets,
+    recycled after `max_requests` requests (give or take a tenth, so they do not retire together)
+    or past `max_rss` bytes of RSS
+
+    * the streaming, batch and evaluation endpoints (and every endpoint without a broker) compute
+      in these processes, so they grow like the job workers
+    """
+
+    def __init__(
+        self, /,
+        config: Config,
+        processes: int,
+        *,
+        max_requests: Optional[int] = None,
+        max_rss: Optional[int] = None,
+        start_timeout: float = 120.0,
+        prepare: Callable[[], None] = warm_up,
+    ) -> None:
+        # the workers serve HTTP requests rather than pulling jobs from a broker
+        super().__init__(
+            '', processes, max_jobs=max_requests, max_rss=max_rss, start_timeout=start_timeout, prepare=prepare,
+        )
+        self.config = config
+        self.sockets = config.create_sockets()
+
+    def _entry_point(self, control: Connection, /) -> tuple[Callable[..., None], tuple[Any, ...]]:
+        return run_server_process, (self.config, self.sockets, self.max_jobs, self.max_rss, control, self.prepare)
+
+async def _serve(
+    config: Config,
+    sockets: Sockets,
+    max_requests: Optional[int],
+    max_rss: Optional[int],
+    control: Connection,
+    prepare: Callable[[], None], /,
+) -> None:
+    from hypercorn.asyncio.run import worker_serve
+    from hypercorn.utils import wrap_app
+
+    from .app import app
+
+    if max_requests is not None:
+        max_requests += random.randint(0, max_requests // 10)
+    recycler = Recycler(
+        lambda reason: control.send(('retire', reason)), max_jobs=max_requests, max_rss=max_rss, unit='requests',
+    )
+
+    @app.after_request
+    async def count_request(response: Any) -> Any:
+        recycler.after_job()
+        return response
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    try:
+        loop.add_signal_handler(signal.SIGTERM, stop.set)
+    except NotImplementedError:
+        pass
+    await asyncio.to_thread(prepare)
+    threading.Thread(target=listen_for_drain, args=(control, loop, stop), daemon=True).start()
+    control.send(('ready',))
+    # on `drain`, stops accepting connections and finishes the running requests
+    await worker_serve(
+        wrap_app(app, config.wsgi_max_body_size, 'asgi'), config, sockets=sockets, shutdown_trigger=stop.wait,
+    )
+
+def run_server_process(
+    config: Config,
+    sockets: Sockets,
+    max_requests: Optional[int],
+    max_rss: Optional[int],
+    control: Connection,
+    prepare: Callable[[], None] = warm_up, /,
+) -> None:
+    """The entry point of an HTTP worker process started by `ServerPool`"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_serve(config, sockets, max_requests, max_rss, control, prepare))
+
+def limits_from_env() -> tuple[Optional[int], Optional[int]]:
+    """`SOLVER_HTTP_MAX_REQUESTS` and `SOLVER_HTTP_MAX_RSS` (in MiB)"""
+    max_requests = os.getenv('SOLVER_HTTP_MAX_REQUESTS')
+    max_rss = os.getenv('SOLVER_HTTP_MAX_RSS')
+    return (
+        int(max_requests) if max_requests else None,
+        int(float(max_rss) * 2 ** 20) if max_rss else None,
+    )
+
+def main(bind: list[str], processes: int, /, **options: Optional[int]) -> None:
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stop.set())
+
+    config = Config()
+    config.bind = bind
+    pool = ServerPool(config, processes, **options) # type: ignore
+    print(f'Serving on {", ".join(bind)} with {processes} workers', flush=True)
+    pool.run(stop)
+
+if __name__ == '__main__':
+    import argparse
+
+    max_requests, max_rss = limits_from_env()
+    parser = argparse.ArgumentParser(description='Serves the app with hypercorn, recycling its workers by request count and memory')
+    parser.add_argument('--bind', action='append', help='defaults to 127.0.0.1:$PORT')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('WEB_CONCURRENCY') or os.cpu_count() or 1))
+    parser.add_argument('--max-requests', type=int, default=max_requests, help='recycle workers after this many requests')
+    parser.add_argument('--max-rss', type=float, help='recycle workers past this RSS, in MiB')
+    args = parser.parse_args()
+    main(
+        args.bind or [f'127.0.0.1:{os.getenv("PORT", "5000")}'],
+        args.workers,
+        max_requests=args.max_requests,
+        max_rss=int(args.max_rss * 2 ** 20) if args.max_rss is not None else max_rss,
+    )
@@ -1,12 +1,15 @@
 from __future__ import annotations
 
-from typing import Any, Optional, Callable, TypeAlias, ClassVar, TYPE_CHECKING
+from typing import Any, Optional, Callable, Iterator, TypeAlias, ClassVar, TYPE_CHECKING
 from abc import ABC, abstractmethod
 from decimal import Decimal
+from functools import wraps
 
 from sympy import (
     Sum,
     Product as S_Product,
+    Integer,
+    sympify,
     latex,
     limit,
     Symbol,
@@ -31,6 +34,7 @@ from sympy.core.relational import Relational
 from rply.token import BaseBox
 
 from .exceptions import *
+from .summation import BatchSum, BatchProduct, closed_form
 
 if TYPE_CHECKING:
     from sympy.core.numbers import NumberSymbol
@@ -78,14 +82,56 @@ __all__ = (
 Expr: TypeAlias = Basic | Decimal | int
 Equation: TypeAlias = Relational | bool
 
+_MISSING: Any = object()
+
+def _cache_eval(eval: Callable[[Ast], Any], /) -> Callable[[Ast], Any]:
+    """Memoizes the result of `eval` on the node, trees are never mutated once parsed"""
+    @wraps(eval)
+    def wrapper(self: Ast, /) -> Any:
+        if (value := self.__dict__.get('_evaluated', _MISSING)) is _MISSING:
+            value = self.__dict__['_evaluated'] = eval(self)
+        return value
+    return wrapper
+
 class Ast(ABC, BaseBox):
     def __init__(self, value: str, /) -> None:
         self.value = value
 
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        if 'eval' in cls.__dict__:
+            cls.eval = _cache_eval(cls.__dict__['eval'])
+
     @abstractmethod
     def eval(self, /) -> Any:
         raise NotImplementedError
 
+    def evaluate(self, /) -> Any:
+        """Evaluates the tree bottom-up without recursion,
+        so that deeply nested expressions can't exceed the recursion limit"""
+        stack: list[tuple[Ast, bool]] = [(self, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if '_evaluated' in node.__dict__:
+                continue
+            if expanded:
+                # the children are already evaluated, so this only recurses a single level
+                node.eval()
+            else:
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.children())
+        return self.eval()
+
+    def children(self, /) -> Iterator[Ast]:
+        """Yields the direct sub-trees of this node"""
+        for key, value in vars(self).items():
+            if key == '_evaluated':
+                continue
+            if isinstance(value, Ast):
+                yield value
+            elif isinstance(value, (list, tuple)):
+                yield from (v for v in value if isinstance(v, Ast))
+
 class Interval(Ast):
     def __init__(self, left: str, a: Ast, b: Ast, right: str) -> None:
         self.brackets = left + right
@@ -134,23 +180,22 @@ class DefinedFunction(Ast):
         self.expression = expression
 
     def eval(self, /) -> Functions:
-        if self.arguments and isinstance(self.expression.eval(), Basic):
+        # evaluated once, rather than on every call
+        expression = self.expression.evaluate()
+        if self.arguments and isinstance(expression, Basic):
+            names = []
+            for arg_name in self.arguments:
+                if not (name := getattr(arg_name, 'value', None)):
+                    raise InvalidFunctionArgument()
+                names.append(Symbol(arg_name.ident if isinstance(arg_name, Constant) else name))
+
             def f(*args) -> Expr:
-                raw_function = self.expression.eval()
-
-                for arg_name, arg_val in zip(self.arguments, args):
-                    if name := getattr(arg_name, 'value', None):
-                        if isinstance(arg_name, Constant):
-                            name = arg_name.ident
-                        raw_function = raw_function.subs(Symbol(name), arg_val)
-                    else:
-                        raise InvalidFunctionArgument()
-                return raw_function
+                return expression.subs(dict(zip(names, args)), simultaneous=True)
             function = f
         elif self.arguments:
-            function = lambda *_: self.expression.eval()
+            function = lambda *_: expression
         else:
-            function = lambda: self.expression.eval()
+            function = lambda: expression
         return {self.f_name: function}
 
 class Function(Ast):
@@ -179,34 +224,56 @@ class Limit(Ast):
         return limit(self.expr.eval(), self.target.eval(), self.to.eval())
 
 class Summation(Ast):
-    def __init__(self, variable: Variable, start: Ast, stop: Ast, expr: Ast) -> None:
+    kind: ClassVar[type[Sum] | type[S_Product]] = Sum
+
+    def __init__(
+        self,
+        variable: Variable,
+        start: Ast,
+        stop: Ast,
+        expr: Ast, /,
+        max_value: Optional[float] = None,
+    ) -> None:
         self.variable = variable
         self.start = start
         self.stop = stop
         self.expr = expr
+        self.max_value = max_value
 
-    def eval(self, /) -> Sum:
-        return Sum(self.expr.eval(),
-            (self.variable.eval(), self.start.eval(), self.stop.eval())
-        )
+    def eval(self, /) -> BatchSum | BatchProduct:
+        expr, variable = self.expr.eval(), self.variable.eval()
+        start, stop = sympify(self.start.eval()), sympify(self.stop.eval())
+
+        # without a closed form, every term has to be evaluated
+        if (
+            self.max_value is not None
+            and isinstance(terms := stop - start + 1, Integer)
+            and terms > self.max_value
+            and closed_form(self.kind, expr, variable, start) is None
+        ):
+            raise TermCountOverflow(terms, self.max_value)
+        return (BatchSum if self.kind is Sum else BatchProduct)(expr, (variable, start, stop))
 
 class Product(Summation):
-    def eval(self, /) -> S_Product:
-        return S_Product(self.expr.eval(),
-            (self.variable.eval(), self.start.eval(), self.stop.eval())
-        )
+    kind = S_Product
 
 class Variable(Ast):
     def eval(self, /) -> Symbol:
         return Symbol(self.value)
 
 class Number(Ast):
-    def __init__(self, value: str, /, max_value: Optional[float] = None) -> None:
+    """A number literal, kept as an exact `Rational` rather than a `Decimal` when `exact`,
+    so that it can be evaluated to any precision"""
+    def __init__(self, value: str, /, max_value: Optional[float] = None, *, exact: bool = False) -> None:
         super().__init__(value)
         self.max_value = max_value
+        self.exact = exact
 
-    def eval(self, /) -> Decimal | int:
-        val = int(self.value) if float(self.value).is_integer() else Decimal(self.value)
+    def eval(self, /) -> Decimal | Rational | int:
+        if float(self.value).is_integer():
+            val = int(self.value)
+        else:
+            val = Rational(self.value) if self.exact else Decimal(self.value)
         if self.max_value is not None and val > self.max_value:
             raise NumberLiteralOverflow(val, self.max_value)
         return val
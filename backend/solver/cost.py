@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+from typing import Optional, Iterable
+from dataclasses import dataclass, field
+import warnings
+import math
+
+from .parser import Parser, Constants, Functions
+from .ast import *
+
+__all__ = (
+    'Cost',
+    'estimate_cost',
+)
+
+def _literal(node: Ast) -> Optional[float]:
+    """The value of a (possibly negated) number literal"""
+    match node:
+        case Number():
+            return float(node.value)
+        case Neg():
+            return -value if (value := _literal(node.right)) is not None else None
+        case Pos():
+            return _literal(node.right)
+    return None
+
+@dataclass
+class Cost:
+    """Static measurements of a parsed expression tree, used to estimate how expensive solving it is"""
+    nodes: int = 0
+    depth: int = 0
+    max_exponent: float = 0
+    max_factorial: float = 0
+    summations: int = 0
+    summation_terms: float = 0
+    limits: int = 0
+    variables: set[str] = field(default_factory=set)
+    bound_variables: set[str] = field(default_factory=set)
+
+    def visit(self, tree: Ast, /) -> Cost:
+        stack = [(tree, 1)]
+        while stack:
+            node, depth = stack.pop()
+            self.nodes += 1
+            self.depth = max(self.depth, depth)
+
+            match node:
+                case Pow():
+                    if (exp := _literal(node.right)) is not None:
+                        self.max_exponent = max(self.max_exponent, abs(exp))
+                case Fac():
+                    if (n := _literal(node.x)) is not None:
+                        self.max_factorial = max(self.max_factorial, n)
+                case Summation():
+                    self.summations += 1
+                    self.bound_variables.add(node.variable.value)
+                    start, stop = _literal(node.start), _literal(node.stop)
+                    self.summation_terms += (
+                        abs(stop - start) + 1 if start is not None and stop is not None else math.inf
+                    )
+                case Limit():
+                    self.limits += 1
+                case Variable():
+                    self.variables.add(node.value)
+            stack.extend((child, depth + 1) for child in node.children())
+        return self
+
+    @property
+    def weight(self, /) -> float:
+        """The estimated cost in request units: `1.0` for a trivial expression, capped at `50.0`"""
+        weight = (
+            1.0
+            + 0.02 * self.nodes
+            + 0.05 * self.depth
+            + self.max_exponent / 32
+            + self.max_factorial / 128
+            + 4 * self.summations
+            + min(self.summation_terms, 10_000) / 500
+            + 3 * self.limits
+            + 2 * max(len(self.variables - self.bound_variables) - 1, 0)
+        )
+        return min(weight, 50.0)
+
+def estimate_cost(
+    equation: str, /,
+    *,
+    functions: Optional[Iterable[str]] = None,
+    constants: Optional[Constants] = None,
+    defined_functions: Optional[Functions] = None,
+    max_number: Optional[float] = 9e25,
+    max_exponent: Optional[float] = 256,
+    max_factorial: Optional[float] = 1024,
+    max_terms: Optional[float] = 100_000,
+    max_length: Optional[float] = 2048,
+    max_tokens: Optional[float] = 1024,
+    max_depth: Optional[float] = 64,
+    max_nodes: Optional[float] = 4096,
+) -> Cost:
+    """Parses (without solving) the equation and its function definitions and measures their trees
+
+    * the overflow and input limits default to the ones of `Solver`
+    * `defined_functions` are precompiled, so they are not measured
+    """
+    limits = dict(
+        max_number=max_number,
+        max_exponent=max_exponent,
+        max_factorial=max_factorial,
+        max_terms=max_terms,
+        max_length=max_length,
+        max_tokens=max_tokens,
+        max_depth=max_depth,
+        max_nodes=max_nodes,
+    )
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+
+        parsed_functions, definitions = Parser.parse_functions(functions or (), constants=constants, **limits)
+        cost = Cost()
+        for definition in definitions:
+            cost.visit(definition)
+        return cost.visit(
+            Parser(
+                constants=constants,
+                functions={**(defined_functions or {}), **parsed_functions},
+                **limits,
+            ).parse(equation)
+        )
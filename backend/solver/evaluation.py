@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+from typing import Callable, Optional
+import math
+
+from sympy import (
+    N, Basic, Expr, Float,
+    sin, cos, tan, cot, sec, csc,
+    asin, acos, atan, acot,
+    sinh, cosh, tanh, asinh, acosh, atanh,
+    exp, log, Abs, floor, ceiling, factorial, gamma,
+)
+
+__all__ = (
+    'MACHINE_DIGITS',
+    'machine_float',
+    'evaluate',
+)
+
+# the significant digits a float64 holds
+MACHINE_DIGITS = 15
+# the relative error that a float64 evaluation may have accumulated, beyond which `N` evaluates instead
+TOLERANCE = 1e-14
+# the relative error of a rounded float64 operation
+_EPS = 2.0 ** -53
+
+_MATH: dict[type[Basic], Callable[[float], float]] = {
+    sin: math.sin,
+    cos: math.cos,
+    tan: math.tan,
+    cot: lambda x: 1 / math.tan(x),
+    sec: lambda x: 1 / math.cos(x),
+    csc: lambda x: 1 / math.sin(x),
+    asin: math.asin,
+    acos: math.acos,
+    atan: math.atan,
+    acot: lambda x: math.atan(1 / x),
+    sinh: math.sinh,
+    cosh: math.cosh,
+    tanh: math.tanh,
+    asinh: math.asinh,
+    acosh: math.acosh,
+    atanh: math.atanh,
+    exp: math.exp,
+    log: math.log,
+    Abs: abs,
+    factorial: lambda n: math.gamma(n + 1),
+    gamma: math.gamma,
+}
+
+class _NotMachine(Exception):
+    """The expression leaves the real float64 numbers, ex. `sqrt(-1)` or `10^400`,
+    or loses too many digits in float64, ex. `cos(10^-9) - 1`"""
+
+def _condition(f: Callable[[float], float], x: float, y: float, /) -> float:
+    """How much `f` magnifies a relative error of its argument around `x`, where `f(x) = y`"""
+    h = max(abs(x), 1.0) * 2.0 ** -20
+    derivative = (f(x + h) - f(x - h)) / (2 * h)
+    return abs(x * derivative / y)
+
+def _machine(expr: Basic, /) -> tuple[float, float]:
+    """The float64 value of `expr`, along with an estimate of its relative error
+
+    * a zero value is only returned when exact, as a zero that results from rounding has no correct digits
+    """
+    if expr.is_Integer:
+        value, error = float(expr), 0.0 if abs(expr) <= 2 ** 53 else _EPS # type: ignore
+    elif expr.is_Float:
+        # the Floats of decimals are exactly their float64 value
+        value, error = float(expr), 0.0 if expr._prec <= 53 else _EPS # type: ignore
+    elif expr.is_Number or expr.is_NumberSymbol:
+        value, error = float(expr), _EPS # type: ignore
+    elif expr.is_Add:
+        terms = [_machine(arg) for arg in expr.args]
+        value = math.fsum(v for v, _ in terms)
+        absolute = sum(abs(v) * e for v, e in terms) + _EPS * abs(value)
+        if value == 0:
+            if absolute:
+                raise _NotMachine
+            return 0.0, 0.0
+        error = absolute / abs(value)
+    elif expr.is_Mul:
+        factors = [_machine(arg) for arg in expr.args]
+        value = math.prod(v for v, _ in factors)
+        if value == 0:
+            # exactly zero only through an exact zero factor
+            if not any(v == 0 and e == 0 for v, e in factors):
+                raise _NotMachine
+            return 0.0, 0.0
+        error = sum(e for _, e in factors) + len(factors) * _EPS
+    elif expr.is_Pow:
+        (base, base_error), (exponent, exponent_error) = map(_machine, expr.args)
+        value = base ** exponent
+        if base == 0:
+            raise _NotMachine
+        error = abs(exponent) * base_error + abs(exponent * math.log(abs(base))) * exponent_error + _EPS
+    elif expr.func in (floor, ceiling):
+        x, x_error = _machine(expr.args[0])
+        value = math.floor(x) if expr.func is floor else math.ceil(x)
+        # the rounding error of the argument may cross an integer
+        if min(x - math.floor(x), math.ceil(x) - x) <= 4 * abs(x) * x_error:
+            raise _NotMachine
+        error = 0.0
+    elif (f := _MATH.get(expr.func)) is not None: # type: ignore
+        x, x_error = _machine(expr.args[0])
+        value = f(x)
+        if value == 0:
+            raise _NotMachine
+        error = (_condition(f, x, value) * x_error if x_error else 0.0) + 2 * _EPS
+    else:
+        # ex. sums and products, which evaluate their terms in batches themselves
+        evaluated = expr.evalf(MACHINE_DIGITS)
+        if not evaluated.is_Float:
+            raise _NotMachine
+        value, error = float(evaluated), 10.0 ** -MACHINE_DIGITS
+
+    # a negative base to a fractional power is complex
+    if not isinstance(value, (float, int)) or not math.isfinite(value) or value == 0:
+        raise _NotMachine
+    return float(value), error
+
+def machine_float(expr: Basic, /) -> Optional[float]:
+    """Evaluates a numeric expression in float64 by walking its tree with the `math` functions,
+    or `None` when it is not real, falls outside of the float64 range or loses digits to cancellation
+
+    * the relative error is estimated along the way from the rounding of every operation,
+      magnified by the condition of the functions, ex. `sqrt(10^20 + 1) - 10^10` cancels every digit
+    """
+    try:
+        value, error = _machine(expr)
+    except (_NotMachine, ArithmeticError, ValueError, TypeError, RecursionError):
+        return None
+    return value if error <= TOLERANCE else None
+
+def _numeric_subtrees(expr: Basic, found: dict[Basic, Float], digits: int, /) -> None:
+    """Evaluates the largest subtrees of `expr` without free symbols in float64, into `found`"""
+    if expr.is_Atom:
+        return
+    if not expr.free_symbols:
+        if (value := machine_float(expr)) is not None:
+            found[expr] = Float(value, digits)
+        return
+    for arg in expr.args:
+        _numeric_subtrees(arg, found, digits)
+
+def evaluate(expr: Basic, digits: Optional[int] = None, /) -> Basic:
+    """`N(expr, digits)`, through float64 up to `MACHINE_DIGITS` rather than mpmath
+
+    * the numeric subtrees are evaluated in float64 and replaced, leaving `N` with only the
+      coefficients to convert; those that are not real (or overflow) are still evaluated by `N`
+    * beyond `MACHINE_DIGITS`, the decimals of the expression should be exact for the digits to be correct,
+      see `Parser(exact=True)`
+    """
+    if digits is not None and digits > MACHINE_DIGITS:
+        return N(expr, digits)
+    digits = digits or MACHINE_DIGITS
+    if not isinstance(expr, Expr) or expr.is_Atom:
+        return N(expr, digits)
+
+    if not expr.free_symbols:
+        value = machine_float(expr)
+        return Float(value, digits) if value is not None else N(expr, digits)
+    found: dict[Basic, Float] = {}
+    _numeric_subtrees(expr, found, digits)
+    return N(expr.xreplace(found), digits)
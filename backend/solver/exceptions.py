@@ -8,6 +8,11 @@ __all__ = (
     'NumberLiteralOverflow',
     'ExponentOverflow',
     'FactorialOverflow',
+    'InputLengthOverflow',
+    'TokenCountOverflow',
+    'AstDepthOverflow',
+    'AstNodeOverflow',
+    'TermCountOverflow',
     'MathTimeout',
     'InvalidDomainParsed',
     'InvalidFunctionArgument',
@@ -41,6 +46,26 @@ class FactorialOverflow(SolverOverflow):
     def __init__(self, value: Expr, max_value: float) -> None:
         super().__init__(f'An expression with a value of {value} exceeds the maximum allowed factorial of: {max_value}.')
 
+class InputLengthOverflow(SolverOverflow):
+    def __init__(self, length: int, max_value: float) -> None:
+        super().__init__(f'Input of length {length} exceeds the maximum allowed length of: {max_value}.')
+
+class TokenCountOverflow(SolverOverflow):
+    def __init__(self, max_value: float) -> None:
+        super().__init__(f'Input exceeds the maximum allowed amount of tokens: {max_value}.')
+
+class AstDepthOverflow(SolverOverflow):
+    def __init__(self, max_value: float) -> None:
+        super().__init__(f'Expression exceeds the maximum allowed nesting depth of: {max_value}.')
+
+class AstNodeOverflow(SolverOverflow):
+    def __init__(self, max_value: float) -> None:
+        super().__init__(f'Expression exceeds the maximum allowed amount of terms: {max_value}.')
+
+class TermCountOverflow(SolverOverflow):
+    def __init__(self, value: Expr, max_value: float) -> None:
+        super().__init__(f'A sum or product of {value} terms exceeds the maximum allowed amount of terms: {max_value}.')
+
 class MathTimeout(SolverException):
     def __init__(self, timeout: float, /) -> None:
         super().__init__(self, f'Processing exceeded the set time limit of {timeout}s')
@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+from typing import Any, Iterator, Optional, TypeAlias
+from contextlib import contextmanager
+from contextvars import ContextVar
+import tempfile
+import fcntl
+import stat
+import threading
+import json
+import math
+import time
+import os
+
+__all__ = (
+    'Metrics',
+    'metrics',
+    'stage_timings',
+    'is_alive',
+    'private_directory',
+)
+
+Labels: TypeAlias = tuple[tuple[str, str], ...]
+
+# when set, also collects the stage durations of the current request (see `backend.profiling`)
+stage_timings: ContextVar[Optional[dict[str, float]]] = ContextVar('stage_timings', default=None)
+
+# the values of the processes that exited, folded together
+RETIRED = 'retired.json'
+
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, math.inf)
+
+def _key(name: str, labels: dict[str, str]) -> str:
+    return json.dumps([name, sorted(labels.items())])
+
+def _format_labels(labels: Labels | list[list[str]], **extra: str) -> str:
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+def private_directory() -> str:
+    """A directory in the temp dir only readable by this user, shared by the processes of this deployment
+    (the hypercorn workers of a node share their parent process)
+
+    * raises `PermissionError` if someone else created it, or could write to it
+    """
+    path = os.path.join(tempfile.gettempdir(), f'math-solver-{os.getuid()}-{os.getppid()}')
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(f'{path} is not a private directory')
+    return path
+
+def is_alive(pid: int, /) -> bool:
+    """Whether the process `pid` is running"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _merge(total: dict[str, Any], snapshot: dict[str, Any], /) -> None:
+    """Adds the histograms and counters of `snapshot` to `total`"""
+    histograms, counters = total['histograms'], total['counters']
+    for key, values in snapshot['histograms'].items():
+        histograms[key] = [a + b for a, b in zip(histograms.get(key, [0] * len(values)), values)]
+    for key, value in snapshot['counters'].items():
+        counters[key] = counters.get(key, 0) + value
+
+def _format_bound(bound: float) -> str:
+    return '+Inf' if bound == math.inf else repr(bound)
+
+class Metrics:
+    """Latency histograms, counters and gauges, in the Prometheus text format
+
+    * every process periodically writes its own values to `directory`,
+      and `render` sums the values of all processes sharing that directory
+      (only of the live ones for gauges)
+    """
+
+    def __init__(self, /, directory: Optional[str] = None, *, flush_interval: float = 1.0) -> None:
+        self._directory = directory or os.getenv('SOLVER_METRICS_DIR')
+        self.flush_interval = flush_interval
+
+        self._histograms: dict[str, list[float]] = {}
+        self._counters: dict[str, float] = {}
+        self._gauges: dict[str, float] = {}
+        self._ratios: dict[str, tuple[str, str]] = {}
+        self._lock = threading.Lock()
+        self._flushed_at = 0.0
+
+    @property
+    def directory(self, /) -> str:
+        """The directory shared by the processes of this deployment, private to this user by default"""
+        if self._directory is None:
+            self._directory = os.path.join(private_directory(), 'metrics')
+        return self._directory
+
+    def _process_files(self, /) -> list[str]:
+        """The files of the processes in `directory`, skipping any other file"""
+        return [
+            file for file in os.listdir(self.directory)
+            if file.endswith('.json') and file.removesuffix('.json').isdigit()
+        ]
+
+    def observe(self, name: str, value: float, /, **labels: str) -> None:
+        """Records `value` in the histogram `name`"""
+        key = _key(name, labels)
+        with self._lock:
+            # bucket counts, then the sum and the count
+            histogram = self._histograms.setdefault(key, [0] * (len(BUCKETS) + 2))
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram[i] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def inc(self, name: str, /, amount: float = 1, **labels: str) -> None:
+        """Increments the counter `name`"""
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set(self, name: str, value: float, /, **labels: str) -> None:
+        """Sets the gauge `name` of this process"""
+        key = _key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def ratio(self, name: str, numerator: str, denominator: str, /) -> None:
+        """Renders the gauge `name` as the ratio of two counters over all processes, per set of labels"""
+        self._ratios[name] = (numerator, denominator)
+
+    def stage(self, stage: str, seconds: float, /) -> None:
+        """Records the duration of a solver stage"""
+        self.observe('solver_stage_seconds', seconds, stage=stage)
+        if (timings := stage_timings.get()) is not None:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def timer(self, stage: str, /) -> Iterator[None]:
+        """Times a block (or function, as a decorator) as `stage`, counting the errors it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc('solver_stage_errors_total', stage=stage)
+            raise
+        finally:
+            self.stage(stage, time.perf_counter() - start)
+
+    def snapshot(self, /) -> dict[str, Any]:
+        with self._lock:
+            return {
+                'histograms': {k: list(v) for k, v in self._histograms.items()},
+                'counters': dict(self._counters),
+                'gauges': dict(self._gauges),
+            }
+
+    def flush(self, /, *, force: bool = False) -> None:
+        """Writes this process' values for the other processes to aggregate"""
+        if not force and time.monotonic() - self._flushed_at < self.flush_interval:
+            return
+        self._flushed_at = time.monotonic()
+
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(path + '.tmp', path)
+
+    def _read(self, file: str, /) -> Optional[dict[str, Any]]:
+        try:
+            with open(os.path.join(self.directory, file)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _retire(self, /) -> None:
+        """Folds the counters and histograms of the processes that exited into a single file,
+        removing theirs, so that restarted workers do not leave files behind"""
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            dead = [file for file in self._process_files() if not is_alive(int(file.removesuffix('.json')))]
+            if not dead:
+                return
+            retired = self._read(RETIRED) or {'histograms': {}, 'counters': {}}
+            for file in dead:
+                if (snapshot := self._read(file)) is not None:
+                    _merge(retired, snapshot)
+            path = os.path.join(self.directory, RETIRED)
+            with open(path + '.tmp', 'w') as f:
+                json.dump(retired, f)
+            os.replace(path + '.tmp', path)
+            for file in dead:
+                os.remove(os.path.join(self.directory, file))
+
+    def _aggregate(self, /) -> dict[str, Any]:
+        self.flush(force=True)
+        self._retire()
+
+        aggregate: dict[str, Any] = {'histograms': {}, 'counters': {}, 'gauges': {}}
+        for file in [RETIRED, *self._process_files()]:
+            if (snapshot := self._read(file)) is None:
+                continue
+            _merge(aggregate, snapshot)
+            if file != RETIRED:
+                gauges = aggregate['gauges']
+                for key, value in snapshot.get('gauges', {}).items():
+                    gauges[key] = gauges.get(key, 0) + value
+        return aggregate
+
+    def render(self, /) -> str:
+        """Renders the values of all processes in the Prometheus text exposition format"""
+        aggregate = self._aggregate()
+        lines: list[str] = []
+        typed: set[str] = set()
+
+        for key, values in sorted(aggregate['histograms'].items()):
+            name, labels = json.loads(key)
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {name} histogram')
+            for bound, count in zip(BUCKETS, values):
+                lines.append(f'{name}_bucket{_format_labels(labels, le=_format_bound(bound))} {count}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {values[-2]}')
+            lines.append(f'{name}_count{_format_labels(labels)} {values[-1]}')
+
+        for key, value in sorted(aggregate['counters'].items()):
+            name, labels = json.loads(key)
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {name} counter')
+            lines.append(f'{name}{_format_labels(labels)} {value}')
+
+        for key, value in sorted(aggregate['gauges'].items()):
+            name, labels = json.loads(key)
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name}{_format_labels(labels)} {value}')
+
+        for ratio, (numerator, denominator) in sorted(self._ratios.items()):
+            for key, total in sorted(aggregate['counters'].items()):
+                name, labels = json.loads(key)
+                if name != denominator or not total:
+                    continue
+                if ratio not in typed:
+                    typed.add(ratio)
+                    lines.append(f'# TYPE {ratio} gauge')
+                part = aggregate['counters'].get(_key(numerator, dict(labels)), 0)
+                lines.append(f'{ratio}{_format_labels(labels)} {part / total}')
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
@@ -2,10 +2,13 @@ from __future__ import annotations
 
 from typing import (
     TYPE_CHECKING, Any,
-    TypeAlias, ClassVar, NoReturn, Optional, Callable, Iterable,
+    TypeAlias, ClassVar, NoReturn, Optional, Callable, Iterable, Iterator,
 )
 from decimal import Decimal
+from functools import cache
+import itertools
 import inspect
+import time
 
 from rply import Token, ParserGenerator
 from rply.lexer import SourcePosition, LexingError
@@ -15,10 +18,12 @@ from sympy import (
     N, E, I, pi, GoldenRatio, oo,
     functions as func_mod,
     NumberSymbol,
+    Rational,
 )
 
 from .lexer import LexerGenerator
 from .exceptions import *
+from .metrics import metrics
 from .ast import *
 
 if TYPE_CHECKING:
@@ -31,8 +36,11 @@ __all__ = (
     'Constants',
 )
 
+# the nesting levels an absolute value counts for, see `Parser.check_tree`
+ABS_DEPTH = 8
+
 Functions: TypeAlias = dict[str, Callable[..., Any]]
-Constants: TypeAlias = dict[str, Decimal | NumberSymbol | int] | dict[str, float]
+Constants: TypeAlias = dict[str, Decimal | Rational | NumberSymbol | int] | dict[str, float]
 
 def _to_camel_case(string: str) -> str:
     """Converts identifier from snake_case to camelCase
@@ -42,6 +50,11 @@ def _to_camel_case(string: str) -> str:
     terms = iter(string.split('_'))
     return next(terms).lower() + ''.join(t.title() for t in terms)
 
+@cache
+def _sympy_functions() -> Functions:
+    """Every member of `sympy.functions` by its camelCase name, collected once per process"""
+    return {_to_camel_case(k): v for k, v in inspect.getmembers(func_mod)}
+
 class Parser:
     GREEK_LETTERS: ClassVar[list[str]] = [
         'alpha', 'beta', 'gamma', 'delta', 'epsilon', 'zeta', 'eta', 'theta',
@@ -77,12 +90,28 @@ class Parser:
         max_number: Optional[float] = None,
         max_exponent: Optional[float] = None,
         max_factorial: Optional[float] = None,
+        max_terms: Optional[float] = None,
+
+        max_length: Optional[float] = None,
+        max_tokens: Optional[float] = None,
+        max_depth: Optional[float] = None,
+        max_nodes: Optional[float] = None,
+
+        exact: bool = False,
     ) -> None:
         self.is_parsing_function = is_parsing_function
+        # decimals (literals and constants) as exact rationals, for arbitrary precision evaluation
+        self.exact = exact
 
         self._max_number = max_number if max_number is not None else float('inf')
         self._max_exponent = max_exponent if max_exponent is not None else float('inf')
         self._max_factorial = max_factorial if max_factorial is not None else float('inf')
+        self._max_terms = max_terms if max_terms is not None else float('inf')
+
+        self._max_length = max_length if max_length is not None else float('inf')
+        self._max_tokens = max_tokens if max_tokens is not None else float('inf')
+        self._max_depth = max_depth if max_depth is not None else float('inf')
+        self._max_nodes = max_nodes if max_nodes is not None else float('inf')
 
         def _round(x: Expr, place: Optional[int] = None) -> Expr:
             try:
@@ -116,7 +145,7 @@ class Parser:
             'arcsech': func_mod.asech,
             'arccoth': func_mod.acoth,
 
-            **{_to_camel_case(k): v for k, v in inspect.getmembers(func_mod)},
+            **_sympy_functions(),
             **(functions or {})
         }
         self.constants = {**{
@@ -135,21 +164,95 @@ class Parser:
             'Φ': GoldenRatio,
             '∞': oo,
         },
-            **({k: Decimal(str(v)) if isinstance(v, float) else v for k, v in constants.items()}
+            **({k: self._decimal(v) if isinstance(v, float) else v for k, v in constants.items()}
             if constants else {})
         }
 
         self.variables: list[Variable] = []
 
-        self._lexer: Lexer = self.lg.build()
-        self._parser: LRParser = self.pg.build()
+    def _decimal(self, value: float, /) -> Decimal | Rational:
+        return Rational(str(value)) if self.exact else Decimal(str(value))
+
+    @staticmethod
+    @cache
+    def _build() -> tuple[Lexer, LRParser]:
+        """Builds the lexer and the LR tables on first use, once per process
+
+        * both are stateless: the `Parser` instance is passed as the parsing state
+        """
+        return Parser.lg.build(), Parser.pg.build()
+
+    @staticmethod
+    def parse_functions(
+        functions: Iterable[str], /,
+        *,
+        constants: Optional[Constants] = None,
+        exact: bool = False,
+        **limits: Optional[float],
+    ) -> tuple[Functions, list[DefinedFunction]]:
+        """Parses user function definitions, ex. `f(x) = x^2`
+
+        Returns the callables by name, along with the parsed definitions
+        """
+        parsed_functions = {}
+        definitions = []
+        for f in functions:
+            parsed = Parser(
+                constants=constants,
+                is_parsing_function=True,
+                exact=exact,
+                **limits, # type: ignore
+            ).parse(f)
+            if not isinstance(parsed, DefinedFunction):
+                raise NotAFunction(f)
+            parsed_functions.update(parsed.eval())
+            definitions.append(parsed)
+        return parsed_functions, definitions
+
+    def _limit_tokens(self, tokens: Iterator[Token], /) -> Iterator[Token]:
+        lexing = 0.0
+        try:
+            for i in itertools.count():
+                start = time.perf_counter()
+                try:
+                    token = next(tokens)
+                except StopIteration:
+                    return
+                finally:
+                    lexing += time.perf_counter() - start
+                if i >= self._max_tokens:
+                    raise TokenCountOverflow(self._max_tokens)
+                yield token
+        finally:
+            metrics.stage('lex', lexing)
+
+    def check_tree(self, tree: Ast, /) -> None:
+        """Ensures the tree is within the depth and node limits, before it is evaluated
+
+        * an absolute value counts for `ABS_DEPTH` levels, as differentiating one doubles its argument
+          (into its real and imaginary parts), so nesting them grows the derivative exponentially
+        """
+        nodes = 0
+        stack = [(tree, 1)]
+        while stack:
+            node, depth = stack.pop()
+            if depth > self._max_depth:
+                raise AstDepthOverflow(self._max_depth)
+            if (nodes := nodes + 1) > self._max_nodes:
+                raise AstNodeOverflow(self._max_nodes)
+            levels = ABS_DEPTH if isinstance(node, Abs) else 1
+            stack.extend((child, depth + levels) for child in node.children())
 
     def parse(self, equation: str) -> Conditional | DefinedFunction | Interval:
+        if len(equation) > self._max_length:
+            raise InputLengthOverflow(len(equation), self._max_length)
         try:
-            return self._parser.parse(
-                self._lexer.lex(equation),
-                state=self
-            ) # type: ignore
+            lexer, parser = self._build()
+            with metrics.timer('parse'):
+                return parser.parse(
+                    self._limit_tokens(lexer.lex(equation)),
+                    state=self
+                ) # type: ignore
         except LexingError as e:
             pos: SourcePosition = e.getsourcepos()
             raise SyntaxError(f"Invalid token {e.message or ''} @ {pos.lineno}:{pos.colno}")
@@ -166,7 +269,8 @@ class Parser:
 
         f_name = name.getstr()
         arguments: list[Ast] = p[0][-1] if isinstance(p[0][-1], list) else [p[0][-1]]
-        return DefinedFunction(f_name, arguments, expr)
+        state.check_tree(function := DefinedFunction(f_name, arguments, expr))
+        return function
 
     @staticmethod
     @pg.production('interval : LBRACK expr COMMA expr RBRACK')
@@ -183,12 +287,14 @@ class Parser:
     @staticmethod
     @pg.production('equation : IDENT PIPE interval')
     @pg.production('equation : interval')
-    def domain_compound_interval(_, p: list[Interval]) -> Interval:
+    def domain_compound_interval(state: Parser, p: list[Interval]) -> Interval:
         if len(p) == 1:
-            return p[0]
+            interval = p[0]
         else:
             assert isinstance(p[0], Token)
-            return CompoundInterval(p[0].getstr(), p[2])
+            interval = CompoundInterval(p[0].getstr(), p[2])
+        state.check_tree(interval)
+        return interval
 
     @staticmethod
     @pg.production('equation : expr')
@@ -211,7 +317,10 @@ class Parser:
                 ('GT', 'EQ'): Ge,
             }[(p[1].gettokentype(), getattr(p[2], 'gettokentype', lambda: None)())](p[0], p[-1])
 
-        if isinstance(conditional.eval(), BooleanAtom):
+        state.check_tree(conditional)
+        with metrics.timer('eval'):
+            evaluated = conditional.evaluate()
+        if isinstance(evaluated, BooleanAtom):
             return BooleanResult(conditional)
         return conditional
 
@@ -258,7 +367,7 @@ class Parser:
     @staticmethod
     @pg.production('group : NUMBER')
     def number(state: Parser, p: list[Token], /) -> Number:
-        return Number(p[0].getstr(), state._max_number)
+        return Number(p[0].getstr(), state._max_number, exact=state.exact)
 
     @staticmethod
     @pg.production('expr : PIPE expr PIPE')
@@ -321,7 +430,7 @@ class Parser:
     @staticmethod
     @pg.production('expr : SUM SUBSCRIPT LPAREN var EQ group RPAREN POW group group')
     @pg.production('expr : PROD SUBSCRIPT LPAREN var EQ group RPAREN POW group group')
-    def summation_product(_, p: list[Ast], /) -> Summation:
+    def summation_product(state: Parser, p: list[Ast], /) -> Summation:
         if isinstance(variables := p[3], map):
             variable = Variable(''.join(x.value for x in variables))
         elif isinstance(constant := p[3], Constant):
@@ -332,9 +441,9 @@ class Parser:
 
         assert isinstance(tok := p[0], Token)
         if tok.gettokentype() == 'SUM':
-            return Summation(variable, p[5], p[-2], p[-1])
+            return Summation(variable, p[5], p[-2], p[-1], state._max_terms)
         else:
-            return Product(variable, p[5], p[-2], p[-1])
+            return Product(variable, p[5], p[-2], p[-1], state._max_terms)
 
     @pg.production('arguments : expr')
     def arguments_start(_, p: list[Ast]) -> Ast:
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+from typing import Callable, Literal, NamedTuple, TypeAlias
+import time
+
+from sympy import (
+    Expr, Basic,
+    cancel, together, trigsimp, powsimp, factor_terms,
+    simplify, count_ops, preorder_traversal,
+    Pow, exp,
+)
+from sympy.core.relational import Relational
+from sympy.functions.elementary.trigonometric import TrigonometricFunction
+from sympy.functions.elementary.hyperbolic import HyperbolicFunction
+
+from .metrics import metrics
+
+__all__ = (
+    'Tier',
+    'Simplified',
+    'expression_size',
+    'choose_tier',
+    'simplify_tiered',
+)
+
+# `full`: `sympy.simplify`, `targeted`: a few specific passes, `normalized`: cheap passes within a budget
+Tier: TypeAlias = Literal['full', 'targeted', 'normalized']
+
+# the largest (operations, tree nodes) simplified with each tier
+FULL_SIZE = (20, 60)
+TARGETED_SIZE = (80, 250)
+# seconds to spend normalizing a large expression
+NORMALIZE_BUDGET = 0.5
+
+class Simplified(NamedTuple):
+    expr: Basic
+    tier: Tier
+
+def expression_size(expr: Basic, /) -> tuple[int, int]:
+    """The number of operations (`count_ops`) and nodes in the tree of `expr`"""
+    return count_ops(expr), sum(1 for _ in preorder_traversal(expr))
+
+def choose_tier(expr: Basic, /) -> Tier:
+    """The tier for `expr`, as the cost of `simplify` grows very steeply with its size"""
+    ops, nodes = expression_size(expr)
+    if ops <= FULL_SIZE[0] and nodes <= FULL_SIZE[1]:
+        return 'full'
+    if ops <= TARGETED_SIZE[0] and nodes <= TARGETED_SIZE[1]:
+        return 'targeted'
+    return 'normalized'
+
+def _targeted_passes(expr: Expr, /) -> list[Callable[[Expr], Expr]]:
+    """The passes worth trying on `expr`, skipping those with nothing to act on"""
+    passes: list[Callable[[Expr], Expr]] = []
+    if any(power.exp.is_negative for power in expr.atoms(Pow)):
+        passes += [cancel, together]
+    if expr.has(TrigonometricFunction, HyperbolicFunction):
+        passes.append(trigsimp)
+    if expr.has(Pow, exp):
+        passes.append(powsimp)
+    return passes
+
+def _apply(
+    expr: Expr,
+    passes: list[Callable[[Expr], Expr]], /,
+    deadline: float = float('inf'),
+) -> Expr:
+    """Applies each pass in turn, keeping its result only if it has no more operations,
+    and stopping at the deadline"""
+    best, best_ops = expr, count_ops(expr)
+    for simplify_pass in passes:
+        if time.monotonic() >= deadline:
+            break
+        try:
+            result = simplify_pass(best)
+        except Exception:
+            continue
+        if (ops := count_ops(result)) <= best_ops:
+            best, best_ops = result, ops
+    return best
+
+def _simplify_expr(expr: Expr, tier: Tier, deadline: float, /) -> Expr:
+    if tier == 'full':
+        return simplify(expr)
+    if tier == 'targeted':
+        return _apply(expr, _targeted_passes(expr))
+    # near linear in the size of the tree
+    return _apply(expr, [factor_terms, powsimp], deadline)
+
+def simplify_tiered(expr: Basic, /, *, budget: float = NORMALIZE_BUDGET) -> Simplified:
+    """Simplifies `expr` with the tier chosen by its size
+
+    * relations are simplified side by side below the `full` tier
+    * the `normalized` tier starts no pass after `budget` seconds
+    """
+    tier = choose_tier(expr)
+    metrics.inc('simplify_tier_total', tier=tier)
+    deadline = time.monotonic() + budget
+
+    if tier == 'full':
+        return Simplified(simplify(expr), tier)
+    if isinstance(expr, Relational):
+        lhs = _simplify_expr(expr.lhs, tier, deadline) # type: ignore
+        rhs = _simplify_expr(expr.rhs, tier, deadline) # type: ignore
+        return Simplified(type(expr)(lhs, rhs), tier)
+    if isinstance(expr, Expr):
+        return Simplified(_simplify_expr(expr, tier, deadline), tier)
+    # ex. sets, which only `simplify` knows how to handle
+    return Simplified(expr, tier)
@@ -1,40 +1,64 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Optional, ClassVar, Any
+from typing import TYPE_CHECKING, Optional, ClassVar, Any, Callable, Iterator, Sequence
+from types import ModuleType
+from dataclasses import dataclass
+from contextlib import contextmanager
 from functools import cache, cached_property
-from contextlib import redirect_stdout
-from io import StringIO, BytesIO
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from io import BytesIO
+import inspect
+import operator
 import warnings
+import time
+import os
 
-import matplotlib
-matplotlib.use('agg')
-from matplotlib import pyplot as plt
-
-import numpy as np
 from sympy import (
-    N, oo,
+    S, oo,
     Reals,
-    pprint,
+    pretty,
     Symbol,
     Derivative,
-    Interval, Range, Set,
+    Interval, Range, Set, FiniteSet, Union, ImageSet,
     latex as s_latex,
-    diff, factor, expand, simplify,
-    maximum, minimum,
+    diff, factor, expand,
+    limit, lambdify, nsolve, Float, ConditionSet,
+    Sum, Product,
     solve as s_solve,
     solveset as s_solveset,
     Eq, Ne, Ge, Le, Gt, Lt,
 )
-from sympy.calculus.util import function_range, continuous_domain
+from sympy.calculus.util import continuous_domain, periodicity
 from sympy.core.relational import Relational
 from sympy.logic.boolalg import BooleanAtom
+from sympy.utilities.iterables import iterable
 
 from .parser import Parser, Constants, Functions
-from .ast import Ast, CompoundInterval, DefinedFunction, BooleanResult, Equation, Expr
+from .ast import Ast, CompoundInterval, BooleanResult, Equation, Expr
 from .exceptions import *
+from .metrics import metrics
+from .summation import sample, vectorizable, vectorize
+from .simplification import Simplified, simplify_tiered
+from .evaluation import MACHINE_DIGITS, evaluate
 
 if TYPE_CHECKING:
+    from matplotlib.axes import Axes
     from matplotlib.text import Text
+    from numpy import ndarray
+
+# the solvers raced by `Solver(numeric_budget=...)`; a symbolic solver that loses keeps its thread
+# until it finishes (threads cannot be stopped), so there are at most this many at once,
+# while the numeric root finders, which always finish quickly, have their own threads
+_SYMBOLIC_POOL = ThreadPoolExecutor(4 * (os.cpu_count() or 1), thread_name_prefix='symbolic-solver')
+_NUMERIC_POOL = ThreadPoolExecutor(os.cpu_count() or 1, thread_name_prefix='numeric-solver')
+
+@cache
+def _pyplot() -> ModuleType:
+    """Imports pyplot on first graph use, so processes that only solve never load matplotlib"""
+    import matplotlib
+    matplotlib.use('agg')
+    from matplotlib import pyplot
+    return pyplot
 
 class BooleanComp:
     def __init__(self, lhs: Expr, typ: Relational, rhs: Expr, /) -> None:
@@ -56,10 +80,126 @@ class BooleanComp:
         }.get(self.typ, self.typ.__name__) # type: ignore
         return f'{Solver.to_latex(self.lhs)}{key}{Solver.to_latex(self.rhs)}'
 
+@dataclass
+class FunctionAnalysis:
+    """Continuity and critical points of a function w.r.t. a single variable
+
+    * computed once per `Solver` and shared by the domain, range and max/min
+    * the singularities are left out of `continuous_domain`, whose intervals the range is computed over,
+      with limits at their open bounds
+    """
+    function: Expr
+    symbol: Symbol
+    domain: Set
+    derivative: Expr
+
+    @cached_property
+    def continuous_domain(self, /) -> Set:
+        """The subset of the domain on which the function is defined and continuous"""
+        return continuous_domain(self.function, self.symbol, self.domain) # type: ignore
+
+    @cached_property
+    def period(self, /) -> Optional[Expr]:
+        return periodicity(self.function, self.symbol)
+
+    @cached_property
+    def search_domain(self, /) -> Set:
+        """The continuous domain that critical points are searched in,
+        narrowed down to a single period for unbounded periodic functions"""
+        if (period := self.period) is not None and any(
+            isinstance(d, Interval) and (d.inf - d.sup).is_infinite
+            for d in (self.domain.args if isinstance(self.domain, Union) else (self.domain,))
+        ):
+            return continuous_domain(self.function, self.symbol, Interval(0, period)) # type: ignore
+        return self.continuous_domain
+
+    @cached_property
+    def critical_points(self, /) -> Set:
+        """Zeros of the derivative within the search domain"""
+        return s_solveset(self.derivative, self.symbol, self.search_domain)
+
+    def function_range(self, /) -> Set:
+        """Equivalent of `sympy.calculus.util.function_range` using the shared analysis"""
+        f, symbol = self.function, self.symbol
+        if self.domain is S.EmptySet:
+            return S.EmptySet
+        if self.period == S.Zero:
+            return FiniteSet(f.expand()) # type: ignore
+
+        intervals = self.search_domain
+        if isinstance(intervals, (Interval, FiniteSet)):
+            interval_iter = (intervals,)
+        elif isinstance(intervals, Union):
+            interval_iter = intervals.args
+        else:
+            raise NotImplementedError('Unable to find range for the given domain.')
+
+        critical_points = self.critical_points
+        if not iterable(critical_points):
+            raise NotImplementedError(f'Unable to find critical points for {f}')
+        if isinstance(critical_points, ImageSet):
+            raise NotImplementedError(f'Infinite number of critical points for {f}')
+
+        range_ = S.EmptySet
+        for interval in interval_iter:
+            if isinstance(interval, FiniteSet):
+                for singleton in interval:
+                    if singleton in self.domain:
+                        range_ += FiniteSet(f.subs(symbol, singleton)) # type: ignore
+            elif isinstance(interval, Interval):
+                vals = S.EmptySet
+                critical_values = S.EmptySet
+                bounds = (
+                    (interval.left_open, interval.inf, '+'),
+                    (interval.right_open, interval.sup, '-'),
+                )
+                for is_open, limit_point, direction in bounds:
+                    if is_open:
+                        critical_values += FiniteSet(limit(f, symbol, limit_point, direction))
+                        vals += critical_values
+                    else:
+                        vals += FiniteSet(f.subs(symbol, limit_point)) # type: ignore
+
+                for point in critical_points:
+                    if interval.contains(point) is S.true:
+                        vals += FiniteSet(f.subs(symbol, point)) # type: ignore
+
+                left_open = right_open = False
+                if critical_values is not S.EmptySet:
+                    left_open = critical_values.inf == vals.inf
+                    right_open = critical_values.sup == vals.sup
+                range_ += Interval(vals.inf, vals.sup, left_open, right_open)
+            else:
+                raise NotImplementedError('Unable to find range for the given domain.')
+        return range_
+
 class Solver:
     GRAPH_AXES_COLOR: ClassVar[str] = '#413939'
     GRAPH_LINE_COLOR: ClassVar[str] = '#EFB8CA'
     GRAPH_GRID_COLOR: ClassVar[str] = '#634848'
+    # the equation, followed by its overlays in turn
+    GRAPH_SERIES_COLORS: ClassVar[tuple[str, ...]] = (
+        GRAPH_LINE_COLOR, '#8FC1E3', '#B5D99C', '#F2C57C', '#C3A6E0',
+    )
+    # seconds to spend evaluating the grid of an implicit plot, and the bounds of its resolution per axis
+    GRAPH_GRID_BUDGET: ClassVar[float] = 0.25
+    GRAPH_GRID_RESOLUTION: ClassVar[tuple[int, int]] = (64, 1000)
+    # where `lhs <op> 0` holds for each inequality, filled on implicit plots
+    GRAPH_REGIONS: ClassVar[dict[type[Relational], Callable[[Any, Any], Any]]] = {
+        Gt: operator.gt,
+        Ge: operator.ge,
+        Lt: operator.lt,
+        Le: operator.le,
+        Ne: operator.ne,
+    }
+    # significant digits of `evaluated_equation`, beyond which mpmath gets slow
+    MAX_PRECISION: ClassVar[int] = 1000
+    # seconds that the symbolic solver may be given before falling back to the numeric roots
+    MAX_NUMERIC_BUDGET: ClassVar[float] = 60.0
+    # the window sampled for numeric roots where the domain is unbounded, and the most points sampled in it
+    NUMERIC_XRANGE: ClassVar[tuple[float, float]] = (-20, 20)
+    MAX_NUMERIC_SAMPLES: ClassVar[int] = 200_000
+    MAX_NUMERIC_ROOTS: ClassVar[int] = 200
 
     def __init__(
         self, /,
@@ -69,40 +209,66 @@ class Solver:
         solve_for: Optional[str] = None,
         functions: Optional[list[str]] = None,
         constants: Optional[Constants] = None,
+        defined_functions: Optional[Functions] = None,
         parser: Optional[Parser] = None,
         max_number: Optional[float] = 9e25,
         max_exponent: Optional[float] = 256,
         max_factorial: Optional[float] = 1024,
+        max_terms: Optional[float] = 100_000,
+        max_length: Optional[float] = 2048,
+        max_tokens: Optional[float] = 1024,
+        max_depth: Optional[float] = 64,
+        max_nodes: Optional[float] = 4096,
+        numeric_budget: Optional[float] = None,
+        precision: Optional[int] = None,
     ) -> None:
         self.raw_equation = equation
         self._final_ast: Optional[Ast] = None
 
+        if numeric_budget is not None and not 0 <= numeric_budget <= self.MAX_NUMERIC_BUDGET:
+            raise ValueError(f'The numeric budget must be between 0 and {self.MAX_NUMERIC_BUDGET}s')
+        self.numeric_budget = numeric_budget
+        if precision is not None and not 1 <= precision <= self.MAX_PRECISION:
+            raise ValueError(f'The precision must be between 1 and {self.MAX_PRECISION} digits')
+        self.precision = precision
+        self.approximate = False
+        # what an approximate solution leaves out, ex. the roots outside of the sampled window
+        self.note: Optional[str] = None
+        # the interval that `numeric_solution` searched in
+        self.numeric_searched: Optional[tuple[float, float]] = None
+        self._latex_cache: dict[str, str] = {}
+
         self._max_number = max_number
         self._max_exponent = max_exponent
         self._max_factorial = max_factorial
+        self._max_depth = max_depth
         self._parser_limits = dict(
             max_number=self._max_number,
             max_exponent=self._max_exponent,
             max_factorial=self._max_factorial,
+            max_terms=max_terms,
+            max_length=max_length,
+            max_tokens=max_tokens,
+            max_depth=max_depth,
+            max_nodes=max_nodes,
         )
 
         with warnings.catch_warnings():
             warnings.simplefilter('ignore')
 
-            parsed_functions = {}
-            if functions:
-                for f in functions:
-                    parsed = Parser(
-                        constants=constants,
-                        is_parsing_function=True,
-                        **self._parser_limits, # type: ignore
-                    ).parse(f)
-                    if not isinstance(parsed, DefinedFunction):
-                        raise NotAFunction(f)
-                    parsed_functions.update(parsed.eval())
+            # beyond float64, decimals are kept exact so that every requested digit is correct
+            exact = precision is not None and precision > MACHINE_DIGITS
+            parsed_functions, _ = Parser.parse_functions(
+                functions or (),
+                constants=constants,
+                exact=exact,
+                **self._parser_limits,
+            )
             self.parser = parser or Parser(
                 constants=constants,
-                functions=parsed_functions,
+                exact=exact,
+                # precompiled definitions, ex. of a registered library, are not parsed again
+                functions={**(defined_functions or {}), **parsed_functions},
                 **self._parser_limits, # type: ignore
             )
             self.parsed_equation
@@ -113,7 +279,7 @@ class Solver:
                     self._domain = set_
                 else:
                     try:
-                        parsed = Parser(**self._parser_limits).parse(domain).eval() # type: ignore
+                        parsed = Parser(**self._parser_limits).parse(domain).evaluate() # type: ignore
                         if not isinstance(parsed, Set):
                             raise InvalidDomainParsed(domain)
                     except (SyntaxError, ValueError) as e:
@@ -129,51 +295,101 @@ class Solver:
         if self.solve_for is not None:
             self._kwargs['symbol'] = Symbol(self.solve_for)
 
-    def graph(self, /, *, xrange: tuple[float, float] = (-20, 20)) -> BytesIO:
-        fig = plt.figure(1, figsize=(10, 10))
-        ax = fig.add_subplot(1, 1, 1)
+    def free_variables(self, /) -> list[Symbol]:
+        """The variables not bound by a sum, product or limit, in order of appearance"""
+        free = self.lhs_equation.free_symbols # type: ignore
+        return list(dict.fromkeys(s for v in self.parser.variables if (s := v.eval()) in free))
+
+    def _variable(self, /) -> Symbol:
+        """The variable to solve for, or the first one not bound by a sum, product or limit"""
+        if 'symbol' in self._kwargs:
+            return self._kwargs['symbol']
+        symbols = self.free_variables() or [v.eval() for v in self.parser.variables]
+        return symbols[0]
+
+    def compile(self, /, *symbols: Symbol) -> Callable[..., ndarray]:
+        """Compiles the function (the LHS) once into a NumPy function of `symbols`,
+        with `NaN` where it is not real"""
+        if (f := vectorize(self.lhs_equation, symbols)) is None: # type: ignore
+            raise ValueError('Only finite sums and products can be evaluated on a grid')
+        return f
+
+    def _graph_domain(self, /, xrange: tuple[float, float]) -> ndarray:
+        """The points to sample every series of a graph at: the domain, within `xrange`"""
+        import numpy as np
 
-        try:
-            variable = self._kwargs.get(
-                'symbol',
-                self.parser.variables[0].eval()
-            )
-        except IndexError:
-            variable = None
-        def f(x):
-            if variable is not None:
-                val = self.lhs_equation.subs(variable, x) # type: ignore
-            else:
-                val = self.lhs_equation
-            try:
-                float(val) # type: ignore
-                return val
-            except TypeError:
-                return
-        fx = np.vectorize(f)
-
-        x = None
         if self._domain:
             try:
                 if isinstance(dom := self._domain, Range):
                     x1, x2, step = (
                         float(dom.start), float(dom.stop), float(dom.step) # type: ignore
                     )
-                    x = np.arange(x1, x2, step)
-                    print(x)
-                else:
-                    x1, x2 = float(self._domain.start), float(self._domain.end) # type: ignore
+                    return np.arange(x1, x2, step)
+                x1, x2 = float(self._domain.start), float(self._domain.end) # type: ignore
             except (TypeError, AttributeError):
                 x1, x2 = xrange
         else:
             x1, x2 = xrange
-        if x is None:
-            if x1 == float('-inf'):
-                x1 = xrange[0]
-            if x2 == float('inf'):
-                x2 = xrange[1]
-            x = np.linspace(x1, x2, 500)
+        if x1 == float('-inf'):
+            x1 = xrange[0]
+        if x2 == float('inf'):
+            x2 = xrange[1]
+        return np.linspace(x1, x2, 500)
+
+    @staticmethod
+    def _sample_function(expr: Expr, variable: Optional[Symbol], x: ndarray, /) -> ndarray:
+        """Samples a function of a single variable at every `x` in one vectorized call,
+        falling back to substituting each point when it can not be compiled"""
+        import numpy as np
+
+        if variable is not None and (y := sample(expr, variable, x)) is not None:
+            return y
+
+        def f(x):
+            if variable is not None:
+                val = expr.subs(variable, x) # type: ignore
+            else:
+                val = expr
+            try:
+                float(val) # type: ignore
+                return val
+            except TypeError:
+                return
+        return np.vectorize(f)(x)
 
+    def _sample_implicit(
+        self, /,
+        exprs: list[Expr],
+        variables: tuple[Symbol, Symbol],
+        xrange: tuple[float, float],
+    ) -> tuple[ndarray, ndarray, list[ndarray]]:
+        """Evaluates functions of two variables on a shared meshgrid, each in one vectorized call
+
+        * the resolution is the highest (within `GRAPH_GRID_RESOLUTION`) that keeps the evaluation
+          within `GRAPH_GRID_BUDGET` seconds, extrapolated from a coarse grid
+        """
+        import numpy as np
+
+        fs = []
+        for expr in exprs:
+            if (f := vectorize(expr, variables)) is None:
+                raise ValueError('Only finite sums and products can be evaluated on a grid')
+            fs.append(f)
+        low, high = self.GRAPH_GRID_RESOLUTION
+
+        def evaluate(n: int) -> tuple[ndarray, ndarray, list[ndarray]]:
+            axis = np.linspace(*xrange, n)
+            x, y = np.meshgrid(axis, axis)
+            return x, y, [f(x, y) for f in fs]
+
+        start = time.perf_counter()
+        x, y, zs = evaluate(low)
+        per_point = max(time.perf_counter() - start, 1e-9) / low ** 2
+        if (n := min(int((self.GRAPH_GRID_BUDGET / per_point) ** 0.5), high)) > low:
+            x, y, zs = evaluate(n)
+        return x, y, zs
+
+    def _draw_axes(self, ax: Axes, /) -> None:
         ax.spines['bottom'].set_position('zero') # type: ignore
         ax.spines['bottom'].set_color(self.GRAPH_AXES_COLOR)
 
@@ -190,45 +406,122 @@ class Solver:
             tick: Text
             tick.set_fontsize(8)
 
-        ax.plot(x, fx(x), color=self.GRAPH_LINE_COLOR)
+    def _draw_implicit(
+        self, ax: Axes, x: ndarray, y: ndarray, z: ndarray, /,
+        *,
+        color: str,
+        relation: type,
+    ) -> Any:
+        """Contours the curve of an equation, and fills the region of an inequality"""
+        import numpy as np
+
+        z = np.ma.masked_invalid(z)
+        if (region := self.GRAPH_REGIONS.get(relation)) is not None: # type: ignore
+            with np.errstate(invalid='ignore'):
+                inside = np.ma.masked_array(region(z.filled(np.nan), 0).astype(float), mask=z.mask)
+            ax.contourf(x, y, inside, levels=[0.5, 1.5], colors=[color], alpha=0.35)
+
+        # strict inequalities exclude their boundary
+        linestyle = 'dashed' if relation in (Gt, Lt, Ne) else 'solid'
+        return ax.contour(x, y, z, levels=[0], colors=[color], linestyles=linestyle)
+
+    def graph(
+        self, /,
+        *,
+        xrange: tuple[float, float] = (-20, 20),
+        overlays: Sequence[tuple[str, Expr]] = (),
+    ) -> BytesIO:
+        """Plots the function of a single variable,
+        or the curve (equation) or region (inequality) of a relation of two variables
+
+        * `overlays` are further labelled functions (ex. the derivative) of the same variables,
+          drawn in their own colors on the same axes and sampled at the same points
+        """
+        plt = _pyplot()
+
+        fig = plt.figure(1, figsize=(10, 10))
+        ax = fig.add_subplot(1, 1, 1)
 
-        arrow_fmt = dict(markersize=4, color=self.GRAPH_AXES_COLOR, clip_on=False)
-        ax.plot((1), (0), marker='>', transform=ax.get_yaxis_transform(), **arrow_fmt)
-        ax.plot((0), (1), marker='^', transform=ax.get_xaxis_transform(), **arrow_fmt)
+        try:
+            free = self.free_variables()
+        except Exception:
+            free = []
+        series = [(self.raw_equation, self.lhs_equation), *overlays]
+        colors = [
+            self.GRAPH_SERIES_COLORS[i % len(self.GRAPH_SERIES_COLORS)]
+            for i in range(len(series))
+        ]
+
+        with metrics.timer('graph_sample'):
+            if len(free) == 2:
+                # alphabetical, so that `x` is horizontal
+                variables = tuple(sorted(free, key=str))
+                x, y, zs = self._sample_implicit([e for _, e in series], variables, xrange) # type: ignore
+            else:
+                try:
+                    variable = self._variable()
+                except IndexError:
+                    variable = None
+                x = self._graph_domain(xrange)
+                ys = [self._sample_function(e, variable, x) for _, e in series] # type: ignore
+
+        with metrics.timer('graph_draw'):
+            self._draw_axes(ax)
+            handles = []
+            if len(free) == 2:
+                for i, z in enumerate(zs):
+                    # overlays are curves, only the equation itself may be a region
+                    relation = type(self.parsed_equation) if i == 0 else Eq
+                    contour = self._draw_implicit(ax, x, y, z, color=colors[i], relation=relation)
+                    handles.append(contour.legend_elements()[0][0])
+                ax.set_xlim(x.min(), x.max())
+                ax.set_ylim(y.min(), y.max())
+                ax.set_aspect('equal')
+            else:
+                for y, color in zip(ys, colors):
+                    handles.extend(ax.plot(x, y, color=color))
+            if overlays:
+                ax.legend(handles, [label for label, _ in series], loc='upper left', fontsize=8)
+
+            arrow_fmt = dict(markersize=4, color=self.GRAPH_AXES_COLOR, clip_on=False)
+            ax.plot((1), (0), marker='>', transform=ax.get_yaxis_transform(), **arrow_fmt)
+            ax.plot((0), (1), marker='^', transform=ax.get_xaxis_transform(), **arrow_fmt)
 
         buffer = BytesIO()
-        fig.savefig(buffer,
-            dpi=300,
-            bbox_inches='tight',
-            pad_inches=0,
-            transparent=True,
-        )
+        with metrics.timer('graph_encode'):
+            fig.savefig(buffer,
+                dpi=300,
+                bbox_inches='tight',
+                pad_inches=0,
+                transparent=True,
+            )
         plt.close()
         buffer.seek(0)
         return buffer
 
     @cached_property
+    @metrics.timer('derivative')
     def derivative(self, /) -> Derivative:
         """Returns the first derivative of the function: d/dx"""
         symbols = [self.solve_for] if self.solve_for else [v.eval() for v in self.parser.variables]
         return diff(self.lhs_equation, *set(symbols))
 
     @cached_property
+    @metrics.timer('lhs_equation')
     def lhs_equation(self, /) -> Expr:
         """Isolates all parts of the equation to the LHS <- (LHS - RHS = 0)"""
         if isinstance(a := self._final_ast, BooleanResult):
-            return a.conditional.left.eval() - a.conditional.right.eval()
+            return a.conditional.left.evaluate() - a.conditional.right.evaluate()
         return self.parsed_equation.lhs - self.parsed_equation.rhs # type: ignore
 
     @cached_property
+    @metrics.timer('parsed_equation')
     def parsed_equation(self, /) -> Equation | Interval | Functions:
         """Returns the parsed and evaluated equation from the Lexer -> Parser -> Ast"""
         self._final_ast = self.parser.parse(self.raw_equation)
-        return self._final_ast.eval()
+        return self._final_ast.evaluate()
 
-    @cached_property
-    def solution(self, /) -> Set | list[Any]:
-        """Returns the raw solution still represented by SymPy objectss"""
+    def _symbolic_solution(self, /) -> Set | list[Any]:
         try:
             return s_solveset(self.parsed_equation, **self._kwargs)
         except Exception as e:
@@ -237,6 +530,179 @@ class Solver:
             except Exception as e2:
                 raise e from e2
 
+    def _numeric_target(self, /) -> tuple[Symbol, Expr]:
+        """The variable and the function whose roots `numeric_solution` approximates,
+        or `ValueError` when the equation cannot be solved numerically"""
+        if not isinstance(self.parsed_equation, Eq):
+            raise ValueError('Only equations can be solved numerically')
+        try:
+            symbol = self._variable()
+        except IndexError:
+            raise ValueError('No variable to solve for') from None
+        f = self.lhs_equation
+        if f.free_symbols - {symbol}: # type: ignore
+            raise ValueError('Only single variable equations can be solved numerically')
+        if not vectorizable(f): # type: ignore
+            raise ValueError('Only finite sums and products can be solved numerically')
+        return symbol, f
+
+    def numeric_window(self, /, xrange: tuple[float, float] = NUMERIC_XRANGE) -> tuple[float, float]:
+        """The interval that `numeric_solution` samples: the domain where it is bounded,
+        and a window as wide as `xrange` from its finite bound (if any) otherwise"""
+        lo, hi = xrange
+        if (dom := self._domain) is None:
+            return lo, hi
+        start, end = dom.inf, dom.sup # type: ignore
+        if start.is_finite and end.is_finite:
+            return float(start), float(end)
+        if start.is_finite:
+            return float(start), max(hi, float(start) + hi - lo)
+        if end.is_finite:
+            return min(lo, float(end) - hi + lo), float(end)
+        return lo, hi
+
+    def numeric_solution(
+        self, /,
+        *,
+        xrange: tuple[float, float] = NUMERIC_XRANGE,
+        samples: int = 2000,
+    ) -> FiniteSet:
+        """Approximates the real roots of the equation within `numeric_window`
+
+        * sign changes of the function are bracketed on a sampled grid,
+          then each bracket is refined with `nsolve`
+        * so are the minima of `|f|` without a sign change, where `f` may touch zero (ex. `x^2`),
+          as roots of `f / f'`, whose roots are those of `f` but simple
+        * the grid has at least 100 points per unit, up to `MAX_NUMERIC_SAMPLES`, and at most
+          `MAX_NUMERIC_ROOTS` are refined, cutting the window short (see `numeric_searched`)
+        """
+        import numpy as np
+
+        symbol, f = self._numeric_target()
+        x1, x2 = self.numeric_window(xrange)
+        x = np.linspace(x1, x2, min(max(samples, int(100 * (x2 - x1))), self.MAX_NUMERIC_SAMPLES))
+        with np.errstate(all='ignore'):
+            y = np.broadcast_to(lambdify(symbol, f, 'numpy')(x.astype(complex)), x.shape)
+        y = np.where(np.abs(y.imag) < 1e-12, y.real, np.nan)
+        simple = f / diff(f, symbol)
+
+        def refine(g: Expr, a: float, b: float, /) -> Optional[float]:
+            try:
+                root = nsolve(g, symbol, (a, b), solver='illinois', verify=False)
+            except (ValueError, ZeroDivisionError, TypeError):
+                return None
+            try:
+                # the roots of `f / f'` converge exactly, ex. to `0` rather than `1e-15` for `x^3`
+                if a <= (polished := nsolve(simple, symbol, root, verify=False)) <= b:
+                    root = polished
+            except (ValueError, ZeroDivisionError, TypeError):
+                pass
+            try:
+                # sign changes across poles (ex. 1/x) are not roots
+                return float(root) if abs(complex(f.subs(symbol, root))) < 1e-9 else None # type: ignore
+            except TypeError:
+                return None
+
+        sign, magnitude = np.sign(y), np.abs(y)
+        touching = (
+            (magnitude[1:-1] <= magnitude[:-2]) & (magnitude[1:-1] < magnitude[2:])
+            & (sign[:-2] == sign[1:-1]) & (sign[1:-1] == sign[2:]) & (sign[1:-1] != 0)
+        )
+        candidates = sorted([
+            *((i, None) for i in np.flatnonzero(y == 0)),
+            *((i, f) for i in np.flatnonzero(sign[:-1] * sign[1:] < 0)),
+            *((i, simple) for i in 1 + np.flatnonzero(touching)),
+        ], key=lambda candidate: candidate[0])
+        if len(candidates) > self.MAX_NUMERIC_ROOTS:
+            # the window is cut short rather than refining every root of a fast oscillating function
+            x2 = float(x[candidates[self.MAX_NUMERIC_ROOTS][0]])
+            del candidates[self.MAX_NUMERIC_ROOTS:]
+        self.numeric_searched = (x1, x2)
+
+        found = []
+        for i, g in candidates:
+            if g is None:
+                found.append(float(x[i]))
+            elif g is f:
+                found.append(refine(f, x[i], x[i + 1]))
+            else:
+                found.append(refine(simple, x[i - 1], x[i + 1]))
+
+        roots: list[float] = []
+        domain = self._domain
+        for root in sorted(r for r in found if r is not None):
+            if roots and abs(root - roots[-1]) <= 1e-9 * max(abs(root), 1):
+                continue
+            if domain is None or domain.contains(root) is not S.false:
+                roots.append(root)
+        return FiniteSet(*(Float(r, 15) for r in roots))
+
+    def _race_solution(self, budget: float, /) -> Set | list[Any]:
+        """Runs the symbolic solver and the numeric root finder side by side,
+        returning the closed form if found within `budget` seconds, and otherwise the first usable result
+
+        * the numeric roots are only used when there are some, and are marked as `approximate`,
+          with a `note` of the window they were searched in
+        * without them, the symbolic solver is waited on until the deadline at most
+        """
+        try:
+            self._numeric_target()
+        except ValueError:
+            # nothing to race against
+            return self._symbolic_solution()
+
+        deadline = time.monotonic() + budget
+        symbolic = _SYMBOLIC_POOL.submit(self._symbolic_solution)
+        numeric = _NUMERIC_POOL.submit(self.numeric_solution)
+        try:
+            return self._race(symbolic, numeric, deadline, budget)
+        finally:
+            # a solver still queued once the race is decided never starts
+            symbolic.cancel()
+            numeric.cancel()
+
+    def _race(
+        self,
+        symbolic: Future[Set | list[Any]],
+        numeric: Future[FiniteSet],
+        deadline: float,
+        budget: float, /,
+    ) -> Set | list[Any]:
+        def closed_form() -> bool:
+            return symbolic.done() and symbolic.exception() is None and not isinstance(symbolic.result(), ConditionSet)
+
+        def roots() -> bool:
+            return numeric.done() and numeric.exception() is None and bool(numeric.result())
+
+        while True:
+            if closed_form():
+                return symbolic.result()
+            expired = time.monotonic() >= deadline
+            if roots() and (expired or symbolic.done()):
+                x1, x2 = self.numeric_searched or self.numeric_window()
+                self.approximate = True
+                self.note = f'The real roots found numerically within [{x1:g}, {x2:g}] only'
+                return numeric.result()
+            if numeric.done() and not roots():
+                # no fallback, so the outcome of the symbolic solver (ex. a `ConditionSet`) stands
+                if symbolic.done():
+                    return symbolic.result()
+                if expired:
+                    raise MathTimeout(budget)
+            wait(
+                [f for f in (symbolic, numeric) if not f.done()],
+                timeout=None if expired else deadline - time.monotonic(),
+                return_when=FIRST_COMPLETED,
+            )
+
+    @cached_property
+    @metrics.timer('solution')
+    def solution(self, /) -> Set | list[Any]:
+        """Returns the raw solution still represented by SymPy objectss"""
+        if self.numeric_budget is not None:
+            return self._race_solution(self.numeric_budget)
+        return self._symbolic_solution()
+
     @staticmethod
     def to_latex(expr: Any) -> str:
         """Converts parsed expression to latex"""
@@ -244,92 +710,143 @@ class Solver:
             return expr.to_latex()
         return s_latex(expr)
 
-    @cache
+    @contextmanager
+    def _depth_guard(self, /) -> Iterator[None]:
+        """Reports SymPy running out of recursion on a deeply nested expression as `AstDepthOverflow`"""
+        try:
+            yield
+        except RecursionError as e:
+            raise AstDepthOverflow(self._max_depth if self._max_depth is not None else float('inf')) from e
+
+    def latex(self, name: str, /) -> str:
+        """Converts the property (or argumentless method) `name` to latex, once per solver"""
+        if (cached := self._latex_cache.get(name)) is None:
+            metrics.inc('solver_cache_total', cache='latex', result='miss')
+            with self._depth_guard():
+                value = getattr(self, name)
+                if inspect.ismethod(value):
+                    value = value()
+                with metrics.timer('latex'):
+                    cached = self._latex_cache[name] = self.to_latex(value)
+        else:
+            metrics.inc('solver_cache_total', cache='latex', result='hit')
+        return cached
+
+    @cached_property
+    @metrics.timer('pretty')
+    def rendered_solution(self, /) -> tuple[str, str]:
+        """The (unicode, ascii) prettified solution
+
+        * rendered with `pretty` instead of `pprint`, so the process-wide stdout is never swapped out
+        """
+        with self._depth_guard():
+            return (
+                pretty(self.solution) + '\n',
+                pretty(self.solution, use_unicode=False) + '\n',
+            )
+
     def parsed_solution(self, /, *, evaluate_bool: bool = False) -> str:
         """prettified and formatted solution"""
         if not evaluate_bool and isinstance(a := self._final_ast, BooleanResult):
             return a.to_latex()
-        buf = StringIO()
-        with redirect_stdout(buf):
-            pprint(self.solution)
-        return buf.getvalue()
+        return self.rendered_solution[0]
 
-    @cache
     def ascii_parsed_solution(self, /, *, evaluate_bool: bool = False) -> str:
         """(non unicode) prettified and formatted solution"""
         if not evaluate_bool and isinstance(a := self._final_ast, BooleanResult):
             return a.to_latex()
-        buf = StringIO()
-        with redirect_stdout(buf):
-            pprint(self.solution, use_unicode=False)
-        return buf.getvalue()
+        return self.rendered_solution[1]
 
     @cached_property
+    @metrics.timer('evaluated_equation')
     def evaluated_equation(self, /) -> Expr:
-        return N(self.lhs_equation)
+        """The equation evaluated to `precision` significant digits (15 by default)"""
+        return evaluate(self.lhs_equation, self.precision)
 
     @cached_property
+    @metrics.timer('factored')
     def factored(self, /) -> Expr:
         """x^2 - 4 -> (x + 2)(x - 2)"""
         return factor(self.lhs_equation)
 
     @cached_property
+    @metrics.timer('expanded')
     def expanded(self, /) -> Expr:
         """(x + 1)(x + 2) -> x^2 + 3x + 2"""
         return expand(self.lhs_equation)
 
-    @cache
+    @cached_property
+    @metrics.timer('simplify')
+    def simplified(self, /) -> Simplified:
+        """The simplified equation, along with the tier of simplification its size allowed for"""
+        return simplify_tiered(self.parsed_equation)
+
+    @cached_property
+    def _simplified_sides(self, /) -> BooleanComp:
+        """The sides of a relation that simplifies to `true` or `false`, simplified separately"""
+        lhs = simplify_tiered(self.parsed_equation.lhs).expr # type: ignore
+        rhs = simplify_tiered(self.parsed_equation.rhs).expr # type: ignore
+        return BooleanComp(lhs, type(self.parsed_equation), rhs) # type: ignore
+
     def simplify(self, /, *, evaluate_bool: bool = False) -> Expr | BooleanComp:
-        """2x + 1 + 3x + 2 -> 5x + 3"""
-        simplified = simplify(self.parsed_equation)
-        if not evaluate_bool and isinstance(a := self._final_ast, BooleanResult):
+        """2x + 1 + 3x + 2 -> 5x + 3
+
+        * every variant is derived from `simplified` (and `_simplified_sides`), which are cached per solver
+        """
+        simplified = self.simplified.expr
+        if evaluate_bool:
+            return simplified # type: ignore
+        if isinstance(a := self._final_ast, BooleanResult):
             return BooleanComp(a.lhs, a.sympy_conditional, a.rhs)
-        if not evaluate_bool and isinstance(simplified, BooleanAtom):
-            lhs = simplify(self.parsed_equation.lhs) # type: ignore
-            rhs = simplify(self.parsed_equation.rhs) # type: ignore
-            return BooleanComp(lhs, type(self.parsed_equation), rhs) # type: ignore
-        return simplified
+        if isinstance(simplified, BooleanAtom):
+            return self._simplified_sides
+        return simplified # type: ignore
 
     @cached_property
+    @metrics.timer('analysis')
+    def analysis(self, /) -> FunctionAnalysis:
+        """Returns the shared continuity / critical point analysis of the function"""
+        symbol = self._variable()
+        if self.solve_for or len({v.value for v in self.parser.variables}) == 1:
+            derivative = self.derivative
+        else:
+            derivative = diff(self.lhs_equation, symbol)
+        return FunctionAnalysis(
+            self.lhs_equation,
+            symbol,
+            self._kwargs.get('domain', Reals),
+            derivative,
+        )
+
+    @cached_property
+    @metrics.timer('max_min')
     def max_min(self, /) -> dict[str, Expr]:
         """Returns a dictionary containing the maxima and/or the minima, if exists"""
         result = {}
         try:
-            kwargs = {
-                'symbol': self.parser.variables[0].eval(),
-                **self._kwargs
-            }
-
-            if abs(maxima := maximum(self.lhs_equation, **kwargs)) != oo: # type: ignore
+            range_ = self.range
+            if abs(maxima := range_.sup) != oo: # type: ignore
                 result['max'] = maxima
-            if abs(minima := minimum(self.lhs_equation, **kwargs)) != oo: # type: ignore
+            if abs(minima := range_.inf) != oo: # type: ignore
                 result['min'] = minima
-        except Exception as e:
+        except Exception:
             return {'max': self.lhs_equation, 'min': self.lhs_equation}
         return result
 
     @cached_property
+    @metrics.timer('domain')
     def domain(self, /) -> Expr:
         """Returns the domain of the function"""
         try:
-            kwargs = {
-                'symbol': self.parser.variables[0].eval(),
-                'domain': Reals,
-                **self._kwargs
-            }
-            return continuous_domain(self.lhs_equation, **kwargs) # type: ignore
+            return self.analysis.continuous_domain
         except Exception as e:
             raise CantGetProperty('domain', e) from e
 
     @cached_property
+    @metrics.timer('range')
     def range(self, /) -> Expr:
         """Returns the range of the function"""
         try:
-            kwargs = {
-                'symbol': self.parser.variables[0].eval(),
-                'domain': Reals,
-                **self._kwargs
-            }
-            return function_range(self.lhs_equation, **kwargs) # type: ignore
+            return self.analysis.function_range()
         except Exception as e:
             raise CantGetProperty('range', e) from e
\ No newline at end of file
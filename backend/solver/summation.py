@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Callable, ClassVar, Optional, Sequence
+from functools import cache, lru_cache
+import math
+
+from sympy import Sum, Product, Dummy, Expr, Symbol, Integer, Float, lambdify
+from sympy.core.evalf import prec_to_dps
+
+if TYPE_CHECKING:
+    from numpy import ndarray
+
+__all__ = (
+    'BatchSum',
+    'BatchProduct',
+    'closed_form',
+    'vectorizable',
+    'vectorize',
+    'sample',
+)
+
+# the most terms evaluated in memory at once, whatever the parser limits
+MAX_BATCH_TERMS = 10 ** 6
+# below which the terms are added directly, as SymPy does, rather than looking for a closed form
+DIRECT_TERMS = 100
+
+@lru_cache(maxsize=256)
+def closed_form(
+    kind: type[Sum] | type[Product],
+    function: Expr,
+    variable: Symbol,
+    start: Expr, /,
+) -> Optional[tuple[Expr, Dummy]]:
+    """The sum (or product) of `function` from `start` to a symbolic upper bound, along with that bound
+
+    * the bound is symbolic as SymPy expands numeric bounds term by term,
+      into exact values of thousands of digits
+    """
+    stop = Dummy('stop', integer=True)
+    try:
+        result = kind(function, (variable, start, stop)).doit()
+    except Exception:
+        return None
+    if result.has(Sum, Product):
+        return None
+    return result, stop
+
+def _bounds(expr: Sum | Product, /) -> Optional[tuple[Symbol, int, int]]:
+    """The variable and the integer bounds of a single, finite sum or product"""
+    if len(expr.limits) != 1:
+        return None
+    variable, start, stop = expr.limits[0]
+    if not (isinstance(start, Integer) and isinstance(stop, Integer)):
+        return None
+    return variable, int(start), int(stop)
+
+def _factorial(n: Any, /) -> float:
+    """`factorial` in floating point, overflowing to infinity rather than raising"""
+    try:
+        return float(math.factorial(int(n)))
+    except OverflowError:
+        return math.inf
+
+@cache
+def _numpy_modules() -> list[Any]:
+    import numpy as np
+
+    return [{'factorial': np.vectorize(_factorial, otypes=[float])}, 'numpy']
+
+def _batch(
+    kind: type[Sum] | type[Product],
+    function: Expr,
+    variable: Symbol,
+    start: int,
+    stop: int,
+    prec: int, /,
+) -> Any:
+    """Evaluates every term at once: with NumPy at double precision, and with mpmath otherwise,
+    or when NumPy can not evaluate the terms"""
+    import numpy as np
+    import mpmath
+
+    dps = prec_to_dps(prec)
+    if dps <= 15:
+        try:
+            with np.errstate(all='ignore'):
+                terms = lambdify(variable, function, _numpy_modules())(np.arange(start, stop + 1, dtype=float))
+                terms = np.broadcast_to(terms, (stop - start + 1,))
+                value = terms.sum() if kind is Sum else terms.prod()
+            if np.isfinite(value):
+                return float(value)
+        except (TypeError, ValueError, NameError, ZeroDivisionError, OverflowError):
+            pass
+
+    f = lambdify(variable, function, 'mpmath')
+    with mpmath.workdps(dps + 10):
+        terms = (f(mpmath.mpf(k)) for k in range(start, stop + 1))
+        return mpmath.fsum(terms) if kind is Sum else mpmath.fprod(terms)
+
+def _evalf_closed_form(result: Expr, bound: Dummy, stop: int, prec: int, /) -> Optional[Expr]:
+    dps = prec_to_dps(prec)
+    try:
+        # an exact bound would expand the closed form into an exact value
+        value = result.evalf(dps, subs={bound: Float(stop, dps)})
+    except (TypeError, ValueError, ZeroDivisionError, OverflowError):
+        return None
+    if not (value.is_number and value.is_finite):
+        return None
+
+    # rounding residue of complex intermediate values, ex. `RisingFactorial(1 - I, n)`
+    re, im = value.as_real_imag()
+    if abs(im) <= abs(re) * Float(10) ** (2 - dps):
+        return re
+    return value
+
+class _BatchEvalf:
+    """Numerically evaluates finite sums and products in closed form when there is one,
+    and as a single batch of terms otherwise, instead of term by term through SymPy"""
+    base: ClassVar[type[Sum] | type[Product]]
+    args: tuple[Expr, ...]
+    function: Expr
+
+    def _eval_evalf(self, prec: int) -> Optional[Expr]:
+        if (bounds := _bounds(self)) is None: # type: ignore
+            if not any(bound.is_infinite for _, *limits in self.limits for bound in limits): # type: ignore
+                # symbolic or fractional bounds, ex. `x` while graphing a sum up to `x`
+                return None
+            value = self.base(*self.args).evalf(prec_to_dps(prec))
+            return value if value.is_number and not value.has(Sum, Product) else None
+        variable, start, stop = bounds
+        if self.function.free_symbols - {variable} or stop < start:
+            return None
+
+        # closed forms of floating point terms are rarely simpler than the terms
+        if stop - start + 1 > DIRECT_TERMS and not self.function.has(Float) and (
+            closed := closed_form(self.base, self.function, variable, Integer(start))
+        ):
+            result, bound = closed
+            if (value := _evalf_closed_form(result, bound, stop, prec)) is not None:
+                return value
+
+        if stop - start + 1 > MAX_BATCH_TERMS:
+            return None
+        try:
+            value = _batch(self.base, self.function, variable, start, stop, prec)
+        except (TypeError, ValueError, NameError, ZeroDivisionError, OverflowError):
+            return None
+        if isinstance(value, float):
+            return Float(value, prec_to_dps(prec))
+        return Expr._from_mpmath(value, prec)
+
+class BatchSum(_BatchEvalf, Sum):
+    base = Sum
+
+class BatchProduct(_BatchEvalf, Product):
+    base = Product
+
+def vectorizable(expr: Expr, /) -> bool:
+    """Whether every sum and product in `expr` can be lambdified into a loop of at most `MAX_BATCH_TERMS`"""
+    for node in expr.atoms(Sum, Product):
+        if (bounds := _bounds(node)) is None or bounds[2] - bounds[1] + 1 > MAX_BATCH_TERMS:
+            return False
+    return True
+
+def vectorize(expr: Expr, symbols: Sequence[Symbol], /) -> Optional[Callable[..., ndarray]]:
+    """Compiles `expr` into a NumPy function of `symbols`, with `NaN` where it is not real,
+    or `None` if it has sums or products that can not be looped over"""
+    import numpy as np
+
+    if not vectorizable(expr):
+        return None
+    f = lambdify(symbols, expr, _numpy_modules())
+
+    def evaluate(*args: ndarray) -> ndarray:
+        with np.errstate(all='ignore'):
+            y = np.broadcast_to(
+                f(*(np.asarray(a).astype(complex) for a in args)),
+                np.broadcast_shapes(*(np.shape(a) for a in args)),
+            )
+        return np.where(np.abs(y.imag) < 1e-12, y.real, np.nan)
+    return evaluate
+
+def sample(expr: Expr, symbol: Symbol, x: ndarray, /) -> Optional[ndarray]:
+    """Evaluates `expr` over all of `x` at once,
+    looping over the terms of its sums and products rather than over `x`"""
+    if (f := vectorize(expr, (symbol,))) is None:
+        return None
+    try:
+        return f(x)
+    except (TypeError, ValueError, NameError, ZeroDivisionError, OverflowError):
+        return None
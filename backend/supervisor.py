@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Callable, Literal, Optional, TypeAlias
+from dataclasses import dataclass
+from multiprocessing.connection import wait
+import multiprocessing
+import threading
+import signal
+import time
+import os
+
+from .worker import run_process, limits_from_env, warm_up
+
+if TYPE_CHECKING:
+    from multiprocessing.connection import Connection
+    from multiprocessing.process import BaseProcess
+
+    WorkerState: TypeAlias = Literal['starting', 'ready', 'retiring', 'draining']
+
+__all__ = (
+    'WorkerPool',
+    'main',
+)
+
+@dataclass(eq=False)
+class _Worker:
+    process: BaseProcess
+    connection: Connection
+    started_at: float
+    state: WorkerState = 'starting'
+    # the retiring worker this one is warming up to replace
+    replaces: Optional[_Worker] = None
+
+class WorkerPool:
+    """Keeps `processes` warm worker processes pulling jobs from the broker, recycling them gracefully
+
+    * a worker past its job count or RSS limit asks to retire, and keeps working meanwhile
+    * its replacement is started and warmed up first, and only once it is ready is the old worker drained:
+      it stops fetching jobs, finishes its running ones and exits, so the capacity never dips
+    * a worker that exits unexpectedly is replaced right away
+    * `prepare` runs in each new worker before it reports ready, by default `worker.warm_up`;
+      it is pickled to the spawned process, so it must be a module level function
+    """
+
+    def __init__(
+        self, /,
+        broker: str,
+        processes: int,
+        *,
+        concurrency: int = 1,
+        max_jobs: Optional[int] = None,
+        max_rss: Optional[int] = None,
+        start_timeout: float = 120.0,
+        prepare: Callable[[], None] = warm_up,
+    ) -> None:
+        self.broker = broker
+        self.processes = processes
+        self.concurrency = concurrency
+        self.max_jobs = max_jobs
+        self.max_rss = max_rss
+        self.start_timeout = start_timeout
+        self.prepare = prepare
+        # spawned rather than forked, so each worker starts with fresh memory and no inherited threads
+        self._context = multiprocessing.get_context('spawn')
+        self._workers: list[_Worker] = []
+        self.recycled = 0
+
+    @property
+    def ready(self, /) -> int:
+        """How many workers are taking jobs"""
+        return sum(w.state in ('ready', 'retiring') for w in self._workers)
+
+    def _entry_point(self, control: Connection, /) -> tuple[Callable[..., None], tuple[Any, ...]]:
+        """The function run by a worker process, with its arguments"""
+        return run_process, (self.broker, self.concurrency, self.max_jobs, self.max_rss, control, self.prepare)
+
+    def _spawn(self, /, replaces: Optional[_Worker] = None) -> _Worker:
+        parent, child = self._context.Pipe()
+        target, args = self._entry_point(child)
+        process = self._context.Process(target=target, args=args, daemon=True)
+        process.start()
+        child.close()
+        worker = _Worker(process, parent, time.monotonic(), replaces=replaces)
+        self._workers.append(worker)
+        return worker
+
+    def _drain(self, worker: _Worker, /) -> None:
+        worker.state = 'draining'
+        try:
+            worker.connection.send('drain')
+        except OSError:
+            pass
+
+    def _on_message(self, worker: _Worker, message: tuple[str, ...], /) -> None:
+        match message:
+            case ('ready',):
+                worker.state = 'ready'
+                if (old := worker.replaces) is not None:
+                    worker.replaces = None
+                    self._drain(old)
+                    self.recycled += 1
+            case ('retire', reason):
+                if worker.state == 'ready':
+                    print(f'Recycling worker {worker.process.pid} after {reason}', flush=True)
+                    worker.state = 'retiring'
+                    self._spawn(replaces=worker)
+
+    def _on_exit(self, worker: _Worker, /) -> None:
+        self._workers.remove(worker)
+        worker.connection.close()
+        if worker.state == 'draining':
+            return
+        print(f'Worker {worker.process.pid} exited with {worker.process.exitcode}', flush=True)
+        if worker.state == 'starting' and worker.replaces is not None:
+            # the old worker is still taking jobs, try to replace it again
+            self._spawn(replaces=worker.replaces)
+        elif not any(w.replaces is worker for w in self._workers):
+            self._spawn()
+
+    def step(self, /, timeout: float = 1.0) -> None:
+        """Handles the messages and exits of the workers, waiting for at most `timeout` seconds"""
+        connections = {w.connection: w for w in self._workers}
+        sentinels = {w.process.sentinel: w for w in self._workers}
+        for ready in wait([*connections, *sentinels], timeout=timeout):
+            if (worker := connections.get(ready)) is not None: # type: ignore
+                try:
+                    message = worker.connection.recv()
+                except (EOFError, OSError):
+                    continue
+                self._on_message(worker, message)
+            elif (worker := sentinels.get(ready)) is not None and worker in self._workers: # type: ignore
+                worker.process.join()
+                self._on_exit(worker)
+
+        now = time.monotonic()
+        for worker in [w for w in self._workers if w.state == 'starting']:
+            if now - worker.started_at > self.start_timeout:
+                print(f'Worker {worker.process.pid} did not start in {self.start_timeout}s', flush=True)
+                worker.process.kill()
+
+    def run(self, /, stop: Optional[threading.Event] = None) -> None:
+        """Starts the workers and keeps them running until `stop` is set, then drains them all"""
+        for _ in range(self.processes):
+            self._spawn()
+        try:
+            while stop is None or not stop.is_set():
+                self.step()
+        finally:
+            self.close()
+
+    def close(self, /, timeout: Optional[float] = None) -> None:
+        """Drains every worker, waiting for their running jobs to finish"""
+        for worker in self._workers:
+            if worker.state == 'starting':
+                worker.process.kill()
+            else:
+                self._drain(worker)
+        for worker in self._workers:
+            worker.process.join(timeout)
+            worker.connection.close()
+        self._workers.clear()
+
+def main(broker: str, processes: int, /, **options: Optional[int]) -> None:
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stop.set())
+
+    pool = WorkerPool(broker, processes, **options) # type: ignore
+    print(f'Supervising {processes} workers of {broker}', flush=True)
+    pool.run(stop)
+
+if __name__ == '__main__':
+    import argparse
+
+    max_jobs, max_rss = limits_from_env()
+    parser = argparse.ArgumentParser(description='Runs solver workers, recycling them by job count and memory')
+    parser.add_argument('broker', nargs='?', default=os.getenv('SOLVER_BROKER_URL', '127.0.0.1:5100'))
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--concurrency', type=int, default=1, help='jobs run at a time by each worker')
+    parser.add_argument('--max-jobs', type=int, default=max_jobs, help='recycle workers after this many jobs')
+    parser.add_argument('--max-rss', type=float, help='recycle workers past this RSS, in MiB')
+    args = parser.parse_args()
+    main(
+        args.broker,
+        args.processes,
+        concurrency=args.concurrency,
+        max_jobs=args.max_jobs,
+        max_rss=int(args.max_rss * 2 ** 20) if args.max_rss is not None else max_rss,
+    )
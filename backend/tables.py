@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Iterator
+import math
+import json
+
+from sympy import Symbol
+
+from .models import EvaluateSchema, GridAxis
+from .solver import Solver
+from .libraries import solver_options
+from .solver.metrics import metrics
+
+if TYPE_CHECKING:
+    from numpy import ndarray
+
+__all__ = (
+    'grid_size',
+    'iter_evaluate',
+)
+
+MAX_POINTS = 10_000_000
+CHUNK_SIZE = 65_536
+
+def _axis_size(axis: GridAxis, /) -> int:
+    if axis.points is not None:
+        return len(axis.points)
+    if axis.start is None or axis.stop is None or not axis.step:
+        raise ValueError('A grid axis needs either `points`, or `start`, `stop` and a non zero `step`')
+    if (steps := (axis.stop - axis.start) / axis.step) < 0:
+        raise ValueError(f'A step of {axis.step} never reaches {axis.stop} from {axis.start}')
+    # tolerates the rounding of ex. `(1 - 0) / 0.1`
+    return math.floor(steps + 1e-9) + 1
+
+def grid_size(data: EvaluateSchema, /) -> int:
+    """The amount of points of the grid, validating it"""
+    if not 1 <= len(data.grid) <= 2:
+        raise ValueError('The grid needs one or two axes')
+    if (size := math.prod(map(_axis_size, data.grid))) > MAX_POINTS:
+        raise ValueError(f'A grid of {size} points exceeds the maximum of {MAX_POINTS} points')
+    return size
+
+def _axis_values(axis: GridAxis, index: ndarray, /) -> ndarray:
+    import numpy as np
+
+    if axis.points is not None:
+        return np.asarray(axis.points, dtype=float)[index]
+    # from the index rather than accumulated, so that the error does not grow along the axis
+    return axis.start + index * axis.step # type: ignore
+
+def iter_evaluate(data: EvaluateSchema) -> Iterator[dict[str, Any] | bytes]:
+    """Evaluates the function over the grid, yielding a header and then one chunk at a time
+
+    * the header holds the variables and the shape of the grid
+    * two axes form a grid with the second axis varying fastest
+    * a chunk is a JSON line of the coordinates and the values (`null` where not real or infinite,
+      as JSON has no `NaN` or `Infinity`), or the raw little-endian float64 values (`NaN` where not real)
+    """
+    import numpy as np
+
+    size = grid_size(data)
+    solver = Solver(
+        data.equation,
+        domain=data.domain,
+        solve_for=data.solve_for,
+        **solver_options(data),
+    )
+    free = solver.free_variables()
+    names = [axis.variable for axis in data.grid]
+    if len(free) > len(names):
+        raise ValueError(f"The grid has {len(names)} axes for {len(free)} variables: {', '.join(map(str, free))}")
+    # axes without a variable take the free variables in order of appearance
+    defaults = iter(v for v in free if v.name not in names)
+    symbols = [Symbol(name) if name else next(defaults, Symbol(f'_{i}')) for i, name in enumerate(names)]
+
+    with metrics.timer('compile'):
+        f = solver.compile(*symbols)
+    shape = [_axis_size(axis) for axis in data.grid]
+    yield {'variables': [s.name for s in symbols], 'shape': shape}
+
+    for begin in range(0, size, CHUNK_SIZE):
+        index = np.arange(begin, min(begin + CHUNK_SIZE, size))
+        if len(shape) == 2:
+            coordinates = [
+                _axis_values(data.grid[0], index // shape[1]),
+                _axis_values(data.grid[1], index % shape[1]),
+            ]
+        else:
+            coordinates = [_axis_values(data.grid[0], index)]
+        with metrics.timer('evaluate'):
+            values = f(*coordinates)
+
+        if data.format == 'float64':
+            yield values.astype('<f8').tobytes()
+        else:
+            yield json.dumps({
+                **{s.name: c.tolist() for s, c in zip(symbols, coordinates)},
+                'values': np.where(np.isfinite(values), values, None).tolist(),
+            }, allow_nan=False).encode() + b'\n'
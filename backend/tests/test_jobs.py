@@ -0,0 +1,202 @@
+from io import BytesIO
+import importlib
+import threading
+import asyncio
+import json
+
+import pytest
+
+from ..app import JOB_HANDLERS, execute, do_solve, do_graph
+from ..broker import BrokerServer, BrokerJobQueue
+from ..jobs import run_worker
+from ..libraries import registry
+from ..models import SolveSchema, GraphSchema, SolveResponse
+from ..supervisor import WorkerPool
+
+__all__ = (
+    'test_broker',
+    'test_execute',
+    'test_broker_requests',
+    'test_lease',
+    'test_ack',
+    'test_drain',
+    'test_recycling',
+)
+
+async def test_broker() -> None:
+    server = BrokerServer()
+    await server.start()
+
+    queue = BrokerJobQueue('127.0.0.1', server.port)
+    worker = asyncio.create_task(run_worker(queue, JOB_HANDLERS))
+    try:
+        solve = await queue.submit('solve', SolveSchema(equation='x^2 - 4'))
+        graph = await queue.submit('graph', SolveSchema(equation='x'))
+
+        for _ in range(100):
+            job = await queue.get(graph.id)
+            if job and job.status in ('done', 'failed'):
+                break
+            await asyncio.sleep(0.1)
+        assert job and job.status == 'done'
+        assert job.fields['image']
+
+        job = await queue.get(solve.id)
+        assert job and job.status == 'done'
+        assert job.fields['latex_solution'] == r'\left\{-2, 2\right\}'
+
+        assert await queue.get('unknown') is None
+    finally:
+        worker.cancel()
+        await server.close()
+
+async def test_execute(monkeypatch: pytest.MonkeyPatch) -> None:
+    server = BrokerServer()
+    await server.start()
+
+    queue = BrokerJobQueue('127.0.0.1', server.port)
+    # the `app` attribute of the package is the Quart application
+    monkeypatch.setattr(importlib.import_module('..app', __package__), 'jobs', queue)
+    worker = asyncio.create_task(run_worker(queue, JOB_HANDLERS))
+    try:
+        response, status = await execute(do_solve, SolveSchema(equation='x^2 - 4')) # type: ignore
+        assert status == 200 and isinstance(response, SolveResponse)
+        assert response.latex_solution == r'\left\{-2, 2\right\}'
+
+        image = await execute(do_graph, GraphSchema(equation='x', overlays=['x^2']))
+        assert isinstance(image, BytesIO)
+        assert image.getvalue().startswith(b'\x89PNG')
+
+        error, status = await execute(do_solve, SolveSchema(equation='x +')) # type: ignore
+        assert status == 500 and error.error
+
+        # the worker may run on another node with its own registry, so it is sent the library itself
+        library = registry.register(['P(x) = x^2 - 4'])
+        submitted = []
+        submit = queue.submit
+
+        async def record(kind, data):
+            submitted.append(data)
+            return await submit(kind, data)
+        monkeypatch.setattr(queue, 'submit', record)
+        response, status = await execute(do_solve, SolveSchema(equation='P(x)', library=library.id)) # type: ignore
+        assert status == 200 and response.latex_solution == r'\left\{-2, 2\right\}'
+        assert submitted[-1].library is None and submitted[-1].functions == ['P(x) = x^2 - 4']
+    finally:
+        worker.cancel()
+        await server.close()
+
+async def test_broker_requests() -> None:
+    server = BrokerServer(token='secret')
+    await server.start()
+    try:
+        with pytest.raises(ValueError, match='Unauthorized'):
+            await BrokerJobQueue('127.0.0.1', server.port).get('unknown')
+        with pytest.raises(ValueError, match='Unauthorized'):
+            await BrokerJobQueue('127.0.0.1', server.port, token='guess').get('unknown')
+
+        queue = BrokerJobQueue('127.0.0.1', server.port, token='secret')
+        assert await queue.get('unknown') is None
+
+        # malformed requests are answered with an error rather than a closed connection
+        for line in (
+            b'not json',
+            b'[]',
+            b'{"op": "get", "token": "secret"}',
+            b'{"op": "submit", "kind": "solve", "data": {}, "token": "secret"}',
+        ):
+            reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+            writer.write(line + b'\n')
+            response = json.loads(await reader.readline())
+            writer.close()
+            assert response['error'].startswith('Malformed request')
+    finally:
+        await server.close()
+
+async def test_lease() -> None:
+    server = BrokerServer(lease=0.2, max_attempts=2)
+    await server.start()
+    queue = BrokerJobQueue('127.0.0.1', server.port)
+    try:
+        job = await queue.submit('solve', SolveSchema(equation='x'))
+        # a worker that dies with its job
+        assert (await queue.fetch()).id == job.id
+        await asyncio.sleep(0.5)
+        assert (await queue.get(job.id)).status == 'queued' # type: ignore
+
+        # and a second one, after which the job fails
+        assert (await queue.fetch()).id == job.id
+        job = await asyncio.wait_for(queue.wait(job.id), 5)
+        assert job and job.status == 'failed' and job.error
+    finally:
+        await server.close()
+
+async def test_ack() -> None:
+    server = BrokerServer()
+    await server.start()
+    queue = BrokerJobQueue('127.0.0.1', server.port)
+    try:
+        job = await queue.submit('solve', SolveSchema(equation='x'))
+        # a worker that stops right after receiving its job, without acknowledging it
+        reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+        writer.write(b'{"op": "fetch"}\n')
+        assert json.loads(await reader.readline())['job']['id'] == job.id
+        writer.close()
+        await asyncio.sleep(0.1)
+        assert (await queue.get(job.id)).status == 'queued' # type: ignore
+
+        # while an acknowledged job stays with its worker
+        assert (await queue.fetch()).id == job.id
+        await asyncio.sleep(0.1)
+        assert (await queue.get(job.id)).status == 'running' # type: ignore
+    finally:
+        await server.close()
+
+async def test_drain() -> None:
+    server = BrokerServer()
+    await server.start()
+    queue = BrokerJobQueue('127.0.0.1', server.port)
+    stop = asyncio.Event()
+    try:
+        # an idle worker stops waiting for jobs, without taking one with it
+        worker = asyncio.create_task(run_worker(queue, JOB_HANDLERS, stop=stop))
+        await asyncio.sleep(0.1)
+        stop.set()
+        await asyncio.wait_for(worker, 5)
+
+        job = await queue.submit('solve', SolveSchema(equation='x^2 - 4'))
+        await asyncio.sleep(0.1)
+        assert (await queue.get(job.id)).status == 'queued' # type: ignore
+    finally:
+        await server.close()
+
+def _prepare() -> None:
+    """Skips the warm-up of the recycled workers"""
+
+async def test_recycling() -> None:
+    server = BrokerServer()
+    await server.start()
+    queue = BrokerJobQueue('127.0.0.1', server.port)
+    pool = WorkerPool(f'127.0.0.1:{server.port}', 1, max_jobs=1, prepare=_prepare)
+    stop = threading.Event()
+    supervisor = asyncio.create_task(asyncio.to_thread(pool.run, stop))
+    try:
+        for _ in range(600):
+            if pool.ready:
+                break
+            await asyncio.sleep(0.05)
+
+        # keep the workers busy until the first one has been replaced
+        for i in range(1, 100):
+            # there is always a worker taking jobs
+            assert pool.ready >= 1
+            if pool.recycled >= 1:
+                break
+            job = await queue.submit('solve', SolveSchema(equation=f'x - {i}'))
+            job = await asyncio.wait_for(queue.wait(job.id), 30)
+            assert job and job.status == 'done'
+        assert pool.recycled >= 1
+    finally:
+        stop.set()
+        await supervisor
+        await server.close()
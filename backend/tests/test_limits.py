@@ -0,0 +1,70 @@
+import random
+import time
+
+import pytest
+
+from solver import Solver
+from solver.exceptions import SolverException, AstDepthOverflow
+
+__all__ = (
+    'test_pathological',
+    'test_fuzz',
+    'test_depth',
+)
+
+# worst case time to parse and evaluate any input, before solving
+MAX_LATENCY = 2.0
+
+PATHOLOGICAL = (
+    '(' * 1000 + 'x' + ')' * 1000,
+    '[' * 400 + 'x' + ']' * 400,
+    'x' * 2000,
+    'xy' * 1000,
+    '+'.join(['1'] * 1000),
+    '-' * 2000 + 'x',
+    '2^2^2^2^2',
+    '9^9^9^9',
+    '1024!!',
+    'sin(' * 300 + 'x' + ')' * 300,
+    'sin(' * 200 + 'x' + ')' * 200,
+    '|x+' * 100 + 'x' + '|' * 100,
+    'x' * 10_000,
+)
+
+ALPHABET = (
+    'x', 'y', 'pi', 'e', '1', '2', '9', '0.5',
+    '+', '-', '*', '/', '^', '!', '%', '|',
+    '(', ')', '[', ']', 'sin', 'sum_(k=1)^(9)', 'lim_(x->0)', 'root',
+)
+
+def _run(equation: str) -> float:
+    start = time.perf_counter()
+    try:
+        Solver(equation).parsed_equation
+    except (SolverException, SyntaxError, ValueError, TypeError, ArithmeticError):
+        pass
+    return time.perf_counter() - start
+
+@pytest.mark.parametrize('equation', PATHOLOGICAL, ids=lambda e: e[:16])
+def test_pathological(equation: str) -> None:
+    assert _run(equation) < MAX_LATENCY
+
+def test_fuzz() -> None:
+    rng = random.Random(0)
+    latencies = sorted(
+        _run(''.join(rng.choices(ALPHABET, k=rng.randint(1, 400))))
+        for _ in range(100)
+    )
+    print(f'\np50: {latencies[50]:.4f}s, max: {latencies[-1]:.4f}s')
+    assert latencies[-1] < MAX_LATENCY
+
+def test_depth() -> None:
+    # the nesting SymPy recurses through, and nested absolute values whose derivative doubles per level
+    for equation in ('sin(' * 200 + 'x' + ')' * 200, '|x+' * 100 + 'x' + '|' * 100, '|x+' * 7 + 'x' + '|' * 7):
+        with pytest.raises(AstDepthOverflow):
+            Solver(equation).parsed_equation
+    Solver('sin(' * 60 + 'x' + ')' * 60).latex('derivative')
+
+    # past the recursion limit of SymPy, rather than a bare `RecursionError`
+    with pytest.raises(AstDepthOverflow):
+        Solver('sin(' * 200 + 'x' + ')' * 200, max_depth=None).latex('derivative')
@@ -1,10 +1,42 @@
+from dataclasses import asdict
+import asyncio
+import gzip
+import importlib
 import json
+import os
 
+import numpy as np
 import pytest
 
 from ..app import app
+from ..admission import TokenBucket, request_cost
+from ..coalescing import SingleFlight
+from ..libraries import LibraryRegistry, UnknownLibrary
+from ..loadtest import app_transport, run_load, summarize
+from ..memory import MemoryGuard, cache_stats, release_cache
+from ..models import SolveSchema, BatchSolveSchema
+from ..solver import Solver
+from ..solver.exceptions import SolverException
+from ..solver.metrics import metrics
 
-__all__ = ('test_post_solve',)
+__all__ = (
+    'test_post_solve',
+    'test_post_graph',
+    'test_post_solve_stream',
+    'test_post_solve_batch',
+    'test_batch_admission',
+    'test_jobs',
+    'test_token_bucket',
+    'test_single_flight',
+    'test_metrics',
+    'test_metrics_retired',
+    'test_profiling',
+    'test_loadtest',
+    'test_conditional',
+    'test_evaluate',
+    'test_libraries',
+    'test_memory_guard',
+)
 
 @pytest.mark.skip(reason='helper function')
 async def _request(**data) -> None:
@@ -29,6 +61,13 @@ async def test_post_solve() -> None:
             'constants': {'a': 0.1, 'b': 0.2},
         }
     )
+    await _request(
+        json={
+            'equation': 'a + 2 - b',
+            'constants': {'a': 0.1, 'b': 0.2},
+            'precision': 50,
+        }
+    )
 
 async def test_post_graph() -> None:
     client = app.test_client()
@@ -37,4 +76,397 @@ async def test_post_graph() -> None:
     })
 
     assert response.status_code == 200
-    assert isinstance(await response.get_data(), bytes)
\ No newline at end of file
+    assert isinstance(await response.get_data(), bytes)
+
+    # the derivative and a tangent line on the same axes
+    response = await client.post('/graph', json={
+        'equation': 'x^3 - 3x',
+        'overlays': ['derivative', '9x - 16'],
+    })
+    assert response.status_code == 200
+    assert response.mimetype == 'image/png'
+
+    response = await client.post('/graph', json={
+        'equation': 'x^2',
+        'overlays': ['x + y'],
+    })
+    assert response.status_code == 500
+    assert 'not in the equation' in (await response.get_json())['error']
+
+async def test_post_solve_stream() -> None:
+    client = app.test_client()
+    response = await client.post('/solve/stream', json={
+        'equation': 'x^2 - 4',
+    })
+    assert response.status_code == 200
+
+    body = (await response.get_data()).decode()
+    events = [
+        line.removeprefix('event: ')
+        for line in body.splitlines() if line.startswith('event: ')
+    ]
+    assert events[0] == 'equation'
+    assert events[-1] == 'done'
+    assert 'range' in events
+
+async def test_post_solve_batch(monkeypatch: pytest.MonkeyPatch) -> None:
+    client = app.test_client()
+    response = await client.post('/solve/batch', json={
+        'items': [
+            {'equation': 'x^2 - 4'},
+            {'equation': '2x = 1'},
+            {'equation': 'x^2 - 4'},
+        ],
+    })
+    assert response.status_code == 200
+
+    lines = [json.loads(line) for line in (await response.get_data()).splitlines()]
+    assert [line['index'] for line in lines] == [0, 1, 2]
+    assert lines[0]['result'] == lines[2]['result']
+    assert lines[1]['result']['latex_solution'] == r'\left\{\frac{1}{2}\right\}'
+
+    # past the deadline of the batch, the remaining items fail without being solved
+    monkeypatch.setattr(importlib.import_module('..app', __package__), 'BATCH_TIMEOUT', 0.0)
+    response = await client.post('/solve/batch', json={
+        'items': [{'equation': f'x^2 - {i}'} for i in range(10)],
+    })
+    lines = [json.loads(line) for line in (await response.get_data()).splitlines()]
+    assert [line['status'] for line in lines] == [500] * 10
+    assert 'time limit of 0.0s' in lines[-1]['result']['error']
+
+async def test_batch_admission(tmp_path, monkeypatch: pytest.MonkeyPatch) -> None:
+    client = app.test_client()
+    admission = importlib.import_module('..app', __package__).admission
+    for name, value in (('path', str(tmp_path / 'admission.sqlite3')), ('_connection', None),
+                        ('rate', 0.01), ('max_wait', 0.0)):
+        monkeypatch.setattr(admission, name, value)
+
+    # charged for each distinct item, so the costs of a batch and of its items add up
+    items = [SolveSchema(equation=f'x^2 - {i}') for i in range(20)]
+    cost = request_cost(BatchSolveSchema(items=items))
+    assert cost == pytest.approx(sum(map(request_cost, items)))
+    assert request_cost(BatchSolveSchema(items=items * 3)) == cost
+    assert 2 * cost < admission.capacity < 3 * cost
+
+    payload = {'items': [asdict(item) for item in items]}
+    assert (await client.post('/solve/batch', json=payload)).status_code == 200
+    assert (await client.post('/solve/batch', json=payload)).status_code == 200
+    response = await client.post('/solve/batch', json=payload)
+    assert response.status_code == 429
+
+    # however long it waits, a batch costing more than the bucket is never admitted
+    response = await client.post('/solve/batch', json={
+        'items': [{'equation': f'x^2 - {i}'} for i in range(100)],
+    })
+    assert response.status_code == 413
+    assert 'split it up' in (await response.get_json())['error']
+
+async def test_jobs() -> None:
+    client = app.test_client()
+    response = await client.post('/jobs', json={'equation': 'x^2 - 4'})
+    assert response.status_code == 202
+    job_id = (await response.get_json())['id']
+
+    for _ in range(100):
+        job = await (await client.get(f'/jobs/{job_id}')).get_json()
+        if job['status'] in ('done', 'failed'):
+            break
+        await asyncio.sleep(0.1)
+    assert job['status'] == 'done'
+    assert job['result']['latex_solution'] == r'\left\{-2, 2\right\}'
+
+    response = await client.get('/jobs/unknown')
+    assert response.status_code == 404
+
+def test_token_bucket(tmp_path) -> None:
+    bucket = TokenBucket(str(tmp_path / 'admission.sqlite3'), capacity=10, rate=1, max_wait=2)
+
+    assert bucket.acquire('a', 8).decision == 'admit'
+    assert bucket.acquire('a', 3).decision == 'queue'
+    assert bucket.acquire('a', 10).decision == 'reject'
+    assert bucket.acquire('b', 10).decision == 'admit'
+    # never admitted, however long it waits
+    assert bucket.acquire('c', 11).decision == 'too_large'
+
+    # other worker processes share the same bucket
+    assert TokenBucket(bucket.path, capacity=10, rate=1, max_wait=2).acquire('b', 5).decision == 'reject'
+
+async def test_single_flight(tmp_path) -> None:
+    path = str(tmp_path / 'flights.sqlite3')
+    # another worker process on the node, sharing the database
+    flights, other = SingleFlight(path), SingleFlight(path)
+    codec = dict(encode=lambda result: json.dumps(result).encode(), decode=json.loads)
+    calls = 0
+
+    def counters() -> dict[str, float]:
+        lines = (line.rsplit(' ', 1) for line in metrics.render().splitlines() if line and not line.startswith('#'))
+        return {name: float(value) for name, value in lines}
+    before = counters()
+
+    async def compute() -> dict[str, int]:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.3)
+        return {'answer': 42}
+
+    async def fail() -> None:
+        await asyncio.sleep(0.3)
+        raise ValueError('failed once')
+
+    results = await asyncio.gather(
+        *(flights.run('/test', 'key', compute, **codec) for _ in range(4)),
+        other.run('/test', 'key', compute, **codec),
+    )
+    assert calls == 1
+    assert results == [{'answer': 42}] * 5
+    # every caller gets its own copy
+    assert len({id(result) for result in results}) == 5
+
+    errors = await asyncio.gather(
+        flights.run('/test', 'error', fail, **codec),
+        other.run('/test', 'error', fail, **codec),
+        return_exceptions=True,
+    )
+    assert all(isinstance(e, SolverException) and str(e) == 'failed once' for e in errors)
+
+    after = counters()
+    for name, count in (('coalescible_requests_total', 7), ('coalesced_requests_total', 5)):
+        key = f'{name}{{endpoint="/test"}}'
+        assert after[key] - before.get(key, 0) == count
+    assert 0 < after['coalescing_ratio{endpoint="/test"}'] < 1
+
+    # by default, only this user can read (or plant) the results
+    assert os.stat(os.path.dirname(SingleFlight().path)).st_mode & 0o777 == 0o700
+
+async def test_metrics() -> None:
+    client = app.test_client()
+    await client.post('/solve', json={'equation': 'x^2 = 9'})
+
+    response = await client.get('/metrics')
+    assert response.status_code == 200
+
+    body = (await response.get_data()).decode()
+    assert '# TYPE solver_stage_seconds histogram' in body
+    for stage in ('lex', 'parse', 'eval', 'solution', 'range', 'latex', 'pretty'):
+        assert f'solver_stage_seconds_count{{stage="{stage}"}}' in body
+    assert 'solver_cache_total{cache="latex",result="miss"}' in body
+    assert 'solver_request_seconds_bucket{endpoint="/solve",status="200",le="+Inf"}' in body
+    # the memory of the live worker processes
+    assert '# TYPE process_resident_memory_bytes gauge' in body
+    assert 'sympy_cache_entries ' in body
+
+def test_metrics_retired(tmp_path) -> None:
+    from ..solver.metrics import Metrics, RETIRED, is_alive, private_directory
+
+    # a worker process that has since exited
+    dead = next(pid for pid in range(2 ** 22, 0, -1) if not is_alive(pid))
+    exited = Metrics(str(tmp_path))
+    exited.inc('jobs_total', 2)
+    exited.set('queue_depth', 5)
+    (tmp_path / f'{dead}.json').write_text(json.dumps(exited.snapshot()))
+
+    # files that are not of a process are left alone
+    (tmp_path / 'notes.json').write_text('{}')
+
+    live = Metrics(str(tmp_path))
+    live.inc('jobs_total')
+    for _ in range(2):
+        body = live.render()
+        # folded in once, without the gauges of the exited process
+        assert 'jobs_total 3' in body and 'queue_depth' not in body
+    assert sorted(os.listdir(tmp_path)) == sorted(['.lock', 'notes.json', RETIRED, f'{os.getpid()}.json'])
+
+    # by default, in the private directory of the deployment
+    assert Metrics().directory == os.path.join(private_directory(), 'metrics')
+
+async def test_profiling() -> None:
+    client = app.test_client()
+    response = await client.post('/solve?debug=profile', json={'equation': 'x^2 = 9'})
+    assert 'Server-Timing' not in response.headers
+
+    app.config['SOLVER_DEBUG_TOKEN'] = 'secret'
+    try:
+        response = await client.post(
+            '/solve?debug=profile',
+            json={'equation': 'x^2 = 9'},
+            headers={'X-Debug-Token': 'secret'},
+        )
+        assert response.status_code == 200
+        timing = response.headers['Server-Timing']
+        assert 'solution;dur=' in timing and 'total;dur=' in timing
+
+        # the summary is fetched separately, with the token too
+        url = f"/debug/profiles/{response.headers['X-Profile-Id']}"
+        assert (await client.get(url)).status_code == 404
+        response = await client.get(url, headers={'X-Debug-Token': 'secret'})
+        assert response.status_code == 200
+        assert 'cumulative' in await response.get_data(as_text=True)
+    finally:
+        app.config['SOLVER_DEBUG_TOKEN'] = None
+
+async def test_loadtest(tmp_path, monkeypatch: pytest.MonkeyPatch) -> None:
+    corpus = [
+        ('/solve', {'equation': 'x^2 = 9'}),
+        ('/solve', {'equation': '2x + 1'}),
+        ('/solve', {'equation': '('}),
+    ]
+    samples, duration = await run_load(
+        app_transport(app.test_client()), corpus, requests=6, concurrency=3, rate=50,
+    )
+    summary = summarize(samples, duration, mode='in process')
+    print(f'\n{json.dumps(summary, indent=4)}')
+
+    assert summary['requests'] == 6
+    assert summary['error_rate'] == 2 / 6
+    assert summary['latency']['p50'] <= summary['latency']['p99']
+    assert summary['endpoints']['/solve']['statuses']['200'] == 4
+    assert summary['mode'] == 'in process'
+
+    # each request comes from its own address unless `single_client`, when admission control rejects the load
+    admission = importlib.import_module('..app', __package__).admission
+    for name, value in (('path', str(tmp_path / 'admission.sqlite3')), ('_connection', None),
+                        ('capacity', 2.0), ('rate', 0.01), ('max_wait', 0.0)):
+        monkeypatch.setattr(admission, name, value)
+    corpus = [('/solve', {'equation': f'x^2 = {i}'}) for i in range(4)]
+    samples, duration = await run_load(app_transport(app.test_client()), corpus, concurrency=2)
+    assert summarize(samples, duration)['statuses'] == {'200': 4}
+    samples, duration = await run_load(app_transport(app.test_client(), single_client=True), corpus, concurrency=2)
+    assert summarize(samples, duration)['rejected_rate'] > 0
+
+async def test_conditional() -> None:
+    client = app.test_client()
+    payload = {'equation': 'x^2 - 4', 'constants': {'a': 1.0}}
+
+    response = await client.post('/solve', json=payload, headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert 'domain' in json.loads(gzip.decompress(await response.get_data()))
+
+    etag = response.headers['ETag']
+    assert etag.startswith('W/')
+
+    # the same canonical request, with keys in another order
+    response = await client.post(
+        '/solve',
+        json={'constants': {'a': 1.0}, 'equation': 'x^2 - 4'},
+        headers={'If-None-Match': etag},
+    )
+    assert response.status_code == 304
+    assert await response.get_data() == b''
+
+    response = await client.post('/solve', json={'equation': 'x^2 - 9'}, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert 'Content-Encoding' not in response.headers
+
+    response = await client.post('/graph', json=payload, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+async def test_evaluate(monkeypatch: pytest.MonkeyPatch) -> None:
+    client = app.test_client()
+    response = await client.post('/evaluate', json={
+        'equation': 'sqrt(x) + 1',
+        'grid': [{'start': -1, 'stop': 1, 'step': 0.5}],
+    })
+    assert response.status_code == 200
+
+    header, *chunks = map(json.loads, (await response.get_data()).decode().splitlines())
+    print(f'\n{header}\n{chunks}')
+    assert header == {'variables': ['x'], 'shape': [5]}
+    assert chunks[0]['values'][:3] == [None, None, 1.0]
+
+    response = await client.post('/evaluate', json={
+        'equation': 'x y',
+        'grid': [{'points': [1, 2]}, {'variable': 'y', 'start': 0, 'stop': 2, 'step': 1}],
+        'format': 'float64',
+    })
+    assert response.headers['X-Grid-Shape'] == '2,3'
+    assert np.frombuffer(await response.get_data(), '<f8').tolist() == [0, 1, 2, 0, 2, 4]
+
+    response = await client.post('/evaluate', json={'equation': 'x y', 'grid': [{'points': [1]}]})
+    assert response.status_code == 400
+
+    # infinities are not valid JSON either
+    response = await client.post('/evaluate', json={'equation': '1/x', 'grid': [{'points': [0, 2]}]})
+    header, chunk = map(json.loads, (await response.get_data()).decode().splitlines())
+    assert chunk['values'] == [None, 0.5]
+
+    # unexpected errors before streaming are answered with an `Error`
+    def fail(*symbols):
+        raise TypeError('not callable')
+    monkeypatch.setattr(Solver, 'compile', fail)
+    response = await client.post('/evaluate', json={'equation': 'x', 'grid': [{'points': [1]}]})
+    assert response.status_code == 500
+    assert (await response.get_json())['error'] == 'not callable'
+
+async def test_libraries(tmp_path) -> None:
+    client = app.test_client()
+    library = {'functions': ['P(x) = x^2', 'Q(x, y) = x - 2y'], 'constants': {'c': 60.0}}
+
+    response = await client.post('/libraries', json=library)
+    assert response.status_code == 201
+    registered = await response.get_json()
+    assert registered['functions'] == ['P', 'Q'] and registered['constants'] == ['c']
+
+    # registering is idempotent
+    response = await client.post('/libraries', json=library)
+    assert (await response.get_json())['id'] == registered['id']
+    response = await client.get(f"/libraries/{registered['id']}")
+    assert response.status_code == 200
+
+    payload = {'equation': '2P(x) + 14x - 2c', 'functions': ['P(x) = x^2'], 'constants': {'c': 60.0}}
+    response = await client.post('/solve', json=payload)
+    expected = await response.get_json()
+    response = await client.post('/solve', json={'equation': payload['equation'], 'library': registered['id']})
+    assert response.status_code == 200
+    assert (await response.get_json())['latex_solution'] == expected['latex_solution']
+
+    # past double precision, the decimals of the library are exact too
+    response = await client.post('/libraries', json={'functions': ['F(x) = x + 0.1'], 'constants': {'d': 0.1}})
+    exact = (await response.get_json())['id']
+    response = await client.post('/solve', json={'equation': 'F(d)', 'library': exact, 'precision': 30})
+    assert (await response.get_json())['evaluated'] == '0.2'
+
+    response = await client.post('/libraries', json={'functions': ['x^2']})
+    assert response.status_code == 400
+    response = await client.get('/libraries/unknown')
+    assert response.status_code == 404
+    response = await client.post('/solve', json={'equation': 'P(x)', 'library': 'unknown'})
+    assert response.status_code == 404
+    assert 'unknown' in (await response.get_json())['error']
+    response = await client.post('/solve/batch', json={'items': [{'equation': 'x'}, {'equation': 'x', 'library': 'unknown'}]})
+    assert response.status_code == 404
+
+    # past `max_libraries`, the least recently used are dropped
+    path = str(tmp_path / 'libraries.sqlite3')
+    registry = LibraryRegistry(path, max_libraries=2, touch_interval=0)
+    first = registry.register(['A(x) = x'])
+    second = registry.register(['B(x) = x'])
+    registry.get(first.id)
+    registry.register(['C(x) = x'])
+    registry = LibraryRegistry(path)
+    assert registry.get(first.id).functions.keys() == {'A'}
+    with pytest.raises(UnknownLibrary):
+        registry.get(second.id)
+
+def test_memory_guard() -> None:
+    from ..solver import Solver
+
+    Solver('sin(x)^2 + cos(x)^2 = x/2').simplify()
+    assert (before := cache_stats().entries) > 0
+
+    # trimming keeps the smaller caches
+    dropped = release_cache('trim')
+    assert before / 2 <= dropped < before
+    release_cache('clear')
+    assert cache_stats().entries == 0
+
+    # over the threshold, the cache is released at most once per interval
+    Solver('x^2 - 4').simplify()
+    guard = MemoryGuard(1, policy='clear', interval=3600)
+    guard.check()
+    assert cache_stats().entries == 0
+    Solver('x^2 - 9').simplify()
+    guard.check()
+    assert cache_stats().entries > 0
@@ -1,10 +1,32 @@
+import weakref
+import gc
+
+from benchmarks.importtime import LAZY_MODULES, TARGETS, import_time
+from benchmarks.stages import STAGES, time_case, compare
+import pytest
+from sympy import ConditionSet, Symbol, true
+
 from solver import Solver
+from solver.cost import estimate_cost
+from solver.simplification import simplify_tiered
+from solver.evaluation import machine_float
+from solver.exceptions import TermCountOverflow
 
 __all__ = (
     'test_parsing',
     'test_functions',
     'test_domain',
     'test_properties',
+    'test_analysis',
+    'test_numeric_solution',
+    'test_rendering',
+    'test_cost',
+    'test_lazy_imports',
+    'test_stage_benchmarks',
+    'test_summation',
+    'test_implicit_graph',
+    'test_simplification',
+    'test_precision',
 )
 
 def test_parsing() -> None:
@@ -52,8 +74,177 @@ def test_properties() -> None:
     print('domain:', solver.domain)
     print('range:', solver.range)
 
+def test_analysis() -> None:
+    solver = Solver('x/(x^2 - 1)')
+    analysis = solver.analysis
+
+    assert solver.domain is analysis.continuous_domain
+    assert solver.range == analysis.function_range()
+    assert solver.max_min == {}
+    assert -1 not in analysis.continuous_domain and 1 not in analysis.continuous_domain
+
+def test_numeric_solution() -> None:
+    solver = Solver('x = cos(x)', numeric_budget=5)
+    (root,) = solver.solution
+    assert solver.approximate
+    assert solver.note == 'The real roots found numerically within [-20, 20] only'
+    assert abs(root - 0.739085133215161) < 1e-12
+
+    # the whole of a bounded domain is searched, and roots where the function only touches zero are found
+    solver = Solver('sin(x) = 1/2', domain='[0, 100]')
+    assert len(solver.numeric_solution()) == 32
+    assert solver.numeric_searched == (0.0, 100.0)
+    for equation in ('x^2 = 0', 'x^3 = 0'):
+        (root,) = Solver(equation).numeric_solution()
+        assert float(root) == 0
+    (root,) = Solver('sin(x) = 1', domain='[0, 3]').numeric_solution()
+    assert abs(root - 1.5707963267949) < 1e-9
+    assert not Solver('x^2 + 1 = 0').numeric_solution()
+
+    solver = Solver('x^2 = 4', numeric_budget=5)
+    assert solver.solution == {-2, 2}
+    assert not solver.approximate
+
+    # no roots in the sampled range are not an (approximate) empty solution
+    solver = Solver('x = cos(x) + 100', numeric_budget=5)
+    assert isinstance(solver.solution, ConditionSet)
+    assert not solver.approximate
+
+    # nothing to approximate numerically
+    solver = Solver('x + y = 1', solve_for='x', numeric_budget=0)
+    assert solver.solution == {1 - Symbol('y')}
+    assert not solver.approximate
+
+    for budget in (-1, float('nan'), 1e9):
+        with pytest.raises(ValueError):
+            Solver('x = 1', numeric_budget=budget)
+
+def test_rendering() -> None:
+    solver = Solver('x^2 = 2')
+    assert solver.parsed_solution() == '{-√2, √2}\n'
+    assert solver.ascii_parsed_solution().startswith('    ___')
+
+    assert solver.latex('solution') is solver.latex('solution')
+    assert solver.latex('simplify') == Solver.to_latex(solver.simplify())
+
+def test_cost() -> None:
+    cheap = estimate_cost('1 + 1')
+    expensive = estimate_cost('sum_(k=1)^(1000) k!^x')
+
+    assert cheap.weight < 2
+    assert expensive.summations == 1
+    assert expensive.summation_terms == 1000
+    assert expensive.variables - expensive.bound_variables == {'x'}
+    assert expensive.weight > 3 * cheap.weight
+
+def test_lazy_imports() -> None:
+    result = import_time('solver', TARGETS['solver'])
+    assert not [m for m in LAZY_MODULES if m in result.modules]
+
+def test_stage_benchmarks() -> None:
+    timings = time_case({'equation': 'x^2 - 4'}, skip=('graph',))
+    print()
+    for stage, seconds in timings.items():
+        print(f'{stage:<20} {seconds * 1000:.1f}ms')
+    assert list(timings) == [s for s in STAGES if s != 'graph']
+
+    baseline = {'polynomials': {'solution': 0.1, 'range': 0.1}}
+    results = {'polynomials': {'solution': 0.2, 'range': 0.105}}
+    assert compare(results, baseline, threshold=0.5, min_delta=0.01) == [
+        ('polynomials', 'solution', 0.2, 0.1),
+    ]
+
+def test_summation() -> None:
+    cases = {
+        # closed form
+        'sum_(k=1)^(10^9) k': 500000000500000000,
+        'sum_(k=1)^(10000)(1/k^2)': 1.6448340718480598,
+        # batch of terms
+        'sum_(k=1)^(3000)(sin(k)/k)': 1.0711304942769167,
+        'prod_(k=1)^(2000)(1 + 1/k^2)': 3.6742407901329663,
+    }
+    print()
+    for equation, expected in cases.items():
+        value = Solver(equation).evaluated_equation
+        print(f'{equation:<30} | {value}')
+        assert abs(float(value) - expected) <= 1e-12 * abs(expected)
+
+    # without a closed form, every term counts towards the limit
+    with pytest.raises(TermCountOverflow):
+        Solver('sum_(k=1)^(10^7)(sin(k)/k)').parsed_equation
+
+    # graphing a sum of `x` evaluates the terms for every `x` at once
+    assert Solver('sum_(k=1)^(200)(x^k/k!)').graph().getbuffer().nbytes > 0
+
+def test_implicit_graph() -> None:
+    for equation in ('x^2 + y^2 = 25', 'xy > 1', 'y <= sin(x)'):
+        assert Solver(equation).graph().getbuffer().nbytes > 0
+
+    # the resolution adapts to the budget, within the bounds
+    solver = Solver('x^2 + y^2 = 25')
+    x, _, (z,) = solver._sample_implicit([solver.lhs_equation], solver.free_variables(), (-20, 20)) # type: ignore
+    low, high = Solver.GRAPH_GRID_RESOLUTION
+    assert low <= x.shape[0] <= high and z.shape == x.shape
+
+def test_simplification() -> None:
+    assert Solver('2x + 1 + 3x + 2').simplified.tier == 'full'
+
+    # targeted passes still cancel and combine
+    large = ' + '.join(f'sin({i}x)^2 + cos({i}x)^2' for i in range(1, 8)) + ' + (x^2 - 1)/(x - 1)'
+    solver = Solver(large)
+    assert solver.simplified.tier == 'targeted'
+    assert solver.lhs_equation.equals(solver.simplified.expr.lhs - solver.simplified.expr.rhs) # type: ignore
+
+    huge = Solver(' + '.join(f'sin({i}x)^2 cos(x)/(x + {i})' for i in range(1, 30))).parsed_equation
+    assert simplify_tiered(huge).tier == 'normalized'
+    # nothing is started after the budget
+    assert simplify_tiered(huge, budget=0).expr == huge
+
+    # the variants are derived from `simplified`, without caching (and keeping alive) the solver
+    solver = Solver('2x + 1 = 2x + 1')
+    assert solver.simplify(evaluate_bool=True) is true
+    assert solver.simplify().to_latex() == '2 x + 1=2 x + 1' # type: ignore
+    solver = weakref.ref(solver)
+    gc.collect()
+    assert solver() is None
+
+def test_precision() -> None:
+    # double precision is evaluated in float64
+    assert machine_float(Solver('sqrt(2) + pi^2/e').lhs_equation) == pytest.approx(5.045038114029063)
+    assert str(Solver('sqrt(2) + pi^2/e').evaluated_equation) == '5.04503811402906'
+    assert str(Solver('x^2 + pi x').evaluated_equation) == 'x**2 + 3.14159265358979*x'
+    assert str(Solver('sqrt(2) + pi', precision=5).evaluated_equation) == '4.5558'
+    # leaving the real numbers falls back to arbitrary precision
+    assert machine_float(Solver('sqrt(-1) + 2').lhs_equation) is None
+    assert str(Solver('sqrt(-1) + 2').evaluated_equation) == '2.0 + 1.0*I'
+    # as does cancelling out the digits of float64
+    for equation, expected in (
+        ('sqrt(10^20 + 1) - 10^10', 5e-11),
+        ('cos(1/10^9) - 1', -5e-19),
+        ('log(8)/log(2) - 3', 0.0),
+    ):
+        solver = Solver(equation)
+        assert machine_float(solver.lhs_equation) is None
+        assert float(solver.evaluated_equation) == pytest.approx(expected, rel=1e-12, abs=1e-100)
+
+    # past double precision, decimals are exact and every digit is correct
+    value = Solver('0.1 + 1/3 + c', constants={'c': 0.7}, precision=40).evaluated_equation
+    assert str(value) == '1.133333333333333333333333333333333333333'
+    with pytest.raises(ValueError):
+        Solver('x', precision=Solver.MAX_PRECISION + 1)
+
 if __name__ == '__main__':
     test_parsing()
     test_functions()
+    test_domain()
     test_properties()
-    test_domain()
\ No newline at end of file
+    test_analysis()
+    test_numeric_solution()
+    test_rendering()
+    test_cost()
+    test_lazy_imports()
+    test_stage_benchmarks()
+    test_summation()
+    test_implicit_graph()
+    test_simplification()
+    test_precision()
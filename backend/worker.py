@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Callable, Optional
+import threading
+import asyncio
+import signal
+import os
+
+from .app import JOB_HANDLERS
+from .broker import BrokerJobQueue
+from .jobs import run_worker
+from .memory import MemoryGuard, process_rss
+from .models import SolveSchema
+
+if TYPE_CHECKING:
+    from multiprocessing.connection import Connection
+
+__all__ = (
+    'Recycler',
+    'warm_up',
+    'listen_for_drain',
+    'main',
+    'run_process',
+    'limits_from_env',
+)
+
+class Recycler:
+    """Asks for this worker process to be recycled once it has run `max_jobs` jobs,
+    or its RSS has passed `max_rss` bytes, as long-lived SymPy and matplotlib processes
+    fragment (and leak) memory over time"""
+
+    def __init__(
+        self, /,
+        retire: Callable[[str], None],
+        *,
+        max_jobs: Optional[int] = None,
+        max_rss: Optional[int] = None,
+        unit: str = 'jobs',
+    ) -> None:
+        self.retire = retire
+        self.max_jobs = max_jobs
+        self.unit = unit
+        self.max_rss = max_rss
+        self.jobs = 0
+        self.retiring = False
+
+    def after_job(self, /) -> None:
+        self.jobs += 1
+        if self.retiring:
+            return
+        if self.max_jobs is not None and self.jobs >= self.max_jobs:
+            reason = f'{self.jobs} {self.unit}'
+        elif self.max_rss is not None and (rss := process_rss()) >= self.max_rss:
+            reason = f'{rss / 2 ** 20:.0f}MiB RSS'
+        else:
+            return
+        self.retiring = True
+        self.retire(reason)
+
+def warm_up() -> None:
+    """Runs a solve and a graph, so that the imports and caches are loaded before taking jobs"""
+    for kind, equation in (('solve', 'x^2 - 4'), ('graph', 'x')):
+        for _ in JOB_HANDLERS[kind](SolveSchema(equation=equation)):
+            pass
+
+def listen_for_drain(control: Connection, loop: asyncio.AbstractEventLoop, stop: asyncio.Event, /) -> None:
+    """Sets `stop` when the supervisor says to drain, or is gone"""
+    while True:
+        try:
+            message = control.recv()
+        except (EOFError, OSError):
+            message = 'drain'
+        if message == 'drain':
+            loop.call_soon_threadsafe(stop.set)
+            return
+
+async def main(
+    broker: str,
+    concurrency: int,
+    *,
+    max_jobs: Optional[int] = None,
+    max_rss: Optional[int] = None,
+    control: Optional[Connection] = None,
+    prepare: Callable[[], None] = warm_up,
+) -> None:
+    """Pulls jobs from the broker at `broker` and runs them, `concurrency` at a time
+
+    * on SIGTERM (or `drain` from the supervisor), stops fetching jobs and exits once the running ones finish
+    * past its limits, a supervised worker asks the supervisor to replace it, and keeps working until
+      drained; a standalone worker drains right away, to be restarted by its process manager
+    """
+    queue = BrokerJobQueue.from_url(broker)
+    guard = MemoryGuard.from_env()
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    try:
+        loop.add_signal_handler(signal.SIGTERM, stop.set)
+    except NotImplementedError:
+        pass
+
+    def retire(reason: str) -> None:
+        if control is not None:
+            control.send(('retire', reason))
+        else:
+            stop.set()
+    recycler = Recycler(retire, max_jobs=max_jobs, max_rss=max_rss)
+
+    def after_job() -> None:
+        guard.check()
+        recycler.after_job()
+
+    if control is not None:
+        await asyncio.to_thread(prepare)
+        threading.Thread(target=listen_for_drain, args=(control, loop, stop), daemon=True).start()
+        control.send(('ready',))
+    await asyncio.gather(*(
+        run_worker(queue, JOB_HANDLERS, after_job=after_job, stop=stop) for _ in range(concurrency)
+    ))
+
+def run_process(
+    broker: str,
+    concurrency: int,
+    max_jobs: Optional[int],
+    max_rss: Optional[int],
+    control: Connection,
+    prepare: Callable[[], None] = warm_up, /,
+) -> None:
+    """The entry point of a worker process started by `supervisor.WorkerPool`"""
+    # the supervisor handles interrupts, and drains its workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(main(broker, concurrency, max_jobs=max_jobs, max_rss=max_rss, control=control, prepare=prepare))
+
+def limits_from_env() -> tuple[Optional[int], Optional[int]]:
+    """`SOLVER_WORKER_MAX_JOBS` and `SOLVER_WORKER_MAX_RSS` (in MiB)"""
+    max_jobs = os.getenv('SOLVER_WORKER_MAX_JOBS')
+    max_rss = os.getenv('SOLVER_WORKER_MAX_RSS')
+    return (
+        int(max_jobs) if max_jobs else None,
+        int(float(max_rss) * 2 ** 20) if max_rss else None,
+    )
+
+if __name__ == '__main__':
+    import argparse
+
+    max_jobs, max_rss = limits_from_env()
+    parser = argparse.ArgumentParser(description='Runs a stateless solver worker')
+    parser.add_argument('broker', nargs='?', default=os.getenv('SOLVER_BROKER_URL', '127.0.0.1:5100'))
+    parser.add_argument('--concurrency', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--max-jobs', type=int, default=max_jobs, help='exit after this many jobs')
+    parser.add_argument('--max-rss', type=float, help='exit past this RSS, in MiB')
+    args = parser.parse_args()
+    asyncio.run(main(
+        args.broker,
+        args.concurrency,
+        max_jobs=args.max_jobs,
+        max_rss=int(args.max_rss * 2 ** 20) if args.max_rss is not None else max_rss,
+    ))